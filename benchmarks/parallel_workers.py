@@ -0,0 +1,138 @@
+"""
+Times build_coverage_cube() (which the notebooks use, with N_WORKERS worker processes),
+cumulative_sums() and cumulative_sums_byValue() on the adult extract with different
+numbers of worker processes, and checks that the results are the same as when the work
+is done in a single process. All three count through count_coverage_by_dose(), which
+shares the features (not the groups) among the workers.
+
+Run from this folder, after generating (dummy) data in output/:
+    python parallel_workers.py [worker counts, e.g. 1 2 4 8]
+"""
+
+# Import statements
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append("../lib/")
+from coverage_cube import build_coverage_cube
+from data_processing import load_adult_data
+from dates import NO_DATE
+from report_results import cumulative_sums, cumulative_sums_byValue
+
+
+population_subgroups = {
+    "80+": 1,
+    "70-79": 2,
+    "care home": 3,
+    "shielding (aged 16-69)": 4,
+    "65-69": 5,
+    "LD (aged 16-64)": 6,
+    "60-64": 7,
+    "55-59": 8,
+    "50-54": 9,
+    "40-49": 10,
+    "30-39": 11,
+    "18-29": 12,
+    "16-17": 0,
+}
+
+DEFAULT = [
+    "sex",
+    "ageband_5yr",
+    "ethnicity_6_groups",
+    "ethnicity_16_groups",
+    "imd_categories",
+    "bmi",
+    "housebound",
+    "chronic_cardiac_disease",
+    "current_copd",
+    "dmards",
+    "dementia",
+    "psychosis_schiz_bipolar",
+    "LD",
+    "ssri",
+    "chemo_or_radio",
+    "lung_cancer",
+    "cancer_excl_lung_and_haem",
+    "haematological_cancer",
+    "ckd",
+    "imid",
+]
+features_dict = {"DEFAULT": DEFAULT}
+features_dict_brand = {"DEFAULT": ["brand_of_first_dose", "sex", "ethnicity_6_groups"]}
+
+
+def same_results(df_dict, other):
+    """True if two sets of cumulative sums (or two cubes) are identical"""
+    if isinstance(df_dict, pd.DataFrame):
+        return df_dict.equals(other)
+    for group_title, features in df_dict.items():
+        if list(features) != list(other[group_title]):
+            return False
+        for feature, df in features.items():
+            try:
+                pd.testing.assert_frame_equal(df, other[group_title][feature])
+            except AssertionError:
+                return False
+    return True
+
+
+def timed(function, n_workers):
+    """Calls function(n_workers), returning its result and how long it took in seconds"""
+    start = time.perf_counter()
+    result = function(n_workers)
+    return result, time.perf_counter() - start
+
+
+def main(worker_counts):
+    df = load_adult_data(use_cache=False)
+    latest_date = df["covid_vacc_date"].max()
+    df["time_to_second_dose"] = (
+        df["covid_vacc_second_dose_date"] - df["covid_vacc_date"]
+    ).where(df["covid_vacc_second_dose_date"] != NO_DATE)
+    print(f"{len(df)} patients, {os.cpu_count()} cpus")
+
+    benchmarks = {
+        "build_coverage_cube": lambda n: build_coverage_cube(
+            df,
+            population_subgroups,
+            features_dict,
+            doses=[
+                "covid_vacc_date",
+                "covid_vacc_second_dose_date",
+                "covid_vacc_third_dose_date",
+            ],
+            extra_features=["priority_status"],
+            n_workers=n,
+        ),
+        "cumulative_sums": lambda n: cumulative_sums(
+            df, population_subgroups, features_dict, latest_date, n_workers=n
+        ),
+        "cumulative_sums_byValue": lambda n: cumulative_sums_byValue(
+            df, population_subgroups, features_dict_brand, latest_date, n_workers=n
+        ),
+    }
+
+    rows = []
+    for name, function in benchmarks.items():
+        serial, serial_seconds = timed(function, 1)
+        for n_workers in worker_counts:
+            result, seconds = timed(function, n_workers)
+            rows.append(
+                {
+                    "function": name,
+                    "workers": n_workers,
+                    "seconds": round(seconds, 2),
+                    "speed-up": round(serial_seconds / seconds, 2),
+                    "same as serial": same_results(result, serial),
+                }
+            )
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1, 2, 4, 8])
@@ -0,0 +1,143 @@
+"""
+Measures how much the peak memory (RSS) of the process grows while summarising a large
+synthetic cohort, made by repeating the (dummy) adult extract. Each measurement runs in a
+fresh worker process, so that one does not affect the next. Linux only.
+
+The "copy then filter" rows repeat how the summary functions used to filter the data (copying
+the whole dataframe before picking out the rows for each brand or group), for comparison.
+
+Run from this folder, after generating (dummy) data in output/:
+    python peak_memory.py [times to repeat the extract, e.g. 50]
+"""
+
+# Import statements
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("../lib/")
+from data_processing import load_adult_data
+from data_quality import ethnicity_completeness
+from report_results import assign_groups, cumulative_sums, masked_sum
+
+population_subgroups = {
+    "80+": 1,
+    "70-79": 2,
+    "care home": 3,
+    "shielding (aged 16-69)": 4,
+    "65-69": 5,
+    "LD (aged 16-64)": 6,
+    "60-64": 7,
+    "55-59": 8,
+    "50-54": 9,
+    "40-49": 10,
+    "30-39": 11,
+    "18-29": 12,
+    "16-17": 0,
+}
+features_dict = {
+    "DEFAULT": ["sex", "ageband_5yr", "ethnicity_6_groups", "imd_categories"]
+}
+BRANDS = [("oxford", "ox"), ("pfizer", "pfz"), ("moderna", "mod")]
+
+
+def brands_copy_then_filter(df):
+    """First doses of each brand, copying the data before filtering it"""
+    return [
+        df.copy()
+        .loc[df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"]][
+            f"covid_vacc_flag_{y}"
+        ]
+        .sum()
+        for x, y in BRANDS
+    ]
+
+
+def brands_masked(df):
+    """First doses of each brand, as counted by create_summary_stats()"""
+    return [
+        masked_sum(
+            df,
+            f"covid_vacc_flag_{y}",
+            df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"],
+        )
+        for x, y in BRANDS
+    ]
+
+
+def ethnicity_copy_then_filter(df):
+    """Patients with a known ethnicity in each group, copying the data for each group"""
+    cols = ["group", "group_name", "ethnicity_6_groups", "patient_id"]
+    for groupname in population_subgroups:
+        out = df[cols].copy()
+        out = out.loc[(out["group_name"] == groupname)]
+        out.groupby("ethnicity_6_groups")[["patient_id"]].nunique()
+
+
+def ethnicity_grouped(df):
+    """Patients with a known ethnicity in each group, as counted by ethnicity_completeness()"""
+    ethnicity_completeness(
+        df, population_subgroups, savepath={"text": tempfile.gettempdir()}
+    )
+
+
+def cumulative_sums_all_groups(df):
+    """Cumulative sums for all the groups, as calculated in the notebooks"""
+    cumulative_sums(
+        df, population_subgroups, features_dict, df["covid_vacc_date"].max()
+    )
+
+
+BENCHMARKS = {
+    "first doses by brand (copy then filter)": brands_copy_then_filter,
+    "first doses by brand (masks)": brands_masked,
+    "ethnicity completeness (copy then filter)": ethnicity_copy_then_filter,
+    "ethnicity completeness (grouped)": ethnicity_grouped,
+    "cumulative sums": cumulative_sums_all_groups,
+}
+
+
+def current_rss():
+    """Current resident memory of this process, in bytes"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_growth(name):
+    """Runs a benchmark, returning how far the peak RSS rose above the RSS at the start (MB)"""
+    start = current_rss()
+    BENCHMARKS[name](cohort)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return max(peak - start, 0) / 1e6
+
+
+def main(repeats):
+    global cohort
+    df = load_adult_data(use_cache=False)
+    cohort = pd.concat([df] * repeats, ignore_index=True)
+    cohort["patient_id"] = np.arange(len(cohort))
+    assign_groups(cohort, population_subgroups)
+    del df
+
+    print(
+        f"{len(cohort)} patients, {cohort.memory_usage(deep=True).sum() / 1e6:.0f} MB of data"
+    )
+
+    # each benchmark runs in a new process forked from this one, which shares the cohort
+    context = multiprocessing.get_context("fork")
+    rows = []
+    for name in BENCHMARKS:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            growth = pool.apply(peak_growth, (name,))
+        rows.append({"step": name, "peak RSS growth (MB)": round(growth)})
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,174 @@
+""" This module caches the cleaned patient-level data, so that it only needs to be read in and cleaned once for each extract. The cache is written to output/cleaned_data_cache, which project.yaml declares as a (highly sensitive) output of the notebook actions, so it is kept with their other outputs and reused by later runs wherever that folder is kept between runs (e.g. when running locally)"""
+
+# Import statements
+import glob
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Folder in which cleaned data are cached
+CACHE_PATH = os.path.join("..", "output", "cleaned_data_cache")
+
+# Once the cache is larger than this (in bytes), the least recently used files are removed
+MAX_CACHE_SIZE = 4 * 1024**3
+
+# Files which determine the contents of the cleaned data. If any of these change,
+# previously cached data will no longer be used.
+CODE_FILES = [
+    os.path.join("..", "lib", "data_processing.py"),
+    os.path.join("..", "lib", "schema.py"),
+    os.path.join("..", "lib", "cache.py"),
+    os.path.join("..", "lib", "dates.py"),
+    os.path.join("..", "lib", "errors.py"),
+    os.path.join("..", "lib", "stp_dict_total.csv"),
+    os.path.join("..", "analysis", "ethnicity_16_lookup.csv"),
+    os.path.join("..", "analysis", "study_definition_*.py"),
+]
+
+
+def _hash_file(path, hasher, block_size=1024**2):
+    """Adds the contents of the file at `path' to `hasher', reading it in blocks"""
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+
+
+def cache_key(input_file, loader, features=None, code_files=CODE_FILES):
+    """
+    Works out the name of the cache file for a cleaned extract. This is a hash of
+    the extract itself and of the code used to clean it, so that cached data
+    are never used if either has changed.
+
+    Args:
+        input_file (str): path to the csv extract
+        loader (str): name of the function which cleans the data e.g. "load_adult_data"
+        features (list): features requested from the loader (None for all features)
+        code_files (list): paths (or glob patterns) of the files which determine how the data are cleaned
+
+    Returns:
+        key (str): e.g. "input_delivery-0123456789abcdef"
+    """
+    hasher = hashlib.sha256()
+    hasher.update(loader.encode())
+    hasher.update(json.dumps(sorted(features) if features else None).encode())
+
+    for pattern in code_files:
+        for path in sorted(glob.glob(pattern)):
+            hasher.update(os.path.basename(path).encode())
+            _hash_file(path, hasher)
+
+    _hash_file(input_file, hasher)
+
+    input_name = os.path.basename(input_file).split(".")[0]
+    return f"{input_name}-{hasher.hexdigest()[:16]}"
+
+
+def _cache_file(key, cache_path):
+    return os.path.join(cache_path, f"{key}.parquet")
+
+
+def read_cached_data(key, cache_path=CACHE_PATH):
+    """
+    Reads cleaned data from the cache. The file is memory-mapped rather than read into
+    memory first, but as parquet has to be decoded, the columns are still copied into
+    the data frame.
+
+    Args:
+        key (str): as returned by cache_key()
+        cache_path (str): folder containing the cache
+
+    Returns:
+        Dataframe (df): the cleaned data, or None if they have not been cached
+    """
+    path = _cache_file(key, cache_path)
+    if not os.path.exists(path):
+        return None
+
+    df = pq.read_table(path, memory_map=True).to_pandas()
+
+    # record that this file has been used, so that it is not the next to be removed
+    os.utime(path)
+
+    return df
+
+
+def write_cached_data(df, key, cache_path=CACHE_PATH, max_size=MAX_CACHE_SIZE):
+    """
+    Writes cleaned data to the cache and then removes old files if the
+    cache has become too large.
+
+    Args:
+        df (Dataframe): cleaned data, as returned by load_*_data()
+        key (str): as returned by cache_key()
+        cache_path (str): folder containing the cache
+        max_size (int): maximum size of the cache in bytes
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    os.makedirs(cache_path, exist_ok=True)
+    path = _cache_file(key, cache_path)
+    # write to a temporary file first so an interrupted run cannot leave a partial file
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+    evict_cached_data(cache_path=cache_path, max_size=max_size, keep=[key])
+
+
+def evict_cached_data(cache_path=CACHE_PATH, max_size=MAX_CACHE_SIZE, keep=None):
+    """
+    Removes the least recently used files from the cache until it is no larger than `max_size'.
+
+    Args:
+        cache_path (str): folder containing the cache
+        max_size (int): maximum size of the cache in bytes
+        keep (list): keys of files which must not be removed
+
+    Returns:
+        removed (list): keys of the files which were removed
+    """
+    if keep is None:
+        keep = []
+
+    files = glob.glob(_cache_file("*", cache_path))
+    files = sorted(files, key=os.path.getmtime, reverse=True)
+    keep_files = [_cache_file(k, cache_path) for k in keep]
+
+    removed = []
+    total_size = 0
+    for path in files:
+        total_size += os.path.getsize(path)
+        if total_size > max_size and path not in keep_files:
+            total_size -= os.path.getsize(path)
+            os.remove(path)
+            removed.append(os.path.basename(path)[: -len(".parquet")])
+
+    return removed
+
+
+def clear_cached_data(input_file=None, cache_path=CACHE_PATH):
+    """
+    Removes cached data, either for a single extract or for all extracts.
+
+    Args:
+        input_file (str): name of (or path to) an extract, e.g. "input_delivery.csv.gz".
+                          If None, the whole cache is cleared.
+        cache_path (str): folder containing the cache
+
+    Returns:
+        removed (list): keys of the files which were removed
+    """
+    if input_file is None:
+        pattern = "*"
+    else:
+        pattern = f"{os.path.basename(input_file).split('.')[0]}-*"
+
+    removed = []
+    for path in glob.glob(_cache_file(pattern, cache_path)):
+        os.remove(path)
+        removed.append(os.path.basename(path)[: -len(".parquet")])
+
+    return removed
@@ -0,0 +1,689 @@
+""" This module builds the `coverage cube': the number of patients in each population group, by each level of each demographic/clinical feature, who received each dose on each date. The cube is saved as a parquet file, so that the cumulative sums behind the reports can be produced from it without reprocessing the patient-level data"""
+
+# Import statements
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dates import NO_DATE, campaign_date, campaign_day
+from disclosure_control import (
+    ROUNDING_BASE,
+    SUPPRESSION_THRESHOLD,
+    low_counts,
+    suppress_and_round,
+)
+from report_results import (
+    count_cells_by_dates,
+    count_coverage_by_dose,
+    cumulative_sums_from_partials,
+    group_coverage,
+    group_columns,
+    group_features,
+    label_flags,
+    level_codes,
+)
+
+
+# Columns of the cube. "date" is NO_DATE for patients who have not received the dose,
+# so that the total number of patients over all dates is the denominator.
+CUBE_COLUMNS = [
+    "dose",
+    "group",
+    "feature",
+    "level",
+    "level_order",
+    "known_sex",
+    "date",
+    "patients",
+]
+
+# Name of the `feature' giving the figures for the whole of each group
+OVERALL = "overall"
+
+# When a cube is refreshed from a new extract, the last few days already in the cube are
+# counted again, as vaccinations are sometimes recorded some days after they were given
+REFRESH_OVERLAP_DAYS = 14
+
+# Number of dates (spread over the history kept from the old cube) on which the cumulative
+# numbers vaccinated in each group, by each feature, are checked against the new extract
+SPOT_CHECK_DATES = 5
+
+
+def build_coverage_cube(
+    df,
+    groups_of_interest,
+    features_dict,
+    doses=["covid_vacc_date"],
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    extra_features=None,
+    n_workers=1,
+    groups=None,
+):
+    """
+    Counts the patients in each population group, by each level of each of the
+    demographic/clinical features of interest for that group, who received each
+    dose on each date.
+
+    Patients of known and unknown sex are counted separately, so that the cube gives the
+    same figures as cumulative_sums() (which leaves patients of unknown sex out of the
+    figures by sex, and by every feature after it) whatever features are asked for.
+
+    Args:
+        df (dataframe): input data
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        doses (list): columns of dates of each dose e.g. ["covid_vacc_date", "covid_vacc_second_dose_date"]
+        extra_features (list): features to count for every group as well, e.g. "priority_status" for the
+                               charts of numbers vaccinated (see cube_vaccination_counts())
+        n_workers (int): number of worker processes among which to share the features (see count_coverage_by_dose())
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        cube (Dataframe): one row for each dose, group, feature, level, known/unknown sex and date
+                          on which there were any patients (see CUBE_COLUMNS)
+    """
+    if groups is None:
+        groups = group_columns(df, groups_of_interest, all_keys=all_keys)
+    group = groups["group"]
+
+    group_labels = pd.Index(list(dict.fromkeys(groups_of_interest.values())))
+    group_codes = group_labels.get_indexer(group)
+    features = _cube_features(groups_of_interest, features_dict, extra_features)
+
+    # features are partitioned by group only once for all the doses
+    coverage_by_dose = count_coverage_by_dose(
+        df,
+        group_codes,
+        len(group_labels),
+        features,
+        reference_column_names=doses,
+        n_workers=n_workers,
+    )
+
+    parts = []
+    for dose in doses:
+        coverage = coverage_by_dose[dose]
+        # the last date counts the patients with no date
+        dates = np.append(coverage["dates"].to_numpy(), NO_DATE)
+        labels = {
+            feature: label_flags(levels).astype(str)
+            for feature, (levels, counts) in coverage["features"].items()
+        }
+
+        for group_title, group_label in groups_of_interest.items():
+            g = group_labels.get_loc(group_label)
+
+            counts = coverage["overall"][g][:, np.newaxis, :]
+            parts.append(
+                _cube_rows(counts, dose, group_title, OVERALL, [OVERALL], dates)
+            )
+            for feature, (levels, counts) in coverage["features"].items():
+                parts.append(
+                    _cube_rows(
+                        counts[g],
+                        dose,
+                        group_title,
+                        feature,
+                        labels[feature],
+                        dates,
+                    )
+                )
+
+    cube = pd.DataFrame(
+        {c: np.concatenate([p[c] for p in parts]) for c in CUBE_COLUMNS}
+    )
+    for c in ["dose", "group", "feature", "level"]:
+        cube[c] = cube[c].astype("category")
+
+    return cube
+
+
+def refresh_coverage_cube(
+    cube,
+    df,
+    groups_of_interest,
+    features_dict,
+    doses=["covid_vacc_date"],
+    refresh_from=None,
+    verify=True,
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    extra_features=None,
+    n_workers=1,
+    groups=None,
+):
+    """
+    Brings a saved cube up to date with a new extract. Counts for dates before `refresh_from'
+    are kept from the saved cube, and only patients vaccinated on or after that date (or not
+    vaccinated at all) are counted from the new extract; as the cube holds daily counts, the
+    cumulative sums then carry on from the kept history.
+
+    If `verify' is True, the cumulative numbers vaccinated in each group, and at each level
+    of each feature in each group, on a few of the kept dates are checked against the new extract. Any differences are returned, and the
+    cube is then rebuilt from scratch rather than merging history which has changed. The
+    cube is also rebuilt if it does not include all the groups, features and doses asked for.
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube() or read_coverage_cube()
+        df (dataframe): input data (the new extract)
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        doses (list): columns of dates of each dose e.g. ["covid_vacc_date", "covid_vacc_second_dose_date"]
+        refresh_from (int or str): first date to count again, as a campaign day or "YYYY-MM-DD". By default
+                                   this is REFRESH_OVERLAP_DAYS before the latest date of each dose in the cube.
+        verify (bool): whether to check the kept history against the new extract
+        extra_features (list): features to count for every group as well (see build_coverage_cube())
+        n_workers (int): number of worker processes among which to share the features (see count_coverage_by_dose())
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        cube (Dataframe): the refreshed cube
+        drift (Dataframe): the dose, group, feature, level and date of each check which failed, with the
+                           cumulative numbers vaccinated according to the saved cube and to the new extract
+    """
+    drift = pd.DataFrame(
+        columns=["dose", "group", "feature", "level", "date", "cube", "data"]
+    )
+
+    features = _cube_features(groups_of_interest, features_dict, extra_features)
+
+    if (
+        cube is None
+        or not set(doses).issubset(cube["dose"].unique())
+        or not set(groups_of_interest).issubset(cube["group"].unique())
+        or not set(features).issubset(cube["feature"].unique())
+    ):
+        return (
+            build_coverage_cube(
+                df,
+                groups_of_interest,
+                features_dict,
+                doses=doses,
+                all_keys=all_keys,
+                extra_features=extra_features,
+                n_workers=n_workers,
+                groups=groups,
+            ),
+            drift,
+        )
+
+    if groups is None:
+        groups = group_columns(df, groups_of_interest, all_keys=all_keys)
+    group = groups["group"]
+    # (the groups of the patients counted again are passed on, rather than priority_group)
+    columns = [c for c in dict.fromkeys(["sex"] + features) if c in df.columns]
+
+    parts = []
+    checks = []
+    for dose in doses:
+        old = cube.loc[
+            (cube["dose"] == dose)
+            & cube["group"].isin(list(groups_of_interest.keys()))
+            & cube["feature"].isin(features + [OVERALL])
+        ]
+        old_dates = old["date"].to_numpy()
+        if refresh_from is not None:
+            start = campaign_day(refresh_from)
+        elif (old_dates != NO_DATE).any():
+            start = old_dates.max() - REFRESH_OVERLAP_DAYS
+        else:
+            start = NO_DATE + 1
+        kept = old.loc[(old_dates != NO_DATE) & (old_dates < start)]
+
+        # patients vaccinated since the start of the refresh, or not at all
+        dates = df[dose].to_numpy()
+        recount = (dates >= start) | (dates == NO_DATE)
+        new = build_coverage_cube(
+            df.loc[recount, columns + [dose]],
+            groups_of_interest,
+            features_dict,
+            doses=[dose],
+            all_keys=all_keys,
+            extra_features=extra_features,
+            n_workers=n_workers,
+            groups=groups.loc[recount],
+        )
+        parts += [kept, new]
+
+        if verify:
+            checks.append(_check_history(kept, df, group, dose, groups_of_interest))
+
+    if checks:
+        drift = pd.concat([drift] + checks, ignore_index=True)
+    if len(drift) > 0:
+        return (
+            build_coverage_cube(
+                df,
+                groups_of_interest,
+                features_dict,
+                doses=doses,
+                all_keys=all_keys,
+                extra_features=extra_features,
+                n_workers=n_workers,
+                groups=groups,
+            ),
+            drift,
+        )
+
+    refreshed = pd.DataFrame(
+        {
+            c: union_categoricals([p[c] for p in parts])
+            if c in ["dose", "group", "feature", "level"]
+            else np.concatenate([p[c].to_numpy() for p in parts])
+            for c in CUBE_COLUMNS
+        }
+    )
+
+    # levels which were not in the saved cube (or not in the new counts) are fitted into
+    # the order of the levels of each feature
+    orders = {}
+    for p in parts:
+        levels = p.drop_duplicates(["feature", "level_order"]).sort_values("level_order")
+        for feature, feature_levels in levels.groupby("feature", observed=True):
+            orders[feature] = _merge_levels(
+                orders.get(feature, []), feature_levels["level"].tolist()
+            )
+    for feature, order in orders.items():
+        rows = refreshed["feature"] == feature
+        refreshed.loc[rows, "level_order"] = (
+            pd.Index(order).get_indexer(refreshed.loc[rows, "level"]).astype(np.int16)
+        )
+
+    return refreshed, drift
+
+
+def _cube_features(groups_of_interest, features_dict, extra_features=None):
+    """
+    Lists the features counted in the cube: those of interest for any of the groups, and
+    any extra features. Every feature is counted for every group.
+    """
+    features = []
+    for group_title, group_label in groups_of_interest.items():
+        features += group_features(features_dict, group_title, group_label)
+    if extra_features is not None:
+        features += list(extra_features)
+    return list(dict.fromkeys(features))
+
+
+def _merge_levels(levels, other):
+    """
+    Merges two lists of levels which are each in order, keeping the order of both.
+    """
+    merged = list(levels)
+    position = 0
+    for level in other:
+        if level in merged:
+            position = merged.index(level) + 1
+        else:
+            merged.insert(position, level)
+            position += 1
+    return merged
+
+
+def _check_history(kept, df, group, dose, groups_of_interest):
+    """
+    Compares the cumulative numbers vaccinated in each group, and at each level of each
+    feature in each group, on SPOT_CHECK_DATES dates kept from a saved cube against a new
+    extract, and returns those which differ (e.g. where ethnicity has since been filled in
+    for patients vaccinated some time ago). Patients of known and unknown sex are counted
+    together.
+    """
+    drift_columns = ["dose", "group", "feature", "level", "date", "cube", "data"]
+    history = np.unique(kept.loc[kept["feature"] == OVERALL, "date"].to_numpy())
+    if len(history) == 0:
+        return pd.DataFrame(columns=drift_columns)
+    spot_dates = np.unique(
+        history[np.linspace(0, len(history) - 1, SPOT_CHECK_DATES).round().astype(int)]
+    )
+
+    def spot_codes(dates):
+        # the first spot date from which each dose is counted (-1 if not counted by the last)
+        codes = np.searchsorted(spot_dates, dates)
+        return np.where((dates == NO_DATE) | (codes == len(spot_dates)), -1, codes)
+
+    group_labels = pd.Index(list(dict.fromkeys(groups_of_interest.values())))
+    group_codes = group_labels.get_indexer(group)
+    patient_spots = spot_codes(df[dose].to_numpy())
+    # patients not counted by the last spot date share an extra slot, which is left out
+    date_codes = [
+        (np.where(patient_spots < 0, len(spot_dates), patient_spots), len(spot_dates) + 1)
+    ]
+
+    rows = []
+    for feature, feature_rows in kept.groupby("feature", observed=True):
+        if feature == OVERALL:
+            codes = np.zeros(len(df), dtype=np.int64)
+            labels = pd.Index([OVERALL])
+        elif feature in df.columns:
+            codes, levels = level_codes(df[feature])
+            labels = pd.Index(label_flags(levels).astype(str))
+        else:
+            continue
+
+        # levels which are in the saved cube but no longer in the data are counted as well
+        cube_levels = feature_rows["level"].astype(str)
+        labels = labels.append(pd.Index(cube_levels.unique()).difference(labels))
+        shape = (len(group_labels), len(labels))
+
+        in_data = count_cells_by_dates([group_codes, codes], shape, date_codes)[0]
+        in_data = in_data[:, :, :-1].cumsum(axis=2)
+
+        in_cube = np.zeros(shape + (len(spot_dates) + 1,), dtype=np.int64)
+        row_spots = spot_codes(feature_rows["date"].to_numpy())
+        np.add.at(
+            in_cube,
+            (
+                group_labels.get_indexer(
+                    feature_rows["group"].astype(str).map(groups_of_interest)
+                ),
+                labels.get_indexer(cube_levels),
+                np.where(row_spots < 0, len(spot_dates), row_spots),
+            ),
+            feature_rows["patients"].to_numpy(),
+        )
+        in_cube = in_cube[:, :, :-1].cumsum(axis=2)
+
+        for group_title, group_label in groups_of_interest.items():
+            g = group_labels.get_loc(group_label)
+            for level, spot in zip(*np.nonzero(in_cube[g] != in_data[g])):
+                rows.append(
+                    [
+                        dose,
+                        group_title,
+                        feature,
+                        labels[level],
+                        campaign_date(spot_dates[spot]),
+                        int(in_cube[g, level, spot]),
+                        int(in_data[g, level, spot]),
+                    ]
+                )
+
+    return pd.DataFrame(rows, columns=drift_columns)
+
+
+def _cube_rows(counts, dose, group, feature, levels, dates):
+    """
+    Turns an array of counts for one dose, group and feature (by known/unknown sex,
+    level and date) into rows of the cube, leaving out empty cells.
+    """
+    known_sex, level_order, date_order = np.nonzero(counts)
+    return {
+        "dose": np.full(len(known_sex), dose, dtype=object),
+        "group": np.full(len(known_sex), group, dtype=object),
+        "feature": np.full(len(known_sex), feature, dtype=object),
+        "level": np.asarray(levels, dtype=object)[level_order],
+        "level_order": level_order.astype(np.int16),
+        "known_sex": known_sex.astype(bool),
+        "date": dates[date_order].astype(np.int32),
+        "patients": counts[known_sex, level_order, date_order],
+    }
+
+
+def cube_partial_sums(
+    cube,
+    groups_of_interest,
+    features_dict,
+    reference_column_name="covid_vacc_date",
+    counted_after=None,
+):
+    """
+    Picks out counts of patients from the cube, in the form returned by
+    partial_cumulative_sums(), for one dose.
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube()
+        groups_of_interest (dict): population/eligible subgroups, as passed to build_coverage_cube()
+                                   (or some of them)
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical
+                              factors to include for that group (must be included in the cube)
+        reference_column_name (str): dose e.g. "covid_vacc_date" for first dose
+        counted_after (int or str): doses dated on or before this campaign day (or "YYYY-MM-DD")
+                                    are counted as not received, as if their dates were missing
+
+    Returns:
+        partial (dict): a mapping from a group name (e.g '80+') to the counts for that group
+    """
+    group_titles = pd.Index(list(groups_of_interest.keys()))
+    rows = cube.loc[
+        (cube["dose"] == reference_column_name) & cube["group"].isin(group_titles)
+    ]
+
+    # dates on which anyone was vaccinated (patients with no date are counted after the last date)
+    row_dates = rows["date"].to_numpy()
+    if counted_after is not None:
+        row_dates = np.where(
+            row_dates <= campaign_day(counted_after), NO_DATE, row_dates
+        )
+    dates = np.unique(row_dates[row_dates != NO_DATE])
+    rows = rows.assign(
+        group_code=group_titles.get_indexer(rows["group"]),
+        date_code=np.where(
+            row_dates == NO_DATE, len(dates), np.searchsorted(dates, row_dates)
+        ),
+    )
+
+    coverage = {
+        "dates": pd.Index(dates, name=reference_column_name),
+        "overall": np.zeros((len(group_titles), 2, len(dates) + 1), dtype=np.int64),
+        "features": {},
+    }
+    for feature, feature_rows in rows.groupby("feature", observed=True):
+        # levels of the feature which appear in the cube, in order
+        levels = feature_rows.drop_duplicates("level_order").sort_values("level_order")
+        level_codes = pd.Index(levels["level_order"]).get_indexer(
+            feature_rows["level_order"]
+        )
+
+        counts = np.zeros(
+            (len(group_titles), 2, len(levels), len(dates) + 1), dtype=np.int64
+        )
+        # (rows for doses which are not counted share the cell of patients with no date)
+        np.add.at(
+            counts,
+            (
+                feature_rows["group_code"].to_numpy(),
+                feature_rows["known_sex"].to_numpy().astype(int),
+                level_codes,
+                feature_rows["date_code"].to_numpy(),
+            ),
+            feature_rows["patients"].to_numpy(),
+        )
+
+        if feature == OVERALL:
+            coverage["overall"] = counts[:, :, 0, :]
+        else:
+            coverage["features"][feature] = (
+                pd.Index(levels["level"].to_numpy(dtype=object)),
+                counts,
+            )
+
+    partial = {}
+    for group_title, group_label in groups_of_interest.items():
+        partial[group_title] = group_coverage(
+            coverage,
+            group_titles.get_loc(group_title),
+            group_features(features_dict, group_title, group_label),
+        )
+
+    return partial
+
+
+def cube_cumulative_sums(
+    cube,
+    groups_of_interest,
+    features_dict,
+    latest_date,
+    reference_column_name="covid_vacc_date",
+    counted_after=None,
+):
+    """
+    Calculate cumulative sums across groups from the cube, giving the same results as
+    cumulative_sums() would give for the patient-level data from which the cube was built.
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube() or read_coverage_cube()
+        groups_of_interest (dict): population/eligible subgroups, as passed to build_coverage_cube()
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical
+                              factors to include for that group (must be included in the cube)
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
+        reference_column_name (str): dose e.g. "covid_vacc_date" for first dose
+        counted_after (int or str): doses dated on or before this date are not counted (see cube_partial_sums())
+
+    Returns:
+        df_dict_out (dict): as returned by cumulative_sums()
+    """
+    return cube_cumulative_sums_as_of(
+        cube,
+        groups_of_interest,
+        features_dict,
+        [latest_date],
+        reference_column_name=reference_column_name,
+        counted_after=counted_after,
+    )[latest_date]
+
+
+def cube_cumulative_sums_as_of(
+    cube,
+    groups_of_interest,
+    features_dict,
+    dates,
+    reference_column_name="covid_vacc_date",
+    counted_after=None,
+):
+    """
+    Coverage of each group, by each feature, as it was on each of a set of dates (e.g. first
+    doses up to 14 weeks ago, for comparison with second doses due now). The counts are read
+    from the cube once, and only the cumulative sums are worked out for each date, rather
+    than counting the patient-level data again for each date.
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube() or read_coverage_cube()
+        groups_of_interest (dict): population/eligible subgroups, as passed to build_coverage_cube()
+                                   (or some of them)
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical
+                              factors to include for that group (must be included in the cube)
+        dates (list): campaign days (or "YYYY-MM-DD"), each used as the latest date
+        reference_column_name (str): dose e.g. "covid_vacc_date" for first dose
+        counted_after (int or str): doses dated on or before this date are not counted (see cube_partial_sums())
+
+    Returns:
+        df_dict_out (dict): a mapping from each of the dates to the cumulative sums up to that
+                            date, as returned by cumulative_sums() with that date as latest_date
+    """
+    partial = cube_partial_sums(
+        cube,
+        groups_of_interest,
+        features_dict,
+        reference_column_name=reference_column_name,
+        counted_after=counted_after,
+    )
+
+    return {
+        date: cumulative_sums_from_partials(
+            partial, date, reference_column_name=reference_column_name
+        )
+        for date in dates
+    }
+
+
+def cube_vaccination_counts(
+    cube, reference_column_name="covid_vacc_date", feature=OVERALL
+):
+    """
+    Cumulative numbers of patients vaccinated in each group (or at each level of a feature,
+    over all the groups) from the cube, on each date on which anyone was vaccinated, for
+    charting with make_vaccine_graphs().
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube() or read_coverage_cube()
+        reference_column_name (str): dose e.g. "covid_vacc_date" for first dose
+        feature (str): feature by which to break down the numbers e.g. "priority_status"
+                       (which must be in the cube for every group), or OVERALL for the groups
+
+    Returns:
+        counts (Dataframe): indexed by campaign day, with a column for each group or level
+                            in which anyone was vaccinated
+    """
+    rows = cube.loc[
+        (cube["dose"] == reference_column_name)
+        & (cube["feature"] == feature)
+        & (cube["date"] != NO_DATE)
+    ]
+    column = "group" if feature == OVERALL else "level"
+
+    counts = (
+        rows.groupby(["date", rows[column].astype(str)])["patients"]
+        .sum()
+        .unstack(fill_value=0)
+        .sort_index()
+        .cumsum()
+    )
+    counts.columns.name = None
+    return counts
+
+
+def release_coverage_cube(cube, threshold=SUPPRESSION_THRESHOLD, base=ROUNDING_BASE):
+    """
+    Applies statistical disclosure control to the cube, as the last step before it is
+    exported: low numbers of patients are suppressed and all numbers are rounded, in one
+    pass over every cell of the cube (see disclosure_control.py).
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube()
+        threshold (int): the highest number of patients to suppress
+        base (int): numbers of patients are rounded to the nearest multiple of base
+
+    Returns:
+        released (Dataframe): the cube, with the numbers of patients suppressed and rounded
+        audit (Dataframe): the number of cells, and how many of them were suppressed, for
+                           each dose, group and feature
+    """
+    patients = cube["patients"].to_numpy()
+    released = cube.assign(
+        patients=suppress_and_round(patients, threshold, base).astype(patients.dtype)
+    )
+
+    audit = (
+        cube[["dose", "group", "feature"]]
+        .assign(cells=1, suppressed=low_counts(patients, threshold).astype(int))
+        .groupby(["dose", "group", "feature"], observed=True)[["cells", "suppressed"]]
+        .sum()
+        .reset_index()
+    )
+
+    return released, audit
+
+
+def write_coverage_cube(cube, path):
+    """
+    Saves the cube as a parquet file.
+
+    Args:
+        cube (Dataframe): as returned by build_coverage_cube()
+        path (str): path of the file e.g. "../interim-outputs/objects/coverage_cube.parquet"
+
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary file first so an interrupted run cannot leave a partial file
+    pq.write_table(pa.Table.from_pandas(cube, preserve_index=False), f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def read_coverage_cube(path):
+    """
+    Reads a cube saved by write_coverage_cube().
+
+    Args:
+        path (str): path of the file
+
+    Returns:
+        cube (Dataframe): the cube, or None if it has not been saved
+    """
+    if not os.path.exists(path):
+        return None
+
+    return pq.read_table(path).to_pandas()
@@ -7,9 +7,77 @@ import numpy as np
 import os
 import re
 from datetime import timedelta
+from functools import lru_cache
 
 # Errors
 from errors import DataCleaningError
+from dates import NO_DATE, campaign_day
+from schema import (
+    read_study_definition_schema,
+    read_extract,
+    iter_extract,
+    select_columns,
+)
+from cache import cache_key, read_cached_data, write_cached_data
+
+
+# Names of each IMD quintile
+IMD_CATEGORIES = {
+    0: "Unknown",
+    1: "1 Most deprived",
+    2: "2",
+    3: "3",
+    4: "4",
+    5: "5 Least deprived",
+}
+
+# Extract columns which load_adult_data() always needs, whichever features are reported:
+# vaccination dates and brands, and the fields used to assign priority groups
+ADULT_CORE_COLUMNS = [
+    "patient_id",
+    "age",
+    "care_home",
+    "shielded",
+    "LD",
+    "stp",
+    "covid_vacc_date",
+    "covid_vacc_second_dose_date",
+    "covid_vacc_third_dose_date",
+    "covid_vacc_pfizer_date",
+    "covid_vacc_oxford_date",
+    "covid_vacc_moderna_date",
+    "covid_vacc_third_dose_pfizer_date",
+    "covid_vacc_third_dose_oxford_date",
+    "covid_vacc_third_dose_moderna_date",
+]
+
+# Extract columns which load_child_data() always needs
+CHILD_CORE_COLUMNS = [
+    "patient_id",
+    "age",
+    "stp",
+    "covid_vacc_date",
+    "covid_vacc_second_dose_date",
+    "covid_vacc_third_dose_date",
+    "covid_vacc_pfizerA_date",
+    "covid_vacc_pfizerC_date",
+    "covid_vacc_oxford_date",
+    "covid_vacc_moderna_date",
+    "covid_vacc_third_dose_pfizerC_date",
+    "covid_vacc_third_dose_pfizerA_date",
+    "covid_vacc_third_dose_oxford_date",
+    "covid_vacc_third_dose_moderna_date",
+]
+
+# Extract columns needed to derive each feature, where these differ from the feature name
+FEATURE_SOURCE_COLUMNS = {
+    "ethnicity_6_groups": ["ethnicity", "ethnicity_6_sus"],
+    "ethnicity_16_groups": ["ethnicity_16", "ethnicity_16_sus"],
+    "imd_categories": ["imd"],
+    "newly_shielded_since_feb_15": ["shielded_since_feb_15"],
+    "ssri": ["ssri", "psychosis_schiz_bipolar", "LD", "dementia"],
+    "risk_status": ["child_atrisk"],
+}
 
 
 def make_conditions(
@@ -50,71 +118,357 @@ def make_conditions(
 
     """
 
-    ### A dictionary recording the condition list for each dose.
+    ### The field_to_check_for_unknown is the name of the field that needs to be
+    ### checked for contents in the case of the brand being unknown. The user
+    ### can provide this as a parameter, if it is not provided, then we assume
+    ### that the field to check is the field for the first dose in `dose_list'
+    ### (which is then used for every dose).
+    if field_to_check_for_unknown == None:
+        field_to_check_for_unknown = next(iter(dose_list.values()))
+
+    matches, unknown = brand_matches(
+        df,
+        dose_list,
+        vaccine_dates,
+        unknown_fields={dose: field_to_check_for_unknown for dose in dose_list},
+    )
+
+    ### A dictionary recording the condition list for each dose - there is
+    ### a condition for each vaccine plus one more for "Unknown"
     all_conditions = {}
+    for dose in dose_list:
+        all_conditions[dose] = [
+            matches[dose][:, v_i] for v_i in range(len(vaccine_dates))
+        ] + [unknown[dose]]
+
+    return all_conditions
+
+
+def same_day_counts(days):
+    """
+    Counts, for each date in a matrix of days, how many dates in the same row are
+    equal to it (including itself). Each row is sorted once, so this takes
+    O(B log B) per patient for B brands, rather than comparing every pair of brands.
+
+    Args:
+        days (np.array): campaign days, with one row per patient and one column per brand
+
+    Returns:
+        counts (np.array): the same shape as `days'. A count of 1 means no other
+                           brand was recorded on the same day.
+    """
+    n_rows, n_columns = days.shape
+    counts = np.ones(days.shape, dtype=np.int16)
+    if n_columns < 2:
+        return counts
+
+    order = np.argsort(days, axis=1, kind="stable")
+    sorted_days = np.take_along_axis(days, order, axis=1)
+
+    ### Within each sorted row, equal dates form runs. Find where each run
+    ### starts and ends, and so how long the run containing each date is.
+    positions = np.broadcast_to(np.arange(n_columns), days.shape)
+    new_run = np.ones(days.shape, dtype=bool)
+    new_run[:, 1:] = sorted_days[:, 1:] != sorted_days[:, :-1]
+    run_start = np.maximum.accumulate(np.where(new_run, positions, 0), axis=1)
+
+    run_ends = np.ones(days.shape, dtype=bool)
+    run_ends[:, :-1] = new_run[:, 1:]
+    run_end = np.minimum.accumulate(
+        np.where(run_ends, positions, n_columns - 1)[:, ::-1], axis=1
+    )[:, ::-1]
+
+    np.put_along_axis(counts, order, (run_end - run_start + 1).astype(np.int16), axis=1)
+    return counts
+
 
+def brand_matches(df, dose_list, vaccine_dates, unknown_fields=None):
+    """
+    Finds which brands match each dose of vaccine. All the date columns are converted
+    to days only once, and whether each brand was recorded on the same day as
+    another brand is worked out once and used for every dose.
+
+    Args:
+        df (data frame): input data, as generated by load_*_data() functions
+        dose_list (dict): as for make_conditions()
+        vaccine_dates (dict): as for make_conditions()
+        unknown_fields (dict): a dict, where keys are dose strings and values are the
+                          fields checked for a date to decide whether a dose of unknown
+                          brand was received. Defaults to the field for each dose.
+
+    Returns:
+        matches (dict): a dict, where keys are dose strings and values are boolean
+                        arrays with one row per patient and one column per brand
+        unknown (dict): a dict, where keys are dose strings and values are boolean
+                        arrays, True where the dose was received
+    """
+    if unknown_fields is None:
+        unknown_fields = dose_list
+
+    brand_fields = list(vaccine_dates.keys())
+    other_fields = [
+        f
+        for f in list(dose_list.values()) + list(unknown_fields.values())
+        if f is not None and f not in brand_fields
+    ]
+    other_fields = list(dict.fromkeys(other_fields))
+
+    ### Put the dates (campaign days) of all the brands into a single matrix
+    days = df[brand_fields + other_fields].to_numpy(dtype=np.int32)
+    brand_days = days[:, : len(brand_fields)]
+    field_days = {f: days[:, len(brand_fields) + i] for i, f in enumerate(other_fields)}
+    field_days.update({f: brand_days[:, i] for i, f in enumerate(brand_fields)})
+
+    ### Brands which could have been administered on the recorded date, and which were
+    ### not recorded on the same day as another brand (the same for every dose)
+    start_days = np.array(
+        [
+            NO_DATE if d is None else campaign_day(d) for d in vaccine_dates.values()
+        ],
+        dtype=np.int32,
+    )
+    possible = (brand_days >= start_days) & (same_day_counts(brand_days) == 1)
+
+    matches = {}
+    unknown = {}
     for dose, field_name in dose_list.items():
+        if field_name is None:
+            ### the brand only needs to have been recorded
+            matches[dose] = possible & (brand_days != NO_DATE)
+        else:
+            ### the brand was recorded on the date of this dose
+            matches[dose] = possible & (brand_days == field_days[field_name][:, None])
+        unknown[dose] = field_days[unknown_fields[dose]] != NO_DATE
 
-        ### This list records the condition flag - there should be
-        ### a condition for each vaccine plus one more for "Unknown"
-        num_conditions = len(vaccine_dates.items()) + 1
-        dose_conditions = [None] * num_conditions
-        v_i = 0
-
-        ### Building a condition flag for each vaccine -
-        ### v_focus = field containing the dates for a particular brand of vaccine (e.g., "covid_vacc_pfizerC_date")
-        ### v_date = date before which this vaccine could not have been administered (e.g. "2020-12-07")
-        for v_focus, v_date in vaccine_dates.items():
-
-            ### The first element in generating the condition flag
-            ### is to test that the contents of the v_focus column:
-            ### If field_name is not None (e.g., "covid_vacc_date"), then
-            ### we check that our v_focus date is the field_name date - if they are
-            ### the same then we know that the covid_vaccination was of this particular brand.
-            ### However, if field_name IS None, we check to see if this column
-            ### does not equal zero (i.e., it has something in it).
-            this_flag = df[v_focus] != 0
-            if field_name != None:
-                this_flag = df[v_focus] == df[field_name]
-
-            ### If a date is provided that defines when a particular brand of
-            ### of vaccine came online, then we can use that information to check
-            ### that the vaccine brand is possible. If dates have not been provided,
-            ### then we don't have to update the condition flag (the date constraint
-            ### may have been implemented in the study definition instead).
-            if v_date != None:
-                this_flag = this_flag & (df[v_focus].astype(str) >= v_date)
-
-            ### This creates a list of all brands of vaccine that are NOT v_focus
-            ### so that we can loop through them and compare to v_focus in the next
-            ### step.
-            v_others = [x for x in vaccine_dates.keys() if v_focus not in x]
-
-            ### Occassionally, we have vaccines recorded on the same day for the
-            ### same patient but different brands. We only want to record data
-            ### for vaccines that were not recorded on the same day as another brand.
-            for v_other in v_others:
-                this_flag = this_flag & (df[v_focus] != df[v_other])
-
-            ### Recording this flag for this brand in the dose conditions list.
-            dose_conditions[v_i] = this_flag
-            v_i += 1
-
-        ### The field_to_check_for_unknown is the name of the field that needs to be
-        ### checked for contents in the case of the brand being unknown. The user
-        ### can provide this as a parameter, if it is not provided, then we assume
-        ### that the field to check is `field_name'.
-        if field_to_check_for_unknown == None:
-            field_to_check_for_unknown = field_name
-        dose_conditions[v_i] = df[field_to_check_for_unknown] != 0
-
-        all_conditions[dose] = dose_conditions
+    return matches, unknown
 
-    return all_conditions
+
+def resolve_brands(
+    df,
+    dose_list,
+    vaccine_dates,
+    choices,
+    field_to_check_for_unknown=None,
+):
+    """
+    Works out the brand of each dose of vaccine. This gives the same result
+    as applying conditions like those from make_conditions() with np.select(), but
+    the conditions for every brand and dose are evaluated together (see brand_matches()).
+
+    For each dose, the brand is the first brand (in the order of `vaccine_dates')
+    recorded on the date of that dose, on or after the date the brand was first
+    administered and not on the same day as another brand. If none is found the
+    brand is "Unknown" if the dose was received, or "none" if it was not.
+
+    Args:
+        df (data frame): input data, as generated by load_*_data() functions
+        dose_list (dict): a dict, where keys are dose strings and values are
+                          the field names for the dates of those doses (if the
+                          date is set to None, the brand only needs to be recorded)
+        vaccine_dates (dict): a dict, where keys give field names for the date of
+                          different brands of the vaccine and values are dates
+                          before which those brands cannot be administered (or None)
+        choices (list): names of the brands, in the same order as `vaccine_dates',
+                          followed by the name for an unknown brand
+        field_to_check_for_unknown (str): field checked for a date to decide whether
+                          a dose with no known brand was received. Defaults to the field
+                          for each dose.
+
+    Returns:
+        brands (dict): a dict, where keys are dose strings and values are arrays
+                       giving the brand of that dose for each patient
+    """
+    unknown_fields = {
+        dose: field_to_check_for_unknown or field_name
+        for dose, field_name in dose_list.items()
+    }
+    matches, unknown = brand_matches(df, dose_list, vaccine_dates, unknown_fields)
+
+    labels = np.array(list(choices) + ["none"])
+    brands = {}
+    for dose in dose_list:
+        brand_index = np.where(
+            matches[dose].any(axis=1),
+            matches[dose].argmax(axis=1),
+            np.where(unknown[dose], len(choices) - 1, len(choices)),
+        )
+        brands[dose] = labels[brand_index]
+
+    return brands
+
+
+def load_cleaned_data(
+    clean_function,
+    input_file,
+    input_path="output",
+    save_path={},
+    features=None,
+    use_cache=True,
+    missing_stp_bullet="-",
+    chunksize=None,
+):
+    """
+    This returns cleaned data for an extract, reading them from the cache if this
+    extract has already been cleaned by the same code. Otherwise the data are
+    cleaned using `clean_function' and then cached.
+
+    Args:
+        clean_function (function): clean_adult_data or clean_child_data
+        input_file (str): name of the input file
+        input_path (str): folder in which to find the input file
+        save_path (dict): output directories, as returned by create_output_dirs(). If
+                          provided, a list of STPs missing from the data is saved.
+        features (list): demographic/clinical features needed for the reports
+        use_cache (bool): whether to read and write cached data
+        missing_stp_bullet (str): bullet used when listing missing STPs
+        chunksize (int): if given, the extract is read and cleaned this many patients at a
+                         time (see clean_adult_data())
+
+    Returns:
+        Dataframe (df): Process dataframe
+    """
+    df = None
+    if use_cache:
+        key = cache_key(
+            os.path.join("..", input_path, input_file),
+            clean_function.__name__,
+            features=features,
+        )
+        df = read_cached_data(key)
+
+    if df is None:
+        df = clean_function(
+            input_file=input_file,
+            input_path=input_path,
+            features=features,
+            chunksize=chunksize,
+        )
+        check_one_row_per_patient(df)
+        if use_cache:
+            write_cached_data(df, key)
+
+    if save_path:
+        write_missing_stps(df, save_path, bullet=missing_stp_bullet)
+
+    return df
+
+
+def concat_chunks(chunks):
+    """
+    Puts together chunks of cleaned data. The (sorted) categories of each categorical
+    column are combined, as a chunk may not include every category.
+
+    Args:
+        chunks (iterable): chunks of cleaned data, e.g. from iter_adult_data()
+
+    Returns:
+        Dataframe (df): all the chunks, one after another
+    """
+    chunks = list(chunks)
+    if not chunks:
+        raise DataCleaningError("No data were read in")
+
+    for c in chunks[0].columns:
+        if isinstance(chunks[0][c].dtype, pd.CategoricalDtype):
+            categories = sorted(
+                set().union(*(chunk[c].cat.categories for chunk in chunks))
+            )
+            for chunk in chunks:
+                chunk[c] = chunk[c].cat.set_categories(categories)
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+def check_one_row_per_patient(df):
+    """
+    Checks that no patient appears more than once in the data. The reports count
+    patients as rows rather than counting distinct patient_ids (see count_cells() in
+    report_results.py), which relies on this. The data are checked once, when they
+    are cleaned (cached data were checked before they were cached). Data read in
+    chunks are checked a chunk at a time.
+
+    Args:
+        df (Dataframe): data containing `patient_id'
+
+    Raises:
+        DataCleaningError: If any patient_id appears more than once
+    """
+    if not df["patient_id"].is_unique:
+        duplicates = df["patient_id"].duplicated().sum()
+        raise DataCleaningError(
+            f"{duplicates} rows have the same patient_id as an earlier row"
+        )
+
+
+def write_missing_stps(df, save_path, bullet="-"):
+    """
+    Saves a list of the STPs which do not appear in the data to Missing_STPs.txt.
+
+    Args:
+        df (Dataframe): cleaned data, containing `stp_name'
+        save_path (dict): output directories, as returned by create_output_dirs()
+        bullet (str): bullet used when listing missing STPs
+    """
+    stps = stp_lookup()
+    missing_stps = set(stps["name"]).difference(set(df["stp_name"].dropna()))
+    dummy_regex = re.compile(r"^Dummy STP \d+$")
+    missing_stps_final = [ele for ele in missing_stps if not dummy_regex.match(ele)]
+
+    with open(os.path.join(save_path["text"], f"Missing_STPs.txt"), "w") as text_file:
+        text_file.write(
+            f"{len(missing_stps_final)} STPs are not represented in our dataset."
+        )
+        for this_missing_stp in missing_stps_final:
+            text_file.write(f"\n{bullet} {this_missing_stp}")
 
 
 def load_adult_data(
-    input_file="input_delivery.csv.gz", input_path="output", save_path={}
+    input_file="input_delivery.csv.gz",
+    input_path="output",
+    save_path={},
+    features=None,
+    use_cache=True,
+    chunksize=None,
+):
+    """
+    This reads in a csv that must be in output/ directory and cleans the
+    data ready for use in the graphs and tables. The data are relevant for reporting
+    vaccine coverage amongst ADULTS.
+
+    The cleaned data are cached (see cache.py), so that later runs on the same extract
+    with the same cleaning code read the cached data rather than cleaning it again.
+
+    Args:
+        input_file (str): name of the input file. Default value is `input_delivery.csv.gz'
+        input_path (str): folder in which to find the input file
+        save_path (dict): output directories, as returned by create_output_dirs(). If
+                          provided, a list of STPs missing from the data is saved.
+        features (list): demographic/clinical features needed for the reports (see clean_adult_data())
+        use_cache (bool): whether to read and write cached data
+        chunksize (int): if given, the extract is read and cleaned this many patients at a
+                         time, so that the memory needed while cleaning is set by the chunk
+                         size rather than the size of the extract
+
+    Returns:
+        Dataframe (df): Process dataframe
+    """
+    return load_cleaned_data(
+        clean_adult_data,
+        input_file=input_file,
+        input_path=input_path,
+        save_path=save_path,
+        features=features,
+        use_cache=use_cache,
+        missing_stp_bullet="-",
+        chunksize=chunksize,
+    )
+
+
+def clean_adult_data(
+    input_file="input_delivery.csv.gz",
+    input_path="output",
+    features=None,
+    chunksize=None,
 ):
     """
     This reads in a csv that must be in output/ directory and cleans the
@@ -127,6 +481,12 @@ def load_adult_data(
                           with columns representing various outcomes (covid vaccine dates),
                           demographics and clinical flags
         input_path (str): folder in which to find the input file
+        features (list): demographic/clinical features (as named in the processed data, e.g.
+                          "ethnicity_6_groups") needed for the reports. Only the columns needed for
+                          these, vaccination status and priority groups are read in. If None, all
+                          columns are read in.
+        chunksize (int): if given, the extract is read and cleaned this many patients at a time
+                          and the chunks are then put together
 
     Returns:
         Dataframe (df): Process dataframe
@@ -135,130 +495,138 @@ def load_adult_data(
             processes
     """
 
-    # import data and fill nulls with 0
-    df = pd.read_csv(
-        os.path.join("..", input_path, input_file), compression="gzip"
-    ).fillna(0)
+    if chunksize:
+        return concat_chunks(
+            iter_adult_data(input_file, input_path, features, chunksize=chunksize)
+        )
 
-    # fill unknown ethnicity from GP records with ethnicity from SUS (secondary care)
-    df.loc[df["ethnicity"] == 0, "ethnicity"] = df["ethnicity_6_sus"]
-    df.loc[df["ethnicity_16"] == 0, "ethnicity_16"] = df["ethnicity_16_sus"]
+    # import data, using the column types in the study definition, and fill nulls with 0
+    schema = read_study_definition_schema("study_definition_delivery")
+    df = read_extract(
+        os.path.join("..", input_path, input_file),
+        study_definition="study_definition_delivery",
+        columns=select_columns(
+            schema, ADULT_CORE_COLUMNS, features, FEATURE_SOURCE_COLUMNS
+        ),
+    )
+
+    return clean_adult_extract(df)
+
+
+def iter_adult_data(
+    input_file="input_delivery.csv.gz",
+    input_path="output",
+    features=None,
+    chunksize=500000,
+):
+    """
+    This reads in a csv that must be in output/ directory in chunks of `chunksize' rows
+    and cleans each chunk in the same way as clean_adult_data(). This is for extracts which
+    are too large to clean in one go: the chunks can be put together once they have been
+    cleaned (see load_adult_data()), or summarised one at a time (see
+    streaming_cumulative_sums() in report_results.py).
+
+    Args:
+        input_file (str): name of the input file. Default value is `input_delivery.csv.gz'
+        input_path (str): folder in which to find the input file
+        features (list): demographic/clinical features needed for the reports (see clean_adult_data())
+        chunksize (int): number of patients in each chunk
+
+    Yields:
+        Dataframe (df): the next chunk of processed data
+    """
+    schema = read_study_definition_schema("study_definition_delivery")
+    for df in iter_extract(
+        os.path.join("..", input_path, input_file),
+        study_definition="study_definition_delivery",
+        columns=select_columns(
+            schema, ADULT_CORE_COLUMNS, features, FEATURE_SOURCE_COLUMNS
+        ),
+        chunksize=chunksize,
+    ):
+        check_one_row_per_patient(df)
+        yield clean_adult_extract(df)
 
+
+def clean_adult_extract(df):
+    """
+    This cleans adult data which have been read in by read_extract() (or one chunk of them),
+    ready for use in the graphs and tables. Each patient is cleaned independently
+    of the others, so the data can be cleaned in chunks.
+
+    Args:
+        df (Dataframe): one-row-per-patient extract, as returned by read_extract()
+
+    Returns:
+        Dataframe (df): Process dataframe
+    """
+
+    # fill unknown ethnicity from GP records with ethnicity from SUS (secondary care)
     # convert ethnic categories to words. There are 2 ways of categorising - into
     # 6 groups or into 16 groups.
-    # this creates a new column called `ethnicity_6_groups`
-    df = map_ethnicity(df, columnname="ethnicity", number_of_groups=6)
+    if "ethnicity" in df.columns:
+        df.loc[df["ethnicity"] == 0, "ethnicity"] = df["ethnicity_6_sus"]
+
+        # this creates a new column called `ethnicity_6_groups`
+        df = map_ethnicity(df, columnname="ethnicity", number_of_groups=6)
+
+    if "ethnicity_16" in df.columns:
+        df.loc[df["ethnicity_16"] == 0, "ethnicity_16"] = df["ethnicity_16_sus"]
 
-    # this creates a new column called `ethnicity_16_groups`
-    df = map_ethnicity(df, columnname="ethnicity_16", number_of_groups=16)
+        # this creates a new column called `ethnicity_16_groups`
+        df = map_ethnicity(df, columnname="ethnicity_16", number_of_groups=16)
 
     # describe imd partially in words and make new column called `imd_categories` from `imd`
-    imd_lookup = {
-        0: "Unknown",
-        1: "1 Most deprived",
-        2: "2",
-        3: "3",
-        4: "4",
-        5: "5 Least deprived",
-    }
-    for level, category in imd_lookup.items():
-        df.loc[df["imd"] == level, "imd_categories"] = category
-    df["imd_categories"].fillna("Unknown")
+    if "imd" in df.columns:
+        df["imd_categories"] = map_categorical(df["imd"], IMD_CATEGORIES)
 
     # Assign vaccine status
     df = df.assign(
         covid_vacc_flag=np.where(
-            df["covid_vacc_date"] != 0, "vaccinated", "unvaccinated"
+            df["covid_vacc_date"] != NO_DATE, "vaccinated", "unvaccinated"
         ),
-        covid_vacc_flag_ox=np.where(df["covid_vacc_oxford_date"] != 0, 1, 0),
-        covid_vacc_flag_pfz=np.where(df["covid_vacc_pfizer_date"] != 0, 1, 0),
-        covid_vacc_flag_mod=np.where(df["covid_vacc_moderna_date"] != 0, 1, 0),
-        covid_vacc_2nd=np.where(df["covid_vacc_second_dose_date"] != 0, 1, 0),
-        covid_vacc_3rd=np.where(df["covid_vacc_third_dose_date"] != 0, 1, 0),
-        covid_vacc_bin=np.where(df["covid_vacc_date"] != 0, 1, 0),
+        covid_vacc_flag_ox=np.where(df["covid_vacc_oxford_date"] != NO_DATE, 1, 0),
+        covid_vacc_flag_pfz=np.where(df["covid_vacc_pfizer_date"] != NO_DATE, 1, 0),
+        covid_vacc_flag_mod=np.where(df["covid_vacc_moderna_date"] != NO_DATE, 1, 0),
+        covid_vacc_2nd=np.where(df["covid_vacc_second_dose_date"] != NO_DATE, 1, 0),
+        covid_vacc_3rd=np.where(df["covid_vacc_third_dose_date"] != NO_DATE, 1, 0),
+        covid_vacc_bin=np.where(df["covid_vacc_date"] != NO_DATE, 1, 0),
     )
 
     # Create a single field for brand of first and second dose
     # This excludes any uncertain cases where date of brand was too early or multiple brands were recorded
     choices = ["Oxford-AZ", "Pfizer", "Moderna", "Unknown"]
-    doses = {"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"}
-    for dose, field_name in doses.items():
-        conditions = [
-            (  # pt has had an oxford vaccine, on or after the date this brand was first administered
-                # in UK (minus 1 day; if date is unfeasible, vaccine type may be incorrect):
-                df["covid_vacc_oxford_date"].astype(str)
-                >= "2020-01-03"
-            )
-            & (
-                # oxford vaccine was on date of selected dose:
-                df["covid_vacc_oxford_date"]
-                == df[field_name]
-            )
-            & (
-                # oxford vaccine was not on same date as another brand:
-                df["covid_vacc_oxford_date"]
-                != df["covid_vacc_pfizer_date"]
-            )
-            & (df["covid_vacc_oxford_date"] != df["covid_vacc_moderna_date"]),
-            ## repeat for pfizer and moderna:
-            (df["covid_vacc_pfizer_date"].astype(str) >= "2020-12-07")
-            & (df["covid_vacc_pfizer_date"] == df[field_name])
-            & (df["covid_vacc_pfizer_date"] != df["covid_vacc_oxford_date"])
-            & (df["covid_vacc_pfizer_date"] != df["covid_vacc_moderna_date"]),
-            # moderna - only include if dose date is after the date first administered in UK
-            (df["covid_vacc_moderna_date"].astype(str) >= "2021-04-06")
-            & (df["covid_vacc_moderna_date"] == df[field_name])
-            & (df["covid_vacc_moderna_date"] != df["covid_vacc_oxford_date"])
-            & (df["covid_vacc_moderna_date"] != df["covid_vacc_pfizer_date"]),
-            ## unknown type - pt has had the dose but the above conditions do not apply
-            # these may be unspecified brands or where two diff brands were recorded same day
-            df[field_name] != 0,
-        ]
-
-        df[f"brand_of_{dose}_dose"] = np.select(conditions, choices, default="none")
+    brands = resolve_brands(
+        df,
+        dose_list={"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"},
+        vaccine_dates={
+            # brands are only included on or after the date each was first administered in UK
+            # (minus 1 day; if date is unfeasible, vaccine type may be incorrect)
+            "covid_vacc_oxford_date": "2020-01-03",
+            "covid_vacc_pfizer_date": "2020-12-07",
+            "covid_vacc_moderna_date": "2021-04-06",
+        },
+        choices=choices,
+    )
 
     # Third doses - brands
     # No dates required as date filtering occurs in study definition
-    conditions = [
-        (
-            (df["covid_vacc_third_dose_oxford_date"] != 0)
-            & (
-                df["covid_vacc_third_dose_oxford_date"]
-                != df["covid_vacc_third_dose_pfizer_date"]
-            )
-            & (
-                df["covid_vacc_third_dose_oxford_date"]
-                != df["covid_vacc_third_dose_moderna_date"]
-            )
-        ),
-        (
-            (df["covid_vacc_third_dose_pfizer_date"] != 0)
-            & (
-                df["covid_vacc_third_dose_pfizer_date"]
-                != df["covid_vacc_third_dose_oxford_date"]
-            )
-            & (
-                df["covid_vacc_third_dose_pfizer_date"]
-                != df["covid_vacc_third_dose_moderna_date"]
-            )
-        ),
-        (
-            (df["covid_vacc_third_dose_moderna_date"] != 0)
-            & (
-                df["covid_vacc_third_dose_moderna_date"]
-                != df["covid_vacc_third_dose_oxford_date"]
-            )
-            & (
-                df["covid_vacc_third_dose_moderna_date"]
-                != df["covid_vacc_third_dose_pfizer_date"]
-            )
-        ),
-        ## unknown type - pt has had the dose but the above conditions do not apply
-        # these may be unspecified brands or where two diff brands were recorded same day
-        df["covid_vacc_third_dose_oxford_date"] != 0,
-    ]
+    brands.update(
+        resolve_brands(
+            df,
+            dose_list={"third": None},
+            vaccine_dates={
+                "covid_vacc_third_dose_oxford_date": None,
+                "covid_vacc_third_dose_pfizer_date": None,
+                "covid_vacc_third_dose_moderna_date": None,
+            },
+            choices=choices,
+            field_to_check_for_unknown="covid_vacc_third_dose_oxford_date",
+        )
+    )
 
-    df[f"brand_of_third_dose"] = np.select(conditions, choices, default="none")
+    for dose, brand in brands.items():
+        df[f"brand_of_{dose}_dose"] = brand
 
     # Mixed doses:
     # flag patients with different brands for the first and second dose
@@ -302,35 +670,38 @@ def load_adult_data(
     )
 
     # declined - suppress if vaccine has been received
-    df["covid_vacc_declined_date"] = np.where(
-        df["covid_vacc_date"] == 0, df["covid_vacc_declined_date"], 0
-    )
+    if "covid_vacc_declined_date" in df.columns:
+        df["covid_vacc_declined_date"] = np.where(
+            df["covid_vacc_date"] == NO_DATE, df["covid_vacc_declined_date"], NO_DATE
+        )
 
     # create an additional field for 2nd dose to use as a flag for each eligible group
     df["2nd_dose"] = df["covid_vacc_2nd"]
 
     # Assign column SSRI to be where has SSRI and no psychosis/bipolar/schizophrenia/dementia or LD
-    df = df.assign(
-        ssri=np.where(
-            (df["ssri"] == 1)
-            & (df["psychosis_schiz_bipolar"] == 0)
-            & (df["LD"] == 0)
-            & (df["dementia"] == 0),
-            1,
-            0,
+    if "ssri" in df.columns:
+        df = df.assign(
+            ssri=np.where(
+                (df["ssri"] == 1)
+                & (df["psychosis_schiz_bipolar"] == 0)
+                & (df["LD"] == 0)
+                & (df["dementia"] == 0),
+                1,
+                0,
+            )
         )
-    )
 
-    # Replace a region and STP with a value `0` with Unknown
-    df = df.assign(
-        region=df["region"].replace(0, "Unknown"), stp=df["stp"].replace(0, "Unknown")
-    )
+    # (a missing region or STP is read in as `Unknown')
 
     # Replace `I` or `U` for sex with `Other/Unknown`
-    df = df.assign(sex=df["sex"].replace(["I", "U"], "Other/Unknown"))
+    if "sex" in df.columns:
+        df["sex"] = map_categorical(
+            df["sex"], {"I": "Other/Unknown", "U": "Other/Unknown"}, keep_unmapped=True
+        )
 
     # categorise BMI into obese (i.e. BMI >=30) or non-obese (<30)
-    df = df.assign(bmi=np.where((df["bmi"] == "Not obese"), "under 30", "30+"))
+    if "bmi" in df.columns:
+        df = df.assign(bmi=np.where((df["bmi"] == "Not obese"), "under 30", "30+"))
 
     # drop unnecessary columns or columns created for processing
     df = df.drop(
@@ -341,7 +712,8 @@ def load_adult_data(
             "ethnicity_6_sus",
             "ethnicity_16_sus",
             "has_follow_up",
-        ]
+        ],
+        errors="ignore",
     )
 
     # categorise into priority groups (similar to the national groups but not exactly the same)
@@ -376,7 +748,8 @@ def load_adult_data(
     # rename column for clarity
     df = df.rename(columns={"shielded_since_feb_15": "newly_shielded_since_feb_15"})
 
-    # for each specific situation or condition, replace 1 with YES and 0 with no. This makes the graphs easier to read
+    # for each specific situation or condition, store whether it applies as a boolean. These are
+    # labelled "yes"/"no" when reported (see label_flags() in report_results.py)
     for c in [
         "2nd_dose",
         "LD",
@@ -398,30 +771,11 @@ def load_adult_data(
         "ckd",
         "imid",
     ]:
-        df[c] = np.where(df[c] == 1, "yes", "no")
+        if c in df.columns:
+            df[c] = df[c] == 1
 
     # get total population sizes and names for each STP
-    stps = pd.read_csv(
-        os.path.join("..", "lib", "stp_dict_total.csv"),
-        usecols=["stp_id", "name", "total_list_size"],
-    )
-    df = df.merge(stps, left_on="stp", right_on="stp_id", how="left").rename(
-        columns={"name": "stp_name"}
-    )
-
-    missing_stps = set(stps["name"]).difference(set(df["stp_name"]))
-    dummy_regex = re.compile(r"^Dummy STP \d+$")
-    missing_stps_final = [ele for ele in missing_stps if not dummy_regex.match(ele)]
-
-    if save_path:
-        with open(
-            os.path.join(save_path["text"], f"Missing_STPs.txt"), "w"
-        ) as text_file:
-            text_file.write(
-                f"{len(missing_stps_final)} STPs are not represented in our dataset."
-            )
-            for this_missing_stp in missing_stps_final:
-                text_file.write(f"\n- {this_missing_stp}")
+    df = map_stps(df)
 
     # drop additional columns
     df = df.drop(columns=["age"])
@@ -430,7 +784,52 @@ def load_adult_data(
 
 
 def load_child_data(
-    input_file="input_delivery_u16.csv.gz", input_path="output", save_path={}
+    input_file="input_delivery_u16.csv.gz",
+    input_path="output",
+    save_path={},
+    features=None,
+    use_cache=True,
+    chunksize=None,
+):
+    """
+    This reads in a csv that must be in output/ directory and cleans the
+    data ready for use in the graphs and tables. The data are relevant for reporting
+    vaccine coverage amongst CHILDREN.
+
+    The cleaned data are cached (see cache.py), so that later runs on the same extract
+    with the same cleaning code read the cached data rather than cleaning it again.
+
+    Args:
+        input_file (str): name of the input file. Default value is `input_delivery_u16.csv.gz'
+        input_path (str): folder in which to find the input file
+        save_path (dict): output directories, as returned by create_output_dirs(). If
+                          provided, a list of STPs missing from the data is saved.
+        features (list): demographic/clinical features needed for the reports (see clean_child_data())
+        use_cache (bool): whether to read and write cached data
+        chunksize (int): if given, the extract is read and cleaned this many patients at a
+                         time, so that the memory needed while cleaning is set by the chunk
+                         size rather than the size of the extract
+
+    Returns:
+        Dataframe (df): Process dataframe
+    """
+    return load_cleaned_data(
+        clean_child_data,
+        input_file=input_file,
+        input_path=input_path,
+        save_path=save_path,
+        features=features,
+        use_cache=use_cache,
+        missing_stp_bullet="1.",
+        chunksize=chunksize,
+    )
+
+
+def clean_child_data(
+    input_file="input_delivery_u16.csv.gz",
+    input_path="output",
+    features=None,
+    chunksize=None,
 ):
     """
     This reads in a csv that must be in output/ directory and cleans the
@@ -442,6 +841,12 @@ def load_child_data(
                           with columns representing various outcomes (covid vaccine dates),
                           demographics and clinical flags
         input_path (str): folder in which to find the input file
+        features (list): demographic/clinical features (as named in the processed data, e.g.
+                          "ethnicity_6_groups") needed for the reports. Only the columns needed for
+                          these, vaccination status and priority groups are read in. If None, all
+                          columns are read in.
+        chunksize (int): if given, the extract is read and cleaned this many patients at a time
+                          and the chunks are then put together
 
     Returns:
         Dataframe (df): Process dataframe
@@ -450,59 +855,116 @@ def load_child_data(
             processes
     """
 
-    # import data and fill nulls with 0
-    df = pd.read_csv(
-        os.path.join("..", input_path, input_file), compression="gzip"
-    ).fillna(0)
+    if chunksize:
+        return concat_chunks(
+            iter_child_data(input_file, input_path, features, chunksize=chunksize)
+        )
 
-    # fill unknown ethnicity from GP records with ethnicity from SUS (secondary care)
-    df.loc[df["ethnicity"] == 0, "ethnicity"] = df["ethnicity_6_sus"]
-    df.loc[df["ethnicity_16"] == 0, "ethnicity_16"] = df["ethnicity_16_sus"]
+    # import data, using the column types in the study definition, and fill nulls with 0
+    schema = read_study_definition_schema("study_definition_delivery_u16")
+    df = read_extract(
+        os.path.join("..", input_path, input_file),
+        study_definition="study_definition_delivery_u16",
+        columns=select_columns(
+            schema, CHILD_CORE_COLUMNS, features, FEATURE_SOURCE_COLUMNS
+        ),
+    )
+
+    return clean_child_extract(df)
+
+
+def iter_child_data(
+    input_file="input_delivery_u16.csv.gz",
+    input_path="output",
+    features=None,
+    chunksize=500000,
+):
+    """
+    This reads in a csv that must be in output/ directory in chunks of `chunksize' rows
+    and cleans each chunk in the same way as clean_child_data(). This is for extracts which
+    are too large to clean in one go: the chunks can be put together once they have been
+    cleaned (see load_child_data()), or summarised one at a time (see
+    streaming_cumulative_sums() in report_results.py).
+
+    Args:
+        input_file (str): name of the input file. Default value is `input_delivery_u16.csv.gz'
+        input_path (str): folder in which to find the input file
+        features (list): demographic/clinical features needed for the reports (see clean_child_data())
+        chunksize (int): number of patients in each chunk
+
+    Yields:
+        Dataframe (df): the next chunk of processed data
+    """
+    schema = read_study_definition_schema("study_definition_delivery_u16")
+    for df in iter_extract(
+        os.path.join("..", input_path, input_file),
+        study_definition="study_definition_delivery_u16",
+        columns=select_columns(
+            schema, CHILD_CORE_COLUMNS, features, FEATURE_SOURCE_COLUMNS
+        ),
+        chunksize=chunksize,
+    ):
+        check_one_row_per_patient(df)
+        yield clean_child_extract(df)
+
+
+def clean_child_extract(df):
+    """
+    This cleans child data which have been read in by read_extract() (or one chunk of them),
+    ready for use in the graphs and tables. Each patient is cleaned independently
+    of the others, so the data can be cleaned in chunks.
+
+    Args:
+        df (Dataframe): one-row-per-patient extract, as returned by read_extract()
+
+    Returns:
+        Dataframe (df): Process dataframe
+    """
 
+    # fill unknown ethnicity from GP records with ethnicity from SUS (secondary care)
     # convert ethnic categories to words. There are 2 ways of categorising - into
     # 6 groups or into 16 groups.
-    # this creates a new column called `ethnicity_6_groups`
-    df = map_ethnicity(df, columnname="ethnicity", number_of_groups=6)
+    if "ethnicity" in df.columns:
+        df.loc[df["ethnicity"] == 0, "ethnicity"] = df["ethnicity_6_sus"]
+
+        # this creates a new column called `ethnicity_6_groups`
+        df = map_ethnicity(df, columnname="ethnicity", number_of_groups=6)
+
+    if "ethnicity_16" in df.columns:
+        df.loc[df["ethnicity_16"] == 0, "ethnicity_16"] = df["ethnicity_16_sus"]
 
-    # this creates a new column called `ethnicity_16_groups`
-    df = map_ethnicity(df, columnname="ethnicity_16", number_of_groups=16)
+        # this creates a new column called `ethnicity_16_groups`
+        df = map_ethnicity(df, columnname="ethnicity_16", number_of_groups=16)
 
     # describe imd partially in words and make new column called `imd_categories` from `imd`
-    imd_lookup = {
-        0: "Unknown",
-        1: "1 Most deprived",
-        2: "2",
-        3: "3",
-        4: "4",
-        5: "5 Least deprived",
-    }
-    for level, category in imd_lookup.items():
-        df.loc[df["imd"] == level, "imd_categories"] = category
-    df["imd_categories"].fillna("Unknown")
+    if "imd" in df.columns:
+        df["imd_categories"] = map_categorical(df["imd"], IMD_CATEGORIES)
 
     # Assign vaccine status
     df = df.assign(
         covid_vacc_flag=np.where(
-            df["covid_vacc_date"] != 0, "vaccinated", "unvaccinated"
+            df["covid_vacc_date"] != NO_DATE, "vaccinated", "unvaccinated"
         ),
         # covid_vacc_flag_ox = np.where(df["covid_vacc_oxford_date"]!=0, 1, 0),
-        covid_vacc_flag_pfizerA=np.where(df["covid_vacc_pfizerA_date"] != 0, 1, 0),
-        covid_vacc_flag_pfizerC=np.where(df["covid_vacc_pfizerC_date"] != 0, 1, 0),
+        covid_vacc_flag_pfizerA=np.where(df["covid_vacc_pfizerA_date"] != NO_DATE, 1, 0),
+        covid_vacc_flag_pfizerC=np.where(df["covid_vacc_pfizerC_date"] != NO_DATE, 1, 0),
         # covid_vacc_flag_mod = np.where(df["covid_vacc_moderna_date"]!=0, 1, 0),
-        covid_vacc_flag_ox=np.where(df["covid_vacc_oxford_date"] != 0, 1, 0),
-        covid_vacc_flag_mod=np.where(df["covid_vacc_moderna_date"] != 0, 1, 0),
-        covid_vacc_2nd=np.where(df["covid_vacc_second_dose_date"] != 0, 1, 0),
-        covid_vacc_3rd=np.where(df["covid_vacc_third_dose_date"] != 0, 1, 0),
-        covid_vacc_bin=np.where(df["covid_vacc_date"] != 0, 1, 0),
+        covid_vacc_flag_ox=np.where(df["covid_vacc_oxford_date"] != NO_DATE, 1, 0),
+        covid_vacc_flag_mod=np.where(df["covid_vacc_moderna_date"] != NO_DATE, 1, 0),
+        covid_vacc_2nd=np.where(df["covid_vacc_second_dose_date"] != NO_DATE, 1, 0),
+        covid_vacc_3rd=np.where(df["covid_vacc_third_dose_date"] != NO_DATE, 1, 0),
+        covid_vacc_bin=np.where(df["covid_vacc_date"] != NO_DATE, 1, 0),
     )
 
     ### Adding an "other" category to capture Oxford-AZ and Moderna
     df["covid_vacc_other_date"] = np.maximum(
-        df["covid_vacc_oxford_date"].astype(str),
-        df["covid_vacc_moderna_date"].astype(str),
+        df["covid_vacc_oxford_date"], df["covid_vacc_moderna_date"]
     )
     df["covid_vacc_flag_other"] = np.where(
-        (df["covid_vacc_oxford_date"] != 0) | (df["covid_vacc_moderna_date"] != 0), 1, 0
+        (df["covid_vacc_oxford_date"] != NO_DATE)
+        | (df["covid_vacc_moderna_date"] != NO_DATE),
+        1,
+        0,
     )
 
     # Create a single field for brand of first and second dose
@@ -515,11 +977,9 @@ def load_child_data(
         "Unknown",
     ]
 
-    ### This uses the new function `make_conditions()' which generates the
-    ### conditions programmatically. We generate dictionaries for the 1st and 2nd,
-    ### and then the 3rd doses, join them and then evaluate them against the `choices'
-    ### parameter using np.select() to identify to which brand each entry pertains.
-    conditions_2nd = make_conditions(
+    ### This uses resolve_brands() to identify to which brand each dose pertains,
+    ### for the 1st and 2nd and then the 3rd doses.
+    brands = resolve_brands(
         df,
         dose_list={"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"},
         vaccine_dates={
@@ -528,23 +988,29 @@ def load_child_data(
             "covid_vacc_oxford_date": "2021-08-04",
             "covid_vacc_moderna_date": "2021-08-04",
         },
+        choices=choices,
+        ### as when these conditions were built by make_conditions(), a second dose of
+        ### unknown brand is identified from the date of the first dose
+        field_to_check_for_unknown="covid_vacc_date",
     )
 
-    conditions_3rd = make_conditions(
-        df,
-        dose_list={"third": None},
-        vaccine_dates={
-            "covid_vacc_third_dose_pfizerC_date": None,
-            "covid_vacc_third_dose_pfizerA_date": None,
-            "covid_vacc_third_dose_oxford_date": None,
-            "covid_vacc_third_dose_moderna_date": None,
-        },
-        field_to_check_for_unknown="covid_vacc_third_dose_pfizerC_date",
+    brands.update(
+        resolve_brands(
+            df,
+            dose_list={"third": None},
+            vaccine_dates={
+                "covid_vacc_third_dose_pfizerC_date": None,
+                "covid_vacc_third_dose_pfizerA_date": None,
+                "covid_vacc_third_dose_oxford_date": None,
+                "covid_vacc_third_dose_moderna_date": None,
+            },
+            choices=choices,
+            field_to_check_for_unknown="covid_vacc_third_dose_pfizerC_date",
+        )
     )
 
-    all_conditions = {**conditions_2nd, **conditions_3rd}
-    for k, v in all_conditions.items():
-        df[f"brand_of_{k}_dose"] = np.select(v, choices, default="none")
+    for k, v in brands.items():
+        df[f"brand_of_{k}_dose"] = v
         df[f"brand_of_{k}_dose"] = df[f"brand_of_{k}_dose"].str.replace(
             r"Oxford-AZ|Moderna", "Other", regex=True
         )
@@ -597,16 +1063,17 @@ def load_child_data(
     # create an additional field for 2nd dose to use as a flag for each eligible group
     df["2nd_dose"] = df["covid_vacc_2nd"]
 
-    # Replace a region and STP with a value `0` with Unknown
-    df = df.assign(
-        region=df["region"].replace(0, "Unknown"), stp=df["stp"].replace(0, "Unknown")
-    )
+    # (a missing region or STP is read in as `Unknown')
 
     # Replace `I` or `U` for sex with `Other/Unknown`
-    df = df.assign(sex=df["sex"].replace(["I", "U"], "Other/Unknown"))
+    if "sex" in df.columns:
+        df["sex"] = map_categorical(
+            df["sex"], {"I": "Other/Unknown", "U": "Other/Unknown"}, keep_unmapped=True
+        )
 
     # categorise BMI into obese (i.e. BMI >=30) or non-obese (<30)
-    df = df.assign(bmi=np.where((df["bmi"] == "Not obese"), "under 30", "30+"))
+    if "bmi" in df.columns:
+        df = df.assign(bmi=np.where((df["bmi"] == "Not obese"), "under 30", "30+"))
 
     # drop unnecessary columns or columns created for processing
     df = df.drop(
@@ -617,7 +1084,8 @@ def load_child_data(
             "ethnicity_6_sus",
             "ethnicity_16_sus",
             "has_follow_up",
-        ]
+        ],
+        errors="ignore",
     )
 
     # categorise into priority groups
@@ -630,36 +1098,19 @@ def load_child_data(
     df["priority_group"] = np.select(conditions, choices, default=0)
 
     # group into broad priority groups vs others
-    df["risk_status"] = np.where(
-        (df["child_atrisk"] == 1), "In a risk group", "Not in a risk group"
-    )
+    if "child_atrisk" in df.columns:
+        df["risk_status"] = np.where(
+            (df["child_atrisk"] == 1), "In a risk group", "Not in a risk group"
+        )
 
-    # for each specific situation or condition, replace 1 with YES and 0 with no. This makes the graphs easier to read
+    # for each specific situation or condition, store whether it applies as a boolean. These are
+    # labelled "yes"/"no" when reported (see label_flags() in report_results.py)
     for c in ["2nd_dose", "LD"]:
-        df[c] = np.where(df[c] == 1, "yes", "no")
+        if c in df.columns:
+            df[c] = df[c] == 1
 
     # get total population sizes and names for each STP
-    stps = pd.read_csv(
-        os.path.join("..", "lib", "stp_dict_total.csv"),
-        usecols=["stp_id", "name", "total_list_size"],
-    )
-    df = df.merge(stps, left_on="stp", right_on="stp_id", how="left").rename(
-        columns={"name": "stp_name"}
-    )
-
-    missing_stps = set(stps["name"]).difference(set(df["stp_name"]))
-    dummy_regex = re.compile(r"^Dummy STP \d+$")
-    missing_stps_final = [ele for ele in missing_stps if not dummy_regex.match(ele)]
-
-    if save_path:
-        with open(
-            os.path.join(save_path["text"], f"Missing_STPs.txt"), "w"
-        ) as text_file:
-            text_file.write(
-                f"{len(missing_stps_final)} STPs are not represented in our dataset."
-            )
-            for this_missing_stp in missing_stps_final:
-                text_file.write(f"\n1. {this_missing_stp}")
+    df = map_stps(df)
 
     # drop additional columns
     df = df.drop(columns=["age"])
@@ -670,7 +1121,7 @@ def load_child_data(
 def map_ethnicity(df, columnname, number_of_groups):
     """
     This maps the numerical value in the dataframe to the ethnicity categories. It creates
-    a new column called ethnicity_(number_of_groups)_groups. For example, ethnicity_6_groups.
+    a new (categorical) column called ethnicity_(number_of_groups)_groups. For example, ethnicity_6_groups.
 
     Args:
         df (Dataframe): your dataframe of interest,
@@ -681,7 +1132,26 @@ def map_ethnicity(df, columnname, number_of_groups):
     Returns:
         Dataframe (df): Processed dataframe with a column added containing the name for each ethnicity category
     """
+    new_ethnicity_column_name = f"ethnicity_{number_of_groups}_groups"
+    df[new_ethnicity_column_name] = map_categorical(
+        df[columnname].fillna(0), ethnicity_lookup(number_of_groups)
+    )
+
+    return df
+
 
+@lru_cache(maxsize=None)
+def ethnicity_lookup(number_of_groups):
+    """
+    Gives the name of each ethnicity category. The lookup for 16 groups is only read
+    in once.
+
+    Args:
+        number_of_groups (int): Either 6 or 16
+
+    Returns:
+        ethnicity_dict (dict): a dict, where keys are ethnicity codes and values are names
+    """
     if number_of_groups == 6:
         ethnicity_dict = {
             0: "Unknown",
@@ -692,20 +1162,87 @@ def map_ethnicity(df, columnname, number_of_groups):
             5: "Other",
         }
     elif number_of_groups == 16:
-        ethnicity_lookup = pd.read_csv(
+        ethnicity_16_lookup = pd.read_csv(
             os.path.join("..", "analysis", "ethnicity_16_lookup.csv")
         ).to_dict("index")
         ethnicity_dict = {0: "Unknown"}
-        for row, data in ethnicity_lookup.items():
+        for row, data in ethnicity_16_lookup.items():
             ethnicity_dict[(int(data["code"]))] = data["name"]
     else:
         raise DataCleaningError(
-            message="You have provided a non-supported number of categories (only 6 or 16 are supported)"
+            "You have provided a non-supported number of categories (only 6 or 16 are supported)"
         )
 
-    new_ethnicity_column_name = f"ethnicity_{number_of_groups}_groups"
-    df[new_ethnicity_column_name] = [
-        ethnicity_dict[x] for x in df[columnname].fillna(0).astype(int)
-    ]
+    return ethnicity_dict
+
+
+@lru_cache(maxsize=None)
+def stp_lookup():
+    """
+    Reads in the names and total population sizes of each STP (only once).
+
+    Returns:
+        Dataframe (stps): with columns "stp_id", "name" and "total_list_size"
+    """
+    return pd.read_csv(
+        os.path.join("..", "lib", "stp_dict_total.csv"),
+        usecols=["stp_id", "name", "total_list_size"],
+    )
+
+
+def map_stps(df):
+    """
+    Adds the name (`stp_name') and total population size (`total_list_size') of each
+    patient's STP, as well as `stp_id', which is blank where the STP is not known.
+
+    Args:
+        df (Dataframe): with one row per patient and a column `stp' containing STP codes
+
+    Returns:
+        Dataframe (df): with the STP fields added
+    """
+    stps = stp_lookup()
+    df["stp_id"] = map_categorical(df["stp"], dict(zip(stps["stp_id"], stps["stp_id"])))
+    df["stp_name"] = map_categorical(df["stp"], dict(zip(stps["stp_id"], stps["name"])))
+
+    ### look up the list size for each STP code once, rather than for each patient
+    stp = df["stp"].astype("category")
+    list_sizes = stps.set_index("stp_id")["total_list_size"].astype(float)
+    category_sizes = list_sizes.reindex(stp.cat.categories).to_numpy()
+    df["total_list_size"] = np.append(category_sizes, np.nan)[stp.cat.codes]
 
     return df
+
+
+def map_categorical(values, lookup, keep_unmapped=False):
+    """
+    Maps values (e.g. ethnicity codes) to names using a lookup, giving a pandas
+    Categorical. Only the distinct values are looked up, and the names are only
+    stored once rather than for every patient. Categories are sorted (and ordered) so
+    that groupby() orders them as it would text.
+
+    Args:
+        values (Series): values to map. If these are not already categorical, they
+                         are converted first.
+        lookup (dict): a dict, where keys are values and values are names
+        keep_unmapped (bool): whether values missing from the lookup keep their own
+                         name (True), or are set to missing (False)
+
+    Returns:
+        Categorical: the name for each value
+    """
+    values = values.astype("category")
+    categories = values.cat.categories
+
+    names = [
+        lookup.get(c, c if keep_unmapped else None) for c in categories
+    ]
+    new_categories = sorted({n for n in names if n is not None})
+    position = {n: i for i, n in enumerate(new_categories)}
+
+    ### the code for each existing category (with -1, for missing values, last)
+    code_map = np.array([position.get(n, -1) for n in names] + [-1])
+
+    return pd.Categorical.from_codes(
+        code_map[values.cat.codes.to_numpy()], categories=new_categories, ordered=True
+    )
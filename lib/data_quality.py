@@ -18,7 +18,7 @@ def ethnicity_completeness(df, groups_of_interest, savepath=DEFAULT):
     
     Inputs:
     df (dataframe): processed patient-level dataframe containing "ethnicity_6_groups" column,
-                    as well as "group"&""group_name" (to identify vaccine priority group) and "patient_id" (for counting)
+                    as well as "group_name" (to identify vaccine priority group) and "patient_id" (for counting)
     groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
     savepath (string): an optional directory to which the results should be written (if not present, the function create_output_dirs() will create this)
 
@@ -26,25 +26,23 @@ def ethnicity_completeness(df, groups_of_interest, savepath=DEFAULT):
     displays string describing n and % of given group with ethnicity known
     
     '''
-    # create copy of df only with cols of interest
-    cols = ["group", "group_name", "ethnicity_6_groups","patient_id"]   
-    
     ethnicity_coverage = pd.DataFrame(columns=["group", "n with ethnicity", "total population (n)", "ethnicity coverage (%)"])
     
     if ( savepath is DEFAULT ):
         # export ethnicity coverage stats to text file
         savepath, _, _ = create_output_dirs()
 
+    # count patients in each group, and with each ethnicity in each group, grouping the
+    # patient ids by the other columns rather than filtering a copy of the data for each group
+    patients = df["patient_id"]
+    totals = patients.groupby(df["group_name"]).nunique()
+    by_ethnicity = patients.groupby([df["group_name"], df["ethnicity_6_groups"]], observed=True).nunique()
+    known = by_ethnicity.loc[by_ethnicity.index.get_level_values("ethnicity_6_groups")!="Unknown"].groupby(level="group_name").sum()
+
     for i, (groupname, groupno) in enumerate(groups_of_interest.items()):
-        out = df[cols].copy()
-        # filter dataframe to eligible group
-        out = out.loc[(out["group_name"]==groupname)]
-        
-        total = round7(out["patient_id"].nunique())
+        total = round7(totals.get(groupname, 0))
 
-        known_eth = out.groupby("ethnicity_6_groups")[["patient_id"]].nunique().reset_index()
-        known_eth = known_eth.loc[known_eth["ethnicity_6_groups"]!="Unknown"]["patient_id"].sum()
-        known_eth = round7(known_eth)
+        known_eth = round7(known.get(groupname, 0))
         percent = round(100*(known_eth/total), 1)
         
         ethnicity_coverage.loc[i] = [groupname, known_eth, total, percent]
@@ -0,0 +1,196 @@
+""" This module converts dates to and from `campaign days', the integer representation of dates used throughout the library"""
+
+# Import statements
+import numpy as np
+import pandas as pd
+
+
+# Dates are held as the number of days since the start of the vaccination campaign
+# (dates before the campaign started are negative)
+CAMPAIGN_START = np.datetime64("2020-12-08", "D")
+
+# Value given to missing dates - earlier than any real date, so that a missing date
+# compares as it did when missing dates were converted to 1970-01-01
+NO_DATE = np.iinfo(np.int32).min
+
+# Grains at which tables of cumulative figures can be shown, and how they are described
+GRAINS = {"day": "daily", "week": "weekly", "month": "monthly"}
+
+
+def to_campaign_days(dates):
+    """
+    Converts a column of dates, as read from an extract, into campaign days.
+
+    Args:
+        dates (Series): "YYYY-MM-DD" strings. Missing dates may be NaN or 0.
+
+    Returns:
+        days (np.array): int32 array of campaign days, with NO_DATE where the date is missing
+    """
+    dates = pd.Series(dates)
+    dates = dates.where(dates.notna() & (dates.astype(str) != "0"))
+    values = pd.to_datetime(dates, format="%Y-%m-%d").to_numpy().astype("datetime64[D]")
+
+    return np.where(
+        np.isnat(values), NO_DATE, (values - CAMPAIGN_START).astype(np.int64)
+    ).astype(np.int32)
+
+
+def campaign_day(date):
+    """
+    Converts a single date into a campaign day. Campaign days (ints) are returned unchanged.
+
+    Args:
+        date (str, int, datetime or None): e.g. "2021-03-01". None gives NO_DATE.
+
+    Returns:
+        day (int): the campaign day
+    """
+    if date is None:
+        return NO_DATE
+    if isinstance(date, (int, np.integer)):
+        return int(date)
+    return int((np.datetime64(pd.Timestamp(date), "D") - CAMPAIGN_START).astype(int))
+
+
+# Lengths of the units in which delays between doses can be given (e.g. "14 weeks")
+DAYS_PER_UNIT = {"days": 1, "weeks": 7}
+
+
+def delay_in_days(delay):
+    """
+    Converts a delay between doses into a number of days.
+
+    Args:
+        delay (str or int): e.g. "14 weeks" or "91 days". Ints are taken to be days already.
+
+    Returns:
+        days (int): the length of the delay in days
+    """
+    if isinstance(delay, (int, np.integer)):
+        return int(delay)
+    number, unit = delay.split()
+    if unit not in DAYS_PER_UNIT:
+        raise ValueError(f"invalid unit {unit!r} in delay {delay!r}")
+    return int(number) * DAYS_PER_UNIT[unit]
+
+
+def campaign_date(day, date_format="%Y-%m-%d"):
+    """
+    Converts a campaign day back into a date string, e.g. for titles and file contents.
+
+    Args:
+        day (int): the campaign day
+        date_format (str): strftime format of the output
+
+    Returns:
+        date (str): the formatted date
+    """
+    return pd.Timestamp(CAMPAIGN_START + np.timedelta64(int(day), "D")).strftime(
+        date_format
+    )
+
+
+def campaign_dates(days, date_format="%Y-%m-%d", missing=0):
+    """
+    Converts campaign days back into date strings, e.g. for the index of a table being
+    written to csv or the labels of a chart.
+
+    Args:
+        days (array or Index): campaign days
+        date_format (str): strftime format of the output
+        missing: value given to missing dates (NO_DATE)
+
+    Returns:
+        dates (np.array): the formatted dates (as objects)
+    """
+    days = np.asarray(days)
+    is_missing = days == NO_DATE
+    dates = CAMPAIGN_START + np.where(is_missing, 0, days).astype("timedelta64[D]")
+
+    if date_format == "%Y-%m-%d":
+        formatted = np.datetime_as_string(dates, unit="D").astype(object)
+    else:
+        formatted = pd.DatetimeIndex(dates).strftime(date_format).to_numpy(dtype=object)
+
+    formatted[is_missing] = missing
+    return formatted
+
+
+def with_date_index(df, date_format="%Y-%m-%d"):
+    """
+    Gives a copy of a table indexed by campaign day (e.g. cumulative sums) with
+    the index converted to date strings, for writing to csv or plotting.
+
+    Args:
+        df (Dataframe): indexed by campaign day
+        date_format (str): strftime format of the dates
+
+    Returns:
+        Dataframe: indexed by date string, with the same index name
+    """
+    out = df.copy()
+    out.index = pd.Index(
+        campaign_dates(df.index, date_format=date_format), name=df.index.name
+    )
+    return out
+
+
+def daily_calendar(out, last_day=None):
+    """
+    Puts a table of cumulative figures, indexed by campaign day with rows only for the days
+    on which anyone was vaccinated, onto a dense calendar with a row for every day from its
+    first day to last_day. Cumulative figures are carried forward over the days in between,
+    so that the figures on any day (e.g. the latest date, and 7 days before) can be looked
+    up directly for every column at once.
+
+    Args:
+        out (Dataframe or Series): indexed by campaign day, in order
+        last_day (int): last day of the calendar (default: the last day in out)
+
+    Returns:
+        calendar (Dataframe or Series): indexed by every campaign day from the first day in out to last_day
+    """
+    if last_day is None:
+        last_day = out.index.max()
+    first_day = out.index.min() if len(out) > 0 else last_day
+
+    return out.reindex(
+        pd.RangeIndex(first_day, last_day + 1, name=out.index.name), method="ffill"
+    )
+
+
+def roll_up(out, grain="day", last_day=None):
+    """
+    Rolls a table of cumulative figures, indexed by campaign day, up to a coarser grain by
+    keeping only the figures at the end of each ISO week (Monday to Sunday) or calendar month,
+    and on the last day (the end of the period still in progress). As the figures are
+    cumulative, nothing is lost from them other than the days in between. The rows are picked
+    out of the daily calendar by position (every 7th day for weeks), without grouping.
+
+    Args:
+        out (Dataframe or Series): indexed by campaign day, in order
+        grain (str): "day" (out is returned unchanged), "week" or "month"
+        last_day (int): last day of the calendar (default: the last day in out)
+
+    Returns:
+        rolled_up (Dataframe or Series): indexed by the campaign day at the end of each period
+    """
+    if grain not in GRAINS:
+        raise ValueError(f"invalid grain {grain!r}, should be one of {list(GRAINS)}")
+    if grain == "day" or len(out) == 0:
+        return out
+
+    calendar = daily_calendar(out, last_day)
+    dates = CAMPAIGN_START + calendar.index.to_numpy().astype("timedelta64[D]")
+    if grain == "week":
+        # days since the Monday (1970-01-05) before the first day, so Sundays are 6 days on
+        weekday = int((dates[0] - np.datetime64("1970-01-05", "D")).astype(int)) % 7
+        ends = np.arange((6 - weekday) % 7, len(calendar), 7)
+    else:
+        months = dates.astype("datetime64[M]")
+        ends = np.flatnonzero(months[1:] != months[:-1])
+    if len(ends) == 0 or ends[-1] != len(calendar) - 1:
+        ends = np.append(ends, len(calendar) - 1)
+
+    return calendar.iloc[ends]
@@ -0,0 +1,82 @@
+""" This module applies statistical disclosure control to counts of patients before they are released: low numbers are suppressed and all numbers are rounded, in a single vectorised pass over a whole table (or column) of counts at a time"""
+
+# Import statements
+import numpy as np
+import pandas as pd
+
+
+# Counts of between 1 and SUPPRESSION_THRESHOLD patients are suppressed (replaced by 0)
+SUPPRESSION_THRESHOLD = 6
+
+# Counts are rounded to the nearest multiple of ROUNDING_BASE
+ROUNDING_BASE = 7
+
+
+def low_counts(counts, threshold=SUPPRESSION_THRESHOLD):
+    """
+    Finds the counts which are too low to be released.
+
+    Args:
+        counts (np.array): counts of patients
+        threshold (int): the highest count to suppress
+
+    Returns:
+        np.array: boolean, True for counts of between 1 and threshold
+    """
+    counts = np.asarray(counts, dtype=float)
+    return (counts > 0) & (counts <= threshold)
+
+
+def round_to_base(counts, base=ROUNDING_BASE):
+    """
+    Rounds counts to the nearest multiple of base.
+
+    Args:
+        counts (int/float/np.array/Series/Dataframe): counts of patients
+        base (int): e.g. 7
+
+    Returns:
+        int (for a single count), or floats of the same shape as counts
+    """
+    return _apply(counts, lambda values: base * np.round(values / base))
+
+
+def suppress_and_round(counts, threshold=SUPPRESSION_THRESHOLD, base=ROUNDING_BASE):
+    """
+    Suppresses low counts and rounds the others to the nearest multiple of base. Missing
+    counts (where there were no patients) are treated as 0.
+
+    Args:
+        counts (int/float/np.array/Series/Dataframe): counts of patients
+        threshold (int): the highest count to suppress
+        base (int): e.g. 7
+
+    Returns:
+        int (for a single count), or floats of the same shape as counts
+    """
+
+    def control(values):
+        values = np.where(np.isnan(values) | low_counts(values, threshold), 0, values)
+        return base * np.round(values / base)
+
+    return _apply(counts, control)
+
+
+def _apply(counts, function):
+    """
+    Applies a function (of an array of floats) to counts, returning the result in the
+    same form as the counts.
+    """
+    if isinstance(counts, pd.DataFrame):
+        return pd.DataFrame(
+            function(counts.to_numpy(dtype=float)),
+            index=counts.index,
+            columns=counts.columns,
+        )
+    if isinstance(counts, pd.Series):
+        return pd.Series(
+            function(counts.to_numpy(dtype=float)), index=counts.index, name=counts.name
+        )
+    if np.ndim(counts) == 0:
+        return int(function(np.asarray(counts, dtype=float)))
+    return function(np.asarray(counts, dtype=float))
@@ -0,0 +1,105 @@
+""" This module runs parts of the analysis in a pool of worker processes. The columns the workers need are written once to memory-mapped files, so each worker reads only the rows it needs rather than being sent a copy of the whole dataframe"""
+
+# Import statements
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_N_WORKERS = 1
+
+
+def write_columns(columns, folder):
+    """
+    Writes columns of data to .npy files, to be read by worker processes with read_columns().
+    Categories (and text) are written as integer codes.
+
+    Args:
+        columns (dict): a mapping from column names to Series (or arrays)
+        folder (str): folder in which to write the files (e.g. a temporary folder)
+
+    Returns:
+        store (dict): a mapping from column names to the file holding the column and what is
+                      needed to turn the values read from it back into the column
+    """
+    store = {}
+    for i, (name, values) in enumerate(columns.items()):
+        path = os.path.join(folder, f"column_{i}.npy")
+        values = pd.Series(values)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(path, values.cat.codes.to_numpy())
+            store[name] = (path, "category", values.dtype)
+        elif values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            np.save(path, codes)
+            # missing values have the code -1, i.e. the last of the values
+            store[name] = (path, "object", np.append(uniques.to_numpy(dtype=object), np.nan))
+        else:
+            np.save(path, values.to_numpy())
+            store[name] = (path, None, None)
+
+    return store
+
+
+def read_columns(store, names, rows=None):
+    """
+    Reads columns written by write_columns(), memory-mapping the files so that only the
+    rows asked for are read.
+
+    Args:
+        store (dict): as returned by write_columns()
+        names (list): names of the columns to read
+        rows (np.array): positions of the rows to read (or None for all of them)
+
+    Returns:
+        df (Dataframe): the columns
+    """
+    columns = {}
+    for name in names:
+        path, kind, extra = store[name]
+        values = np.load(path, mmap_mode="r")
+        values = np.asarray(values if rows is None else values[rows])
+        if kind == "category":
+            columns[name] = pd.Categorical.from_codes(values, dtype=extra)
+        elif kind == "object":
+            columns[name] = extra[values]
+        else:
+            columns[name] = values
+
+    return pd.DataFrame(columns)
+
+
+def map_in_workers(function, tasks, n_workers):
+    """
+    Calls a function for each task in a pool of worker processes. The results are
+    returned in the order of the tasks, whichever worker finishes first.
+
+    Args:
+        function: a module-level function (so that workers can find it) taking one task
+        tasks (list): arguments for each call, e.g. the store returned by write_columns()
+                      and the rows or features to work on
+        n_workers (int): number of worker processes
+
+    Returns:
+        results (list): the result for each task
+    """
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(function, tasks))
+
+
+def pick_n_workers():
+    """
+    Number of worker processes to use, from the N_WORKERS environment variable (set for
+    an action in project.yaml), and no more than the number of cpus available.
+
+    Returns:
+        n_workers (int): 1 (the default) to do all the work in this process
+    """
+    n_workers = os.environ.get("N_WORKERS", str(DEFAULT_N_WORKERS))
+    if not n_workers.isdigit() or int(n_workers) < 1:
+        raise ValueError(
+            f"Unknown N_WORKERS '{n_workers}', you must specify a whole number of at least 1"
+        )
+    return min(int(n_workers), os.cpu_count() or 1)
@@ -0,0 +1,145 @@
+""" This module works out recent uptake of vaccines and projects the dates on which coverage will reach its targets (e.g. 90%), for many series of cumulative figures (e.g. the percentage vaccinated in each category of every feature) in a single array operation"""
+
+# Import statements
+import numpy as np
+import pandas as pd
+
+from dates import campaign_dates, campaign_day
+
+
+# Coverage (percent) which each series is projected to reach
+TARGETS = [90]
+
+# Projections further ahead than this are assumed to be based on too little data to tell
+HORIZON_WEEKS = 25
+
+
+def series_calendar(tables, last_day):
+    """
+    Puts many tables of cumulative figures, indexed by campaign day (each with rows only for
+    the days on which anyone was vaccinated), side by side on one dense calendar with a row
+    for every day up to last_day. Figures are carried forward over the days in between.
+
+    Args:
+        tables (dict): tables of cumulative figures e.g. {category: df_dict_cum[group][category]}
+        last_day (int): last day of the calendar (campaign day)
+
+    Returns:
+        calendar (Dataframe): indexed by campaign day, with columns labelled by (key, column)
+        first_days, last_days (np.array): the first and last day in the table of each column
+    """
+    keys = list(tables)
+    days = [tables[key].index for key in keys]
+    widths = [tables[key].shape[1] for key in keys]
+    first_days = np.repeat([d.min() for d in days], widths)
+    last_days = np.repeat([d.max() for d in days], widths)
+
+    calendar_days = pd.RangeIndex(first_days.min(), max(last_day, last_days.max()) + 1)
+    calendar = pd.concat(
+        [tables[key].reindex(calendar_days, method="ffill") for key in keys],
+        axis=1,
+        keys=keys,
+    )
+    return calendar, first_days, last_days
+
+
+def projected_dates(
+    current, rate, from_days, target, days=7, horizon_weeks=HORIZON_WEEKS
+):
+    """
+    Projects the date on which each series will reach a target, if it carries on rising at
+    its recent rate.
+
+    Args:
+        current (np.array): the latest coverage of each series (percent)
+        rate (np.array): the rise in coverage of each series over the last `days' days
+        from_days (np.array): the campaign day from which each series is projected
+        target (float): e.g. 90 (percent)
+        days (int): the number of days over which the rate was measured
+        horizon_weeks (float): series not projected to reach the target within this many
+                               weeks are labelled "unknown"
+
+    Returns:
+        dates (np.array): "reached" where the target has already been reached (or coverage is
+                          falling), the date ("dd-Mon") on which it is projected to be reached,
+                          or "unknown"
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        periods = (target - np.asarray(current, dtype=float)) / np.asarray(
+            rate, dtype=float
+        )
+    reached = periods <= 0
+    projected = ~reached & (periods * days < horizon_weeks * 7)
+
+    # whole days until the target is reached (as timedelta(days=...).days, to the microsecond)
+    day_length = 86400e6
+    days_to_target = np.floor_divide(
+        np.round(np.where(projected, periods, 0) * days * day_length), day_length
+    )
+    on_day = np.asarray(from_days) + days_to_target.astype(np.int64)
+
+    out = np.full(len(periods), "unknown", dtype=object)
+    out[reached] = "reached"
+    out[projected] = campaign_dates(on_day[projected], "%d-%b")
+    return out
+
+
+def uptake_projections(
+    tables,
+    latest_date,
+    days=7,
+    targets=TARGETS,
+    horizon_weeks=HORIZON_WEEKS,
+):
+    """
+    Works out, for every column of every table of cumulative figures, the uptake over the last
+    `days' days, the growth in uptake and the dates on which the targets are projected to be
+    reached. All the series are handled at once, so a whole set of cumulative sums (e.g. every
+    feature of every group) can be passed in one go.
+
+    Args:
+        tables (dict): tables of cumulative figures indexed by campaign day, e.g.
+                       {category: df_dict_cum[group][category]} (percentages, for projections)
+        latest_date (int or str): latest date across dataset, as a campaign day or in YYYY-MM-DD format
+        days (int): the number of days over which uptake is measured
+        targets (list): coverage (percent) which each series is projected to reach e.g. [75, 90, 95]
+        horizon_weeks (float): projections further ahead than this are labelled "unknown"
+
+    Returns:
+        out (Dataframe): indexed by (key, column) of each series, with its figure `days' days
+                         before the last day in its table ("previous"), the uptake since then
+                         ("uptake"), the uptake as a percentage of the previous figure ("growth (%)")
+                         and the date projected to reach each target ("reach {target}%")
+    """
+    latest_date = campaign_day(latest_date)
+    calendar, first_days, last_days = series_calendar(tables, latest_date)
+    values = calendar.to_numpy(dtype=float)
+    series = np.arange(values.shape[1])
+
+    # the figures at the latest date, and `days' days before the last day of each table
+    # (or its first day, if the table does not go back that far)
+    first_day = calendar.index[0]
+    if latest_date >= first_day:
+        current = values[latest_date - first_day, series]
+    else:
+        # no figures yet on the latest date (rather than reading from the end of the
+        # calendar), so nothing is projected, as for tables which start after it
+        current = np.full(len(series), np.nan)
+    previous_days = np.maximum(last_days - days, first_days)
+    previous = values[previous_days - first_day, series]
+
+    change = current - previous
+    uptake = np.round(np.where(np.isnan(change), 0, change), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = uptake / previous
+    growth = np.round(100 * np.where(np.isnan(growth), 0, growth), 1)
+
+    out = pd.DataFrame(
+        {"previous": previous, "uptake": uptake, "growth (%)": growth},
+        index=calendar.columns,
+    )
+    for target in targets:
+        out[f"reach {target}%"] = projected_dates(
+            current, uptake, last_days, target, days, horizon_weeks
+        )
+    return out
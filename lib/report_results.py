@@ -2,11 +2,46 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
-import copy
+import tempfile
 
-from datetime import datetime
 from IPython.display import display, Markdown
 
+from dates import (
+    GRAINS,
+    NO_DATE,
+    campaign_date,
+    campaign_dates,
+    campaign_day,
+    daily_calendar,
+    delay_in_days,
+    roll_up,
+    with_date_index,
+)
+from disclosure_control import round_to_base, suppress_and_round
+from parallel import map_in_workers, read_columns, write_columns
+from projections import HORIZON_WEEKS, TARGETS, uptake_projections
+
+
+# Labels used in tables and charts for clinical flags (e.g. dementia), which are stored as booleans
+FLAG_LABELS = {False: "no", True: "yes"}
+
+
+def label_flags(levels):
+    """
+    Labels the levels of a clinical flag as "yes"/"no" for reporting. Flags are
+    held as booleans in the processed data, so that they take up little memory
+    and are quick to group by; other kinds of level are returned unchanged.
+
+    Args:
+        levels (Index): levels of a feature, e.g. the columns of a table of cumulative sums
+
+    Returns:
+        Index: the levels, labelled "yes"/"no" if they were booleans
+    """
+    if pd.api.types.is_bool_dtype(levels):
+        return levels.map(FLAG_LABELS)
+    return levels
+
 
 def create_output_dirs(subfolder=None):
     """
@@ -84,14 +119,16 @@ def find_and_save_latest_date(df, savepath, reference_column_name="covid_vacc_da
     reference_column_name (str): column of dates in which to find latest date
 
     Returns:
-    latest_date (str): "%Y-%m-%d"
+    latest_date (int): campaign day (see dates.py)
     latest_date_fmt (str): "%d %b %Y"
     """
     # query the data frame and pull out the latest date
-    latest_date = df[df[reference_column_name] != 0][reference_column_name].max()
+    latest_date = int(
+        df.loc[df[reference_column_name] != NO_DATE, reference_column_name].max()
+    )
 
     # change that date into a better and more readable format for graphs
-    latest_date_fmt = datetime.strptime(latest_date, "%Y-%m-%d").strftime("%d %b %Y")
+    latest_date_fmt = campaign_date(latest_date, "%d %b %Y")
 
     with open(os.path.join(savepath["text"], "latest_date.txt"), "w") as text_file:
         text_file.write(latest_date_fmt)
@@ -125,6 +162,8 @@ def cumulative_sums(
     latest_date,
     reference_column_name="covid_vacc_date",
     all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    n_workers=1,
+    groups=None,
 ):
     """
     Calculate cumulative sums across groups.
@@ -134,53 +173,880 @@ def cumulative_sums(
         df (dataframe): input data
         groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
         features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
-        latest_date (str): "YYYY-MM-DD"
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
         reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+        n_workers (int): number of worker processes among which to share the features (1 to count them all in this process)
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
 
     Returns:
         df_dict_out (dict): This dict is a mapping from a group name (e.g '80+') to another dict, which is a mapping from a feature name (e.g. 'sex') to a dataframe containing cumulative sums of vaccination data per day.
     """
 
-    # Creates an empty dict to collect results as passes through function
-    df_dict_out = {}
-
-    # for each group within the desired groups, it filters to that particular group. it
-    # also selects columns of interest. For example, in care home, we are interested in
+    # For each group within the desired groups, patients are counted by each of the
+    # features of interest for that group. For example, in care home, we are interested in
     # sex, ageband and broad ethnicity groups. In the analysis of age bands we are interested
     # in much more detail such as comorbidities and ethnicity in 16 groups.
+    # All the groups are counted together, in a single pass over the data for each feature.
+    partial = partial_cumulative_sums(
+        df,
+        groups_of_interest,
+        features_dict,
+        reference_column_name=reference_column_name,
+        all_keys=all_keys,
+        n_workers=n_workers,
+        groups=groups,
+    )
+
+    return cumulative_sums_from_partials(
+        partial, latest_date, reference_column_name=reference_column_name
+    )
+
+
+def cumulative_sums_by_dose(
+    df,
+    groups_of_interest,
+    features_dict,
+    latest_date,
+    reference_column_names=["covid_vacc_date"],
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    n_workers=1,
+    groups=None,
+):
+    """
+    Calculate cumulative sums across groups for several doses, in a single pass over the
+    data. The groups, and the total number of patients in each group and subgroup, are
+    worked out once for all the doses.
+
+    Args:
+        df (dataframe): input data
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
+        reference_column_names (list): e.g. ["covid_vacc_date", "covid_vacc_second_dose_date", "covid_vacc_third_dose_date"]
+        n_workers (int): number of worker processes among which to share the features (1 to count them all in this process)
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        df_dict_out (dict): a mapping from each dose to the cumulative sums for that dose, as returned by cumulative_sums()
+    """
+    partial = partial_cumulative_sums_by_dose(
+        df,
+        groups_of_interest,
+        features_dict,
+        reference_column_names=reference_column_names,
+        all_keys=all_keys,
+        n_workers=n_workers,
+        groups=groups,
+    )
+
+    return {
+        dose: cumulative_sums_from_partials(
+            partial[dose], latest_date, reference_column_name=dose
+        )
+        for dose in reference_column_names
+    }
+
+
+def due_dose_dates(df, dose, previous_dose, due_date, counted_after):
+    """
+    Dates of a dose (e.g. second doses), counting only the patients for whom the dose is due:
+    those whose previous dose (e.g. first dose) was given before due_date. Doses given to
+    patients who were not yet due are counted as not received (NO_DATE), without changing the data.
+
+    Args:
+        df (dataframe): input data
+        dose (str): e.g. "covid_vacc_second_dose_date"
+        previous_dose (str): e.g. "covid_vacc_date"
+        due_date (int or str): campaign day (or "YYYY-MM-DD"); the dose is due for patients whose
+                               previous dose was given before this date
+        counted_after (int or str): previous doses dated on or before this date (e.g. before the start
+                                    of the campaign) are likely to be incorrect, so the dose is not
+                                    counted as due
+
+    Returns:
+        dates (np.array): campaign day of the dose for each patient, or NO_DATE
+    """
+    previous = df[previous_dose].to_numpy()
+    due = (previous < campaign_day(due_date)) & (previous > campaign_day(counted_after))
+
+    return np.where(due, df[dose].to_numpy(), NO_DATE)
+
+
+def given_dose_cumulative_sums(
+    df,
+    groups_of_interest,
+    features_dict,
+    latest_date,
+    dose,
+    previous_dose,
+    due_date,
+    counted_after,
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    n_workers=1,
+    groups=None,
+):
+    """
+    Calculate cumulative sums across groups of the doses (e.g. second doses) given to the
+    patients for whom they were due (those whose first dose was given before due_date), without
+    copying the data. The patients due are those counted for the previous dose up to due_date,
+    which can be read from the coverage cube (see cube_cumulative_sums_as_of()).
+
+    Args:
+        df (dataframe): input data
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
+        dose (str): e.g. "covid_vacc_second_dose_date"
+        previous_dose (str): e.g. "covid_vacc_date"
+        due_date (int or str): the dose is due for patients whose previous dose was given before this date
+        counted_after (int or str): previous doses dated on or before this date are not counted (see due_dose_dates())
+        n_workers (int): number of worker processes among which to share the features (1 to count them all in this process)
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        given (dict): cumulative sums of the dose up to latest_date, among patients for whom it was due,
+                      as returned by cumulative_sums()
+    """
+    partial = partial_cumulative_sums_by_dose(
+        df,
+        groups_of_interest,
+        features_dict,
+        reference_column_names=[dose],
+        all_keys=all_keys,
+        n_workers=n_workers,
+        groups=groups,
+        date_values={
+            dose: due_dose_dates(df, dose, previous_dose, due_date, counted_after)
+        },
+    )
+
+    return cumulative_sums_from_partials(
+        partial[dose], latest_date, reference_column_name=dose
+    )
+
+
+def due_doses_by_delay(
+    df,
+    groups_of_interest,
+    latest_date,
+    dose,
+    previous_dose,
+    delays,
+    counted_after,
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    groups=None,
+):
+    """
+    Counts the patients in each group due a dose (e.g. third doses), those who have been given
+    it and those who are overdue, for each of several delays after the previous dose (e.g.
+    8, 12, 14 and 26 weeks after second doses), to show how much the figures depend on the delay.
+
+    As in given_dose_cumulative_sums(), the dose is due for patients whose previous dose was
+    given before latest_date less the delay (the due date), and doses given up to latest_date
+    are counted among those patients. Each patient's previous dose is placed among the (sorted)
+    due dates just once, so all the delays are counted together.
 
-    # make a new field for the priority groups we are looking at (where any we have not specifically listed are regrouped as 0/"other")
+    Args:
+        df (dataframe): input data
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
+        dose (str): e.g. "covid_vacc_third_dose_date"
+        previous_dose (str): e.g. "covid_vacc_second_dose_date"
+        delays (list): delays after the previous dose when the dose is due, e.g. ["8 weeks", "14 weeks"]
+        counted_after (int or str): previous doses dated on or before this date are not counted (see due_dose_dates())
+        all_keys (list): a full set of numbers that the priority groups can be
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        out (Dataframe): indexed by group and delay, with the due date (the dose is due for patients whose
+                         previous dose was given before it), and the numbers due, given and overdue (each
+                         counted, then low numbers suppressed and rounded) and the percentage of those
+                         due who were given the dose
+    """
+    latest_date = campaign_day(latest_date)
+    delay_days = np.array([delay_in_days(delay) for delay in delays])
+    due_dates = latest_date - delay_days
+    order = np.argsort(due_dates, kind="stable")
+    sorted_due_dates = due_dates[order]
+
+    if groups is None:
+        groups = group_columns(df, groups_of_interest, all_keys=all_keys)
+    group_labels = pd.Index(list(dict.fromkeys(groups_of_interest.values())))
+    group_codes = group_labels.get_indexer(groups["group"].to_numpy())
+    previous = df[previous_dose].to_numpy()
+    counted = (group_codes >= 0) & (previous > campaign_day(counted_after))
+    dose_dates = df[dose].to_numpy()
+    given = (dose_dates != NO_DATE) & (dose_dates <= latest_date)
+
+    # the first due date after each patient's previous dose (as in due_dose_dates(), the dose
+    # is due for patients whose previous dose was before the due date); the patient is counted
+    # for that due date and all later ones
+    n_dates = len(due_dates) + 1
+    due_codes = np.searchsorted(sorted_due_dates, previous, side="right")
+    shape = (len(group_labels), n_dates)
+    n_due = np.bincount(
+        np.ravel_multi_index((group_codes[counted], due_codes[counted]), shape),
+        minlength=np.prod(shape),
+    ).reshape(shape)
+    counted &= given
+    n_given = np.bincount(
+        np.ravel_multi_index((group_codes[counted], due_codes[counted]), shape),
+        minlength=np.prod(shape),
+    ).reshape(shape)
+
+    # back into the order the delays were given in
+    n_due = np.cumsum(n_due, axis=1)[:, :-1][:, np.argsort(order)]
+    n_given = np.cumsum(n_given, axis=1)[:, :-1][:, np.argsort(order)]
+
+    names = {number: name for name, number in groups_of_interest.items()}
+    out = pd.DataFrame(
+        {
+            "due date": np.tile(campaign_dates(due_dates), len(group_labels)),
+            "due": suppress_and_round(n_due.ravel()),
+            "given": suppress_and_round(n_given.ravel()),
+            # (from the numbers counted, rather than the difference of two rounded numbers)
+            "overdue": suppress_and_round((n_due - n_given).ravel()),
+        },
+        index=pd.MultiIndex.from_product(
+            [[names[group] for group in group_labels], list(delays)],
+            names=["group", "delay"],
+        ),
+    )
+    out["given (% of due)"] = (100 * out["given"] / out["due"]).round(1)
+    return out
+
+
+def group_columns(df, groups_of_interest, all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]):
+    """
+    Works out the population/eligible subgroup each patient belongs to (where any we have
+    not specifically listed are regrouped as 0/"other"), without changing the data.
+
+    The counting functions below work the groups out for themselves, unless they are passed
+    in (as `groups'), so a notebook can work them out once and pass them to each count of
+    the same data and groups, and to assign_groups().
+
+    Args:
+        df (dataframe): input data
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        all_keys (list): a full set of numbers that the priority groups can be
+
+    Returns:
+        groups (Dataframe): `group' (number) and `group_name' of each patient, with the same index as df
+    """
+    # the priority groups we are looking at (where any we have not specifically listed are regrouped as 0/"other")
     items_to_group = filtering(groups_of_interest, all_keys=all_keys)
-    df["group"] = np.where(
-        df["priority_group"].isin(items_to_group), 0, df["priority_group"]
+    priority_group = df["priority_group"].to_numpy()
+    group = np.where(np.isin(priority_group, items_to_group), 0, priority_group)
+    # translate number into name (patients in groups without a name have none)
+    names = {number: name for name, number in groups_of_interest.items()}
+    return pd.DataFrame(
+        {"group": group, "group_name": pd.Series(group).map(names).to_numpy()},
+        index=df.index,
     )
-    # translate number into name
-    for name, number in groups_of_interest.items():
-        df.loc[df["group"] == number, "group_name"] = name
 
+
+def assign_groups(
+    df, groups_of_interest, all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9], groups=None
+):
+    """
+    Adds the fields `group' and `group_name' to the data, giving the population/eligible
+    subgroup each patient belongs to (see group_columns()). The cumulative sums do not need
+    these fields; they are for the charts and summaries which group patients by name.
+
+    Args:
+        df (dataframe): input data (modified in place)
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+    """
+    if groups is None:
+        groups = group_columns(df, groups_of_interest, all_keys=all_keys)
+    df["group"] = groups["group"]
+    df["group_name"] = groups["group_name"]
+
+
+def group_features(features_dict, group_title, group_label):
+    """
+    Finds the demographic/clinical features to report for a population subgroup.
+
+    Args:
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors
+        group_title (str): name of the population subgroup e.g. "80+"
+        group_label (int): number of the population subgroup e.g. 1
+
+    Returns:
+        cols (list): features of interest e.g. ["ageband", "sex"]
+    """
+    # define columns to include, ie. a list of features of interest (e.g. ageband, ethnicity) per population group
+    if group_title in features_dict:
+        cols = features_dict[group_title]
+    elif group_label in features_dict:  ## "other" group
+        cols = features_dict[group_label]
+    else:  # for age bands use all available features
+        cols = features_dict["DEFAULT"]
+
+    return cols
+
+
+def partial_cumulative_sums(
+    df,
+    groups_of_interest,
+    features_dict,
+    reference_column_name="covid_vacc_date",
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    n_workers=1,
+    groups=None,
+):
+    """
+    Counts the patients (and the patients vaccinated on each date) in each group and
+    subgroup, for a chunk of the data. The counts for separate chunks can be combined
+    with merge_partial_cumulative_sums() and then turned into the same cumulative sums as
+    cumulative_sums() would give for all the data by cumulative_sums_from_partials().
+
+    Rather than filtering the data to each group in turn, every group, date and level of
+    each feature is given an integer code, and patients are counted for all the groups
+    (and all the levels and dates) of a feature at once. The data have one row per patient,
+    so patients are counted as rows.
+
+    Args:
+        df (dataframe): a chunk of the input data (each patient must only appear in one chunk)
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+        n_workers (int): number of worker processes among which to share the features (see count_coverage())
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        partial (dict): a mapping from a group name (e.g '80+') to the counts for that group
+                        (see filtered_partial_sums())
+    """
+    return partial_cumulative_sums_by_dose(
+        df,
+        groups_of_interest,
+        features_dict,
+        reference_column_names=[reference_column_name],
+        all_keys=all_keys,
+        n_workers=n_workers,
+        groups=groups,
+    )[reference_column_name]
+
+
+def partial_cumulative_sums_by_dose(
+    df,
+    groups_of_interest,
+    features_dict,
+    reference_column_names=["covid_vacc_date"],
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    n_workers=1,
+    date_values=None,
+    groups=None,
+):
+    """
+    As partial_cumulative_sums(), but for several doses at once. Groups are assigned, and
+    patients are partitioned by group and each feature, only once for all the doses
+    (see count_coverage_by_dose()).
+
+    Args:
+        df (dataframe): a chunk of the input data (each patient must only appear in one chunk)
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        reference_column_names (list): e.g. ["covid_vacc_date", "covid_vacc_second_dose_date"]
+        n_workers (int): number of worker processes among which to share the features (see count_coverage())
+        date_values (dict): dates to count in place of the columns of df for some of the doses
+                            (see count_coverage_by_dose())
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
+
+    Returns:
+        partial (dict): a mapping from each dose to the counts for each group, as returned by
+                        partial_cumulative_sums()
+    """
+    if groups is None:
+        groups = group_columns(df, groups_of_interest, all_keys=all_keys)
+
+    # the features of interest for any of the groups are counted for all the groups at once
+    group_labels = pd.Index(list(dict.fromkeys(groups_of_interest.values())))
+    features = []
     for group_title, group_label in groups_of_interest.items():
-        out = df.copy().loc[(df["group"] == group_label)]
-
-        # define columns to include, ie. a list of features of interest (e.g. ageband, ethnicity) per population group
-        if group_title in features_dict:
-            cols = features_dict[group_title]
-        elif group_label in features_dict:  ## "other" group
-            cols = features_dict[group_label]
-        else:  # for age bands use all available features
-            cols = features_dict["DEFAULT"]
-
-        df_dict_temp = filtered_cumulative_sum(
-            df=out,
-            columns=cols,
-            latest_date=latest_date,
-            reference_column_name=reference_column_name,
+        features += group_features(features_dict, group_title, group_label)
+
+    coverage = count_coverage_by_dose(
+        df,
+        group_labels.get_indexer(groups["group"]),
+        len(group_labels),
+        list(dict.fromkeys(features)),
+        reference_column_names=reference_column_names,
+        n_workers=n_workers,
+        date_values=date_values,
+    )
+
+    partial = {}
+    for dose in reference_column_names:
+        partial[dose] = {}
+        for group_title, group_label in groups_of_interest.items():
+            partial[dose][group_title] = group_coverage(
+                coverage[dose],
+                group_labels.get_loc(group_label),
+                group_features(features_dict, group_title, group_label),
+            )
+
+    return partial
+
+
+def count_coverage(
+    df,
+    group_codes,
+    n_groups,
+    features,
+    reference_column_name="covid_vacc_date",
+    n_workers=1,
+):
+    """
+    Counts the patients in each group, and the number vaccinated on each date, overall
+    and by each level of a set of features. Every date and level is given an integer code,
+    so that all the groups, levels and dates of a feature are counted in a single pass
+    over the data (see count_cells()).
+
+    Args:
+        df (Dataframe): input data, with one row per patient
+        group_codes (np.array): for each patient, the code of their group (0 to n_groups - 1,
+                                or -1 if they are not in any of the groups)
+        n_groups (int): number of groups
+        features (list): demographic/clinical features e.g. ["sex", "ageband"]
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, or a column of
+                                     values such as "time_to_second_dose"
+        n_workers (int): if more than 1, the features are shared among this many worker processes,
+                         which read the codes and features from memory-mapped files (see parallel.py)
+
+    Returns:
+        coverage (dict): "dates" (the dates on which anyone was vaccinated), "overall" (an array of
+                         the numbers of patients by group, whether their sex is known and date)
+                         and "features" (a mapping from each feature to its levels and an array of
+                         the numbers of patients by group, whether their sex is known, level and
+                         date). The last date of each array counts the patients with no date.
+    """
+    return count_coverage_by_dose(
+        df,
+        group_codes,
+        n_groups,
+        features,
+        reference_column_names=[reference_column_name],
+        n_workers=n_workers,
+    )[reference_column_name]
+
+
+def count_coverage_by_dose(
+    df,
+    group_codes,
+    n_groups,
+    features,
+    reference_column_names=["covid_vacc_date"],
+    n_workers=1,
+    date_values=None,
+):
+    """
+    As count_coverage(), but for several doses at once. The levels of each feature are
+    coded, and patients are partitioned by group, whether their sex is known and level,
+    only once for all the doses; the partition is then counted by the date of each dose.
+
+    Args:
+        df (Dataframe): input data, with one row per patient
+        group_codes (np.array): for each patient, the code of their group (0 to n_groups - 1,
+                                or -1 if they are not in any of the groups)
+        n_groups (int): number of groups
+        features (list): demographic/clinical features e.g. ["sex", "ageband"]
+        reference_column_names (list): e.g. ["covid_vacc_date", "covid_vacc_second_dose_date"]
+        n_workers (int): if more than 1, the features are shared among this many worker processes,
+                         which read the codes and features from memory-mapped files (see parallel.py)
+        date_values (dict): dates to count in place of the columns of df for some of the doses
+                            e.g. {"covid_vacc_second_dose_date": due_dose_dates(...)}
+
+    Returns:
+        coverage (dict): a mapping from each dose to its counts, as returned by count_coverage()
+    """
+    if date_values is None:
+        date_values = {}
+
+    # patients with no date (or value) are counted in an extra slot after the last date
+    dates = {}
+    date_codes = []
+    for dose in reference_column_names:
+        if dose in date_values:
+            values = pd.Series(date_values[dose], name=dose)
+        else:
+            values = df[dose]
+        codes, dates[dose] = value_codes(values)
+        date_codes.append((np.where(codes < 0, len(dates[dose]), codes), len(dates[dose]) + 1))
+
+    # patients of unknown sex are left out of the figures by sex and the features after it,
+    # so whether their sex is known is counted separately
+    if "sex" in df.columns:
+        sex_codes = df["sex"].isin(["M", "F"]).to_numpy().astype(np.int8)
+    else:
+        sex_codes = np.zeros(len(df), dtype=np.int8)
+
+    # numbers of patients in each group, of known sex or otherwise, on each date
+    overall = count_cells_by_dates(
+        [group_codes, sex_codes], (n_groups, 2), date_codes
+    )
+
+    # numbers of patients in each group, of known sex or otherwise, in each level
+    # of each feature on each date
+    if n_workers > 1 and len(features) > 1:
+        with tempfile.TemporaryDirectory() as folder:
+            columns = {"group codes": group_codes, "sex codes": sex_codes}
+            for i, (codes, n_dates) in enumerate(date_codes):
+                columns[f"date codes {i}"] = codes
+            columns.update({feature: df[feature] for feature in features})
+            store = write_columns(columns, folder)
+
+            n_dates = [n for codes, n in date_codes]
+            tasks = [
+                (store, features[i::n_workers], n_groups, n_dates)
+                for i in range(n_workers)
+            ]
+            counts = {}
+            for result in map_in_workers(_count_features, tasks, n_workers):
+                counts.update(result)
+    else:
+        counts = {
+            feature: _count_feature(
+                df[feature], group_codes, sex_codes, date_codes, n_groups
+            )
+            for feature in features
+        }
+
+    # features are kept in the order they were asked for, whichever worker counted them
+    return {
+        dose: {
+            "dates": dates[dose],
+            "overall": overall[d],
+            "features": {
+                feature: (counts[feature][0], counts[feature][1][d])
+                for feature in features
+            },
+        }
+        for d, dose in enumerate(reference_column_names)
+    }
+
+
+def _count_feature(values, group_codes, sex_codes, date_codes, n_groups):
+    """
+    Counts the patients in each group, of known sex or otherwise, in each level of one
+    feature on each date of each dose (see count_coverage_by_dose()).
+    """
+    codes, levels = level_codes(values)
+    return (
+        levels,
+        count_cells_by_dates(
+            [group_codes, sex_codes, codes], (n_groups, 2, len(levels)), date_codes
+        ),
+    )
+
+
+def _count_features(task):
+    """
+    Counts the patients in each group, of known sex or otherwise, in each level of some
+    of the features on each date of each dose, in a worker process (see count_coverage_by_dose()).
+    """
+    store, features, n_groups, n_dates = task
+    codes = read_columns(
+        store, ["group codes", "sex codes"] + [f"date codes {i}" for i in range(len(n_dates))]
+    )
+    date_codes = [
+        (codes[f"date codes {i}"].to_numpy(), n) for i, n in enumerate(n_dates)
+    ]
+
+    return {
+        feature: _count_feature(
+            read_columns(store, [feature])[feature],
+            codes["group codes"].to_numpy(),
+            codes["sex codes"].to_numpy(),
+            date_codes,
+            n_groups,
         )
+        for feature in features
+    }
+
 
-        df_dict_out[group_title] = df_dict_temp
+def group_coverage(coverage, group_code, features):
+    """
+    Picks out the counts for one group from those made by count_coverage().
+
+    Args:
+        coverage (dict): as returned by count_coverage()
+        group_code (int): code of the group
+        features (list): demographic/clinical features to report for this group, in order
+
+    Returns:
+        counts (dict): as returned by filtered_partial_sums()
+    """
+    dates = coverage["dates"]
+
+    # overall figures
+    overall = coverage["overall"][group_code].sum(axis=0)
+    vaccinated = pd.Series(overall[:-1], index=dates)
+    counts = {
+        "overall": {
+            "total": pd.Series({"overall": overall.sum()}),
+            "vaccinated": vaccinated.loc[vaccinated > 0],
+        }
+    }
+
+    # figures by demographic/clinical features
+    known_sex_only = False
+    for feature in features:
+        if feature == "sex":
+            known_sex_only = True
+
+        levels, feature_counts = coverage["features"][feature]
+        if known_sex_only:
+            feature_counts = feature_counts[group_code, 1]
+        else:
+            feature_counts = feature_counts[group_code].sum(axis=0)
+
+        total = feature_counts.sum(axis=1)
+        vaccinated = feature_counts[:, :-1]
+        in_group = total > 0
+        any_vaccinated = vaccinated.sum(axis=1) > 0
+        on_date = vaccinated.sum(axis=0) > 0
+
+        counts[feature] = {
+            # total number of patients in each subgroup (e.g. no of males and no of females)
+            "total": pd.Series(total[in_group], index=levels[in_group].rename(feature)),
+            # number of patients vaccinated in each subgroup on each date
+            "vaccinated": pd.DataFrame(
+                vaccinated[any_vaccinated][:, on_date].T,
+                index=dates[on_date],
+                columns=levels[any_vaccinated].rename(feature),
+            ),
+        }
+
+    return counts
+
+
+def level_codes(values):
+    """
+    Gives each level of a demographic/clinical feature an integer code, with the
+    levels sorted as groupby() would sort them.
+
+    Args:
+        values (Series): the feature for each patient, e.g. df["sex"]
+
+    Returns:
+        codes (np.array): code of the level for each patient (-1 where missing)
+        levels (Index): the levels, in order of their codes
+    """
+    codes, levels = pd.factorize(values, sort=True)
+    return codes, pd.Index(np.asarray(levels))
+
+
+def value_codes(values):
+    """
+    Gives each date (or other value e.g. time to second dose) on which patients were
+    vaccinated an integer code, in order.
+
+    Args:
+        values (Series): e.g. df["covid_vacc_date"]
+
+    Returns:
+        codes (np.array): code of the date for each patient (-1 where there is no
+                          date (NO_DATE) or value (NaN))
+        values (Index): the dates, in order of their codes
+    """
+    codes, levels = level_codes(values)
+    # NO_DATE sorts before every real date
+    if len(levels) > 0 and levels[0] == NO_DATE:
+        codes = np.where(codes > 0, codes - 1, -1)
+        levels = levels[1:]
+    return codes, levels.rename(values.name)
+
+
+def count_cells(codes, shape):
+    """
+    Counts the patients in each cell of a table (e.g. of groups by dates), where
+    the cell each patient falls into is given by a set of integer codes.
+
+    Each combination of codes is turned into a single index into the (flattened) table
+    and the patients are counted with np.bincount(), rather than grouping the data.
+    Patients are counted as rows, as the data have one row per patient (see
+    check_one_row_per_patient() in data_processing.py).
+
+    Args:
+        codes (list): one array of codes per dimension of the table, each with one
+                      value per patient. Patients with a code of -1 are not counted.
+        shape (tuple): size of each dimension of the table
+
+    Returns:
+        counts (np.array): number of patients in each cell
+    """
+    counted = np.logical_and.reduce([c >= 0 for c in codes])
+    cells = np.ravel_multi_index([c[counted] for c in codes], shape)
+    return np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape)
+
+
+def count_cells_by_dates(codes, shape, date_codes):
+    """
+    As count_cells(), but with the table extended by the date of each of several doses.
+    The index of each patient's cell in the rest of the table is worked out once, and
+    then combined with the date of each dose in turn.
+
+    Args:
+        codes (list): one array of codes per dimension of the table (other than the date), each
+                      with one value per patient. Patients with a code of -1 are not counted.
+        shape (tuple): size of each dimension of the table (other than the date)
+        date_codes (list): for each dose, a tuple of the date code of each patient (with no -1s)
+                           and the number of dates
+
+    Returns:
+        counts (list): for each dose, the number of patients in each cell, with the date as the
+                       last dimension
+    """
+    counted = np.logical_and.reduce([c >= 0 for c in codes])
+    cells = np.ravel_multi_index([c[counted] for c in codes], shape)
+
+    counts = []
+    for dates, n_dates in date_codes:
+        counts.append(
+            np.bincount(
+                cells * n_dates + dates[counted],
+                minlength=int(np.prod(shape)) * n_dates,
+            ).reshape(shape + (n_dates,))
+        )
+    return counts
+
+
+def cumulative_counts(date_codes, category_codes, n_dates, n_categories):
+    """
+    Counts the patients vaccinated in each category (e.g. each priority group)
+    up to and including each date.
+
+    Args:
+        date_codes (np.array): as returned by value_codes()
+        category_codes (np.array): as returned by level_codes()
+        n_dates (int): number of dates
+        n_categories (int): number of categories
+
+    Returns:
+        counts (np.array): cumulative number of patients, with one row per date and one column per category
+    """
+    return count_cells([date_codes, category_codes], (n_dates, n_categories)).cumsum(
+        axis=0
+    )
+
+
+def merge_partial_cumulative_sums(partial, other):
+    """
+    Combines the counts for two chunks of data, as returned by partial_cumulative_sums().
+
+    Args:
+        partial (dict): counts for the first chunk (or None, if this is the first chunk)
+        other (dict): counts for the second chunk
+
+    Returns:
+        partial (dict): counts for both chunks
+    """
+    if partial is None:
+        return other
+
+    merged = {}
+    for group_title, features in other.items():
+        merged[group_title] = {}
+        for feature, counts in features.items():
+            if feature not in partial[group_title]:
+                merged[group_title][feature] = counts
+                continue
+            merged[group_title][feature] = {
+                "total": partial[group_title][feature]["total"].add(
+                    counts["total"], fill_value=0
+                ),
+                "vaccinated": partial[group_title][feature]["vaccinated"].add(
+                    counts["vaccinated"], fill_value=0
+                ),
+            }
+
+    return merged
+
+
+def cumulative_sums_from_partials(
+    partial, latest_date, reference_column_name="covid_vacc_date"
+):
+    """
+    Calculates cumulative sums from counts of patients, as returned by
+    partial_cumulative_sums() (and merge_partial_cumulative_sums()).
+
+    Args:
+        partial (dict): counts for each group
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+
+    Returns:
+        df_dict_out (dict): as returned by cumulative_sums()
+    """
+    df_dict_out = {}
+    for group_title, counts in partial.items():
+        df_dict_out[group_title] = format_cumulative_sums(
+            counts, latest_date, reference_column_name=reference_column_name
+        )
 
     return df_dict_out
 
 
+def streaming_cumulative_sums(
+    chunks,
+    groups_of_interest,
+    features_dict,
+    latest_date=None,
+    reference_column_name="covid_vacc_date",
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+):
+    """
+    Calculate cumulative sums across groups, as cumulative_sums(), but for data which
+    are provided in chunks (e.g. by iter_adult_data()), so that only one chunk is held
+    in memory at a time.
+
+    Args:
+        chunks (iterable): chunks of the input data (each patient must only appear in one chunk)
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        latest_date (int or str): campaign day, or "YYYY-MM-DD". If None, the latest date on which any patient was vaccinated.
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+
+    Returns:
+        df_dict_out (dict): as returned by cumulative_sums()
+
+    Raises:
+        ValueError: if there were no chunks, or latest_date is None and nobody was vaccinated
+    """
+    partial = None
+    for df in chunks:
+        partial = merge_partial_cumulative_sums(
+            partial,
+            partial_cumulative_sums(
+                df,
+                groups_of_interest,
+                features_dict,
+                reference_column_name=reference_column_name,
+                all_keys=all_keys,
+            ),
+        )
+
+    if partial is None:
+        raise ValueError("No chunks of data were provided")
+
+    if latest_date is None:
+        vaccination_dates = [
+            counts["overall"]["vaccinated"].index.max()
+            for counts in partial.values()
+            if len(counts["overall"]["vaccinated"]) > 0
+        ]
+        if not vaccination_dates:
+            raise ValueError("Nobody was vaccinated, so latest_date must be given")
+        latest_date = max(vaccination_dates)
+
+    return cumulative_sums_from_partials(
+        partial, latest_date, reference_column_name=reference_column_name
+    )
+
+
 def filtered_cumulative_sum(
     df, columns, latest_date, reference_column_name="covid_vacc_date"
 ):
@@ -193,7 +1059,7 @@ def filtered_cumulative_sum(
         df (Dataframe): pandas dataframe. At the very least this needs a column with a date in
             YYYY-MM-DD format, a column called 'covid_vacc_date' and a 'covid_vacc_flag'.
         columns (list): list of subgroups e.g. ageband, sex
-        latest_date (datetime object): the date of the latest date of counting vaccines
+        latest_date (int or str): the latest date of counting vaccines, as a campaign day or "YYYY-MM-DD"
         reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
 
     Returns:
@@ -205,39 +1071,76 @@ def filtered_cumulative_sum(
             rounded to 0. For subgroups, the numerator (i.e the number of people who had a vaccine)
             is rounded to the nearest 7.
     """
+    counts = filtered_partial_sums(
+        df, columns, reference_column_name=reference_column_name
+    )
+
+    return format_cumulative_sums(
+        counts, latest_date, reference_column_name=reference_column_name
+    )
+
+
+def filtered_partial_sums(df, columns, reference_column_name="covid_vacc_date"):
+    """
+    Counts the patients in a dataframe, and the number vaccinated on each date, overall
+    and by each of a set of characteristics. Unlike cumulative sums, these counts can be
+    added together for separate chunks of data.
+
+    Args:
+        df (Dataframe): as for filtered_cumulative_sum()
+        columns (list): list of subgroups e.g. ageband, sex
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+
+    Returns:
+        Dict: a mapping from "overall" and each subgroup (e.g. "sex") to a dict containing
+            "total" (a series giving the number of patients in each category, e.g. males and
+            females) and "vaccinated" (the number vaccinated in each category on each date)
+    """
+    coverage = count_coverage(
+        df,
+        np.zeros(len(df), dtype=np.int8),
+        1,
+        list(dict.fromkeys(columns)),
+        reference_column_name=reference_column_name,
+    )
+
+    return group_coverage(coverage, 0, columns)
+
+
+def format_cumulative_sums(counts, latest_date, reference_column_name="covid_vacc_date"):
+    """
+    Turns counts of patients, as returned by filtered_partial_sums(), into cumulative sums
+    (see filtered_cumulative_sum()). Low numbers are suppressed and other values rounded.
+
+    Args:
+        counts (dict): as returned by filtered_partial_sums()
+        latest_date (int or str): the latest date of counting vaccines, as a campaign day or "YYYY-MM-DD"
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+
+    Returns:
+        Dict (of dataframes): as returned by filtered_cumulative_sum()
+    """
     # This creates an empty dictionary that is used as a temporary collection place for the processed figures
     df_dict_temp = {}
 
-    # overall figures
-    total = df[["patient_id"]].nunique()[0]
+    # dates are compared as campaign days
+    latest_date = campaign_day(latest_date)
 
-    # Copies the dataframe but filters only to those who have had a vaccine recorded
-    filtered = df.copy().loc[(df[reference_column_name] != 0)]
+    # overall figures
+    total = int(counts["overall"]["total"]["overall"])
 
-    # group by date of covid vaccines to calculate cumulative sum of vaccines at each date of the campaign
-    out2 = pd.DataFrame(
-        filtered.groupby([reference_column_name])[["patient_id"]]
-        .nunique()
-        .unstack()
-        .fillna(0)
+    # cumulative sum of vaccines at each date of the campaign, up to the latest date
+    out2 = up_to_latest_date(
+        counts["overall"]["vaccinated"]
+        .astype(int)
         .cumsum()
+        .rename("overall")
+        .rename_axis(reference_column_name),
+        latest_date,
     ).reset_index()
-    out2 = out2.rename(columns={0: "overall"}).drop(columns=["level_0"])
-
-    # filter to latest date and earlier (usually no effect unless a date earlier than the latest available data is passed)
-    out2 = out2.loc[out2[reference_column_name] <= latest_date]
 
-    # in case no vaccinations on latest date for some orgs/groups, insert the latest data as a new row with the required date:
-    if latest_date not in list(out2[reference_column_name]):
-        out2.loc[max(out2.index) + 1] = [
-            latest_date,
-            out2.loc[out2[reference_column_name] < latest_date]["overall"].max(),
-        ]
-
-    # suppress low numbers
-    out2["overall"] = round7(
-        out2["overall"].replace([1, 2, 3, 4, 5, 6], 0).fillna(0).astype(int)
-    )
+    # suppress low numbers and round other values to nearest 7
+    out2["overall"] = suppress_and_round(out2["overall"])
 
     # Rounds the overall_total values (and makes into integers)
     out2["overall_total"] = round7(total)
@@ -248,54 +1151,59 @@ def filtered_cumulative_sum(
     df_dict_temp["overall"] = out2.set_index(reference_column_name)
 
     # figures by demographic/clinical features
-    for feature in columns:
-        if feature == "sex":
-            df = df.loc[df[feature].isin(["M", "F"])]
-            filtered = filtered.loc[filtered[feature].isin(["M", "F"])]
+    for feature, feature_counts in counts.items():
+        if feature == "overall":
+            continue
 
         # find total number of patients in each subgroup (e.g. no of males and no of females)
-        totals = (
-            df.groupby([feature])[["patient_id"]]
-            .nunique()
-            .rename(columns={"patient_id": "total"})
-            .transpose()
-        )
-        # suppress low numbers
-        totals = totals.replace([1, 2, 3, 4, 5, 6], 0).fillna(0)
-        totals = round7(totals)
+        totals = feature_counts["total"].rename("total").to_frame().transpose()
+        totals.columns = label_flags(totals.columns)
+        # suppress low numbers and round other values to nearest 7
+        totals = suppress_and_round(totals)
 
-        # find total number of patients vaccinated in each subgroup (e.g. no of males and no of females),
+        # total number of patients vaccinated in each subgroup (e.g. no of males and no of females),
         # cumulative at each date of the campaign
-        out2 = (
-            filtered.copy()
-            .groupby([feature, reference_column_name])["patient_id"]
-            .nunique()
-            .unstack(0)
-        )
+        out2 = feature_counts["vaccinated"]
+        out2 = out2.set_axis(label_flags(out2.columns), axis=1)
         out2 = out2.fillna(0).cumsum()
 
         # filter to latest date and earlier (usually no effect unless a date earlier than the latest available data is passed)
         out2 = out2.loc[out2.index <= latest_date]
 
-        # suppress low numbers
-        out2 = out2.replace([1, 2, 3, 4, 5, 6], 0).fillna(0)
-        # round other values to nearest 7
-        out2 = round7(out2)
+        # suppress low numbers and round other values to nearest 7
+        out2 = suppress_and_round(out2)
 
         for c2 in out2.columns:
-            out2[f"{c2}_total"] = totals[c2][0].astype(int)
+            out2[f"{c2}_total"] = totals[c2].iloc[0].astype(int)
             # calculate percentage
             out2[f"{c2}_percent"] = 100 * (out2[c2] / out2[f"{c2}_total"])
 
-        # in case no vaccinations on latest date for some orgs/groups, insert the latest data as a new row with the required date
-        if out2.index.max() < latest_date:
-            out2.loc[latest_date] = out2.max()
-
-        df_dict_temp[feature] = out2
+        df_dict_temp[feature] = up_to_latest_date(out2, latest_date)
 
     return df_dict_temp
 
 
+def up_to_latest_date(out, latest_date):
+    """
+    Filters cumulative figures to the latest date and earlier, and in case there were no
+    vaccinations on the latest date (for some orgs/groups), adds a row for the latest date
+    carrying forward the latest figures (see daily_calendar()).
+
+    Args:
+        out (Dataframe or Series): cumulative figures, indexed by campaign day
+        latest_date (int): campaign day
+
+    Returns:
+        out (Dataframe or Series): the figures up to and including the latest date
+    """
+    out = out.loc[out.index <= latest_date]
+    if len(out) == 0 or out.index[-1] == latest_date:
+        return out
+
+    days = out.index.append(pd.Index([latest_date], name=out.index.name))
+    return daily_calendar(out, latest_date).loc[days]
+
+
 def make_vaccine_graphs(
     df,
     latest_date,
@@ -305,14 +1213,16 @@ def make_vaccine_graphs(
     grouping="group_name",
     include_total=True,
     suffix="",
+    grain="day",
+    counts=None,
 ):
     """
-    Cumulative chart by day of total vaccines given across key eligible groups. Produces both SVG and PNG versions.
+    Cumulative chart by day (or week/month) of total vaccines given across key eligible groups. Produces both SVG and PNG versions.
     Exports csvs.
 
     Args:
         df (dataframe): cumulative daily data on vaccines given per group
-        latest_date (str): latest date across dataset in YYYY-MM-DD format
+        latest_date (int or str): latest date across dataset, as a campaign day or in YYYY-MM-DD format
         savepath (dict): path to save figure (savepath["figures"])
         savepath_figure_csvs (str): path to save machine readable csv for recreating the chart
         vaccine_type (str): used in output strings to describe type of vaccine received e.g. "first_dose", "moderna".
@@ -320,42 +1230,61 @@ def make_vaccine_graphs(
         grouping (str): column to use for grouping of patients e.g. "group_name"
         include_total (bin): whether or not to include the "total" line in the chart
         suffix (str)
+        grain (str): "day", or "week"/"month" to show the figures at the end of each ISO week/month
+                     (and the latest date) only, e.g. for long-range charts
+        counts (dataframe): cumulative numbers vaccinated in each group, indexed by campaign day, as
+                            returned by cube_vaccination_counts(). If given, these are charted rather
+                            than counting the patient-level data (and df is not used).
     """
 
     # set titles and reference_column_name for later us
+    cumulative = "Cumulative" if grain == "day" else f"Cumulative {GRAINS[grain]}"
     if vaccine_type == "first_dose":
         reference_column_name = "covid_vacc_date"
-        title = f"Cumulative first dose vaccination figures"
+        title = f"{cumulative} first dose vaccination figures"
     elif vaccine_type == "spring_booster":
         reference_column_name = "spring_booster_date"
-        title = f"Cumulative spring booster vaccination figures"
+        title = f"{cumulative} spring booster vaccination figures"
     else:
         reference_column_name = f"covid_vacc_{vaccine_type}_date"
-        title = f"Cumulative {vaccine_type.replace('_',' ')} vaccination figures"
+        title = f"{cumulative} {vaccine_type.replace('_',' ')} vaccination figures"
 
     if grouping == "group_name":
         title = title + f" by priority group"
     else:
         title = title + f" by {grouping.replace('_',' ')}"
 
-    # filter to those with the relevant vaccine/dose/type
-    dfp = df.copy().loc[(df[reference_column_name] != 0)]
-
-    dfp = dfp.groupby([reference_column_name, grouping])[["patient_id"]].count()
-    dfp = (
-        dfp.unstack().fillna(0).cumsum().reset_index().replace([0, 1, 2, 3, 4, 5, 6], 0)
-    )
+    if counts is None:
+        # filter to those with the relevant vaccine/dose/type
+        # count those with the relevant vaccine/dose/type in each group, cumulatively at each date
+        date_codes, dates = value_codes(df[reference_column_name])
+        group_codes, group_levels = level_codes(df[grouping])
+        by_date = cumulative_counts(
+            date_codes, group_codes, len(dates), len(group_levels)
+        )
 
-    # convert dates to easily readable format and set as index
-    dfp[reference_column_name] = pd.to_datetime(dfp[reference_column_name]).dt.strftime(
-        "%Y %d %b"
+        # keep the dates on which, and the groups in which, anyone was vaccinated
+        on_date = np.diff(by_date.sum(axis=1), prepend=0) > 0
+        any_vaccinated = by_date.sum(axis=0) > 0
+        counts = pd.DataFrame(
+            by_date[on_date][:, any_vaccinated],
+            index=dates[on_date],
+            columns=group_levels[any_vaccinated].rename(grouping),
+        )
+    else:
+        # (leaving the counts passed in unchanged)
+        counts = counts.copy()
+    # (the last week or month ends at the latest date, as the title says)
+    dfp = roll_up(counts, grain, last_day=campaign_day(latest_date))
+
+    # convert dates (campaign days) to easily readable format
+    dfp.index = pd.Index(
+        campaign_dates(dfp.index, "%Y %d %b"), name=reference_column_name
     )
-    dfp = dfp.set_index(reference_column_name)
 
-    # round to nearest 7
-    dfp = round7(dfp)
+    # suppress low numbers and round other values to nearest 7
+    dfp = suppress_and_round(dfp)
 
-    dfp.columns = dfp.columns.droplevel()
     dfp["total"] = dfp.sum(axis=1)
 
     # sort columns (eligible groups) such that they appear in descending order of total no of vaccines at the latest date,
@@ -364,8 +1293,7 @@ def make_vaccine_graphs(
 
     ### export data to csv
     if savepath_figure_csvs:
-        out = dfp.copy()
-        out.to_csv(
+        dfp.to_csv(
             os.path.join(
                 savepath_figure_csvs, f"{title} among each eligible group{suffix}.csv"
             ),
@@ -387,14 +1315,14 @@ def make_vaccine_graphs(
         dfp = dfp / 1000
         ylabel = "number of patients (thousands)"
 
-    # plot chart
-    dfp.plot(legend=True, ds="steps-post")
+    # plot chart (joining the ends of weeks/months rather than stepping between them)
+    dfp.plot(legend=True, ds="steps-post" if grain == "day" else "default")
 
     # set chart labels and other options
     plt.xlabel("date", fontweight="bold")
     plt.xticks(rotation=90)
     plt.ylabel(ylabel, fontweight="bold")
-    plt.title(f"{title} to {latest_date}", fontsize=16)
+    plt.title(f"{title} to {campaign_date(campaign_day(latest_date))}", fontsize=16)
     plt.legend(bbox_to_anchor=(1.04, 1), loc="upper left")
 
     # export figure to file and display it
@@ -404,7 +1332,14 @@ def make_vaccine_graphs(
     plt.show()
 
 
-def report_results(df_dict_cum, group, latest_date, breakdown=None):
+def report_results(
+    df_dict_cum,
+    group,
+    latest_date,
+    breakdown=None,
+    targets=TARGETS,
+    horizon_weeks=HORIZON_WEEKS,
+):
     """
     Summarise data at latest date, overall and by demographic/clinical features, and including change
     from previous week.
@@ -413,94 +1348,68 @@ def report_results(df_dict_cum, group, latest_date, breakdown=None):
     Args:
         df_dict_cum (dict): dictionary of cumulative sums
         group (str): e.g. "80+" (one of first level index of df_dict_cum)
-        latest_date (str): latest date across dataset in YYYY-MM-DD format
+        latest_date (int or str): latest date across dataset, as a campaign day or in YYYY-MM-DD format
         breakdown (list): demographic/clinical features to display in breakdown
+        targets (list): coverage (percent) which each category is projected to reach e.g. [75, 90, 95]
+        horizon_weeks (float): projections further ahead than this are shown as "unknown"
 
     Returns:
         out3 (Dataframe): summary data
     """
 
-    # creates 2 empty dataframes to collect results in
-    out = pd.DataFrame()
-    out3 = pd.DataFrame()
+    # dates are compared as campaign days
+    latest_date = campaign_day(latest_date)
 
     # If no breakdown into subgroups is specified, then breakdown are the keys of the group only
     if (breakdown == None) | (breakdown == []):
         breakdown = df_dict_cum[group].keys()
 
-    # for each category in the breakdown
-    for category in breakdown:
-        out = df_dict_cum[group][category]
-        reference_column_name = out.index.name
-
-        #         # filter to latest_date and earlier (allows a date other than the current date to be passed)
-        #         out = out.loc[out.index <= latest_date]
-        #         if latest_date not in list(out.index):
-        #             out.loc[latest_date] = out.loc[out.index <latest_date].max()
-
-        # calculate changes: select only latest date and 7 days ago:
-        latest = pd.to_datetime(out.index).max()
-        lastweek = (latest + pd.DateOffset(days=-7)).strftime("%Y-%m-%d")
-        lastweek = str(max(lastweek, out.index.min()))
-
-        # filter to required values:
-        # for groups with a population denominator, keep the percentage value only
-        if "not in other eligible groups" not in group:
-            out = out.filter(regex="percent").round(1)
-            col_str = " (percent)"
-        # for groups with no denominator, keep the actual values only
-        else:
-            # totals and percent not needed
-            out = out.filter(regex="^(?!.*total).*$")
-            out = out.filter(regex="^(?!.*percent).*$")
-            col_str = ""
-
-        # if last week's exact date not present, fill in using latest values prior to required date
-        if lastweek not in list(out.index):
-            out.loc[lastweek] = out.loc[out.index < lastweek].max()
-        out = out.loc[[latest_date, lastweek], :].transpose()
-
-        out["weeklyrate"] = ((out[latest_date] - out[lastweek]).fillna(0)).round(1)
-        out["Increase in uptake (%)"] = (
-            100 * (out["weeklyrate"] / out[lastweek]).fillna(0)
-        ).round(1)
-        out["weeks_to_target"] = (90 - out[latest_date]) / out["weeklyrate"]
-
-        date_reached = pd.Series(dtype="datetime64[ns]", name="date_reached")
-
-        for i in out.index:
-            weeks_to_target = out["weeks_to_target"][i]
-            if weeks_to_target <= 0:  # already reached target
-                date_reached[i] = "reached"
-            elif (
-                weeks_to_target < 25
-            ):  # if 6mo+ until expected to reach target, assume too little data to tell
-                date_reached[i] = (
-                    latest + pd.DateOffset(days=weeks_to_target * 7)
-                ).strftime("%d-%b")
-            else:
-                date_reached[i] = "unknown"
-        out = (
-            out.transpose()
-            .append(date_reached)
-            .transpose()
-            .drop(columns="weeks_to_target")
-        )
-        out = out[
-            [lastweek, "weeklyrate", "date_reached", "Increase in uptake (%)"]
-        ].rename(
-            columns={
-                lastweek: f"vaccinated 7d previous{col_str}",
-                "weeklyrate": f"Uptake over last 7d{col_str}",
-                "date_reached": "Date projected to reach 90%",
-            }
-        )
-        out.index = out.index.str.replace("_percent", "")
-        out = out.reset_index().rename(columns={category: "group", "index": "group"})
-        out["category"] = category
-        out = out.set_index(["category", "group"])
+    # for groups with a population denominator, keep the percentage value only
+    if "not in other eligible groups" not in group:
+        tables = {
+            category: df_dict_cum[group][category].filter(regex="percent").round(1)
+            for category in breakdown
+        }
+        col_str = " (percent)"
+    # for groups with no denominator, keep the actual values only
+    else:
+        # totals and percent not needed
+        tables = {
+            category: df_dict_cum[group][category].filter(
+                regex="^(?!.*(total|percent)).*$"
+            )
+            for category in breakdown
+        }
+        col_str = ""
+
+    # changes over the last 7 days, and dates projected to reach the targets, for all the
+    # categories at once
+    projected = {
+        f"reach {target}%": f"Date projected to reach {target}%" for target in targets
+    }
+    out = uptake_projections(
+        tables, latest_date, targets=targets, horizon_weeks=horizon_weeks
+    )
+    out = out[["previous", "uptake", *projected, "growth (%)"]].rename(
+        columns={
+            "previous": f"vaccinated 7d previous{col_str}",
+            "uptake": f"Uptake over last 7d{col_str}",
+            "growth (%)": "Increase in uptake (%)",
+            **projected,
+        }
+    )
+    out.index = pd.MultiIndex.from_arrays(
+        [
+            out.index.get_level_values(0),
+            out.index.get_level_values(1).str.replace("_percent", ""),
+        ],
+        names=["category", "group"],
+    )
 
-        ##### n, percent and total pop figures for latest date
+    ##### n, percent and total pop figures for latest date
+    summaries = []
+    for category in breakdown:
+        reference_column_name = df_dict_cum[group][category].index.name
         out2 = df_dict_cum[group][category].reset_index()
         out2 = (
             out2.loc[out2[reference_column_name] == latest_date]
@@ -517,14 +1426,12 @@ def report_results(df_dict_cum, group, latest_date, breakdown=None):
         out2 = out2.rename(columns={"index": "group", np.nan: "vaccinated"}).fillna(0)
         out2["percent"] = out2["percent"].round(1)
         out2["category"] = category
-        out2 = out2.set_index(["category", "group"])
+        summaries.append(out2.set_index(["category", "group"]))
 
-        out2 = out2.join(out)
-
-        out3 = out3.append(out2)
+    out3 = pd.concat(summaries).join(out)
 
     if "not in other eligible groups" in group:
-        out3 = out3.drop(columns=["percent", "total", "Date projected to reach 90%"])
+        out3 = out3.drop(columns=["percent", "total", *projected.values()])
     else:
         out3 = out3.drop(columns=["Increase in uptake (%)"])
 
@@ -535,6 +1442,8 @@ def summarise_data_by_group(
     result_dict,
     latest_date,
     groups=["80+", "70-79", "care home", "shielding (aged 16-69)"],
+    targets=TARGETS,
+    horizon_weeks=HORIZON_WEEKS,
 ):
     """
     This takes in the large result_dict that is created by cumulative_sums()
@@ -543,9 +1452,11 @@ def summarise_data_by_group(
 
     Args:
         results_dict (dict): dictionary that is created by running cumulative_sums()
-        latest_date (datetime object): dt object that is created by running
+        latest_date (int): campaign day that is created by running
             find_and_save_latest_date()
         groups (list): groups of interest.
+        targets (list): coverage (percent) which each category is projected to reach e.g. [75, 90, 95]
+        horizon_weeks (float): projections further ahead than this are shown as "unknown"
 
     Returns:
         dict (df_dict_latest): dictionary of the results of applying function
@@ -557,7 +1468,13 @@ def summarise_data_by_group(
 
     # loops through the specified groups and applies report_results.
     for group in groups:
-        out = report_results(result_dict, group, latest_date=latest_date)
+        out = report_results(
+            result_dict,
+            group,
+            latest_date=latest_date,
+            targets=targets,
+            horizon_weeks=horizon_weeks,
+        )
 
         # results are added to the dict with the group name as key
         df_dict_latest[group] = out
@@ -566,9 +1483,85 @@ def summarise_data_by_group(
     return df_dict_latest
 
 
+def count_patients(df, mask):
+    """
+    Counts the patients in the rows picked out by a mask, reading only the patient ids
+    (rather than filtering a copy of the whole dataframe).
+
+    Args:
+        df (Dataframe): input data
+        mask (np.array or Series): boolean, one value per row
+
+    Returns:
+        int: number of distinct patients
+    """
+    return len(pd.unique(df["patient_id"].to_numpy()[np.asarray(mask)]))
+
+
+def masked_sum(df, column, mask, rows=None):
+    """
+    Sums a column (e.g. a flag) over the rows picked out by a mask, reading only
+    that column (rather than filtering a copy of the whole dataframe).
+
+    Args:
+        df (Dataframe): input data
+        column (str): column to sum e.g. "covid_vacc_2nd"
+        mask (np.array or Series): boolean, one value per row
+        rows (np.array): positions of the rows to consider, e.g. the rows of one group as
+                         returned by partition_rows() (or None for all the rows)
+
+    Returns:
+        int: the sum
+    """
+    values = df[column].to_numpy()
+    mask = np.asarray(mask)
+    if rows is not None:
+        values = values[rows]
+        mask = mask[rows]
+    return values[mask].sum()
+
+
+def group_partition(groups):
+    """
+    Sorts the rows of the data by group, once, so that the rows of any group can then be
+    sliced out (see partition_rows()) rather than comparing every row with each group in turn.
+    The partition can be reused for every dose and summary which looks at the same groups.
+
+    Args:
+        groups (Series): the group of each row e.g. df["group_name"]
+
+    Returns:
+        partition (dict): "groups" (an Index of the groups), "rows" (positions of the rows, sorted by
+                          group) and "offsets" (where the rows of each group start and end in "rows")
+    """
+    codes, levels = level_codes(groups)
+    # rows with no group (code -1) are sorted first, and then each group in turn
+    rows = np.argsort(codes, kind="stable")
+    offsets = np.cumsum(np.bincount(codes + 1, minlength=len(levels) + 1))
+
+    return {"groups": levels, "rows": rows, "offsets": offsets}
+
+
+def partition_rows(partition, group):
+    """
+    Picks out the rows of one group from a partition made by group_partition().
+
+    Args:
+        partition (dict): as returned by group_partition()
+        group: the group e.g. "12-15"
+
+    Returns:
+        rows (np.array): positions of the rows of the group, in order (a view of the partition)
+    """
+    if group not in partition["groups"]:
+        return partition["rows"][:0]
+    g = partition["groups"].get_loc(group)
+    return partition["rows"][partition["offsets"][g] : partition["offsets"][g + 1]]
+
+
 def round7(input_):
     """
-    Round input_ to nearest 7
+    Round input_ to nearest 7 (see round_to_base())
 
     Args:
         input_ (int/float/df/series): number or dataframe to be rounded
@@ -577,10 +1570,7 @@ def round7(input_):
         int/df/series: rounded to the nearest 7
 
     """
-    if (isinstance(input_, pd.DataFrame)) | (isinstance(input_, pd.Series)):
-        return 7 * round((input_ / 7), 0)
-    else:
-        return int(7 * round((input_ / 7), 0))
+    return round_to_base(input_, base=7)
 
 
 def create_summary_stats_nobrands(
@@ -635,7 +1625,7 @@ def create_summary_stats_nobrands(
             reference_column_name = f"covid_vacc_{vaccine_type}_date"
 
     vaccinated_total = round7(
-        df.loc[df[reference_column_name] != 0]["patient_id"].nunique()
+        count_patients(df, df[reference_column_name].to_numpy() != NO_DATE)
     )
 
     # add the results fo the summary_stats dict
@@ -712,7 +1702,7 @@ def create_summary_stats(
     else:
         reference_column_name = f"covid_vacc_{vaccine_type}_date"
     vaccinated_total = round7(
-        df.loc[df[reference_column_name] != 0]["patient_id"].nunique()
+        count_patients(df, df[reference_column_name].to_numpy() != NO_DATE)
     )
 
     # add the results fo the summary_stats dict
@@ -746,11 +1736,11 @@ def create_summary_stats(
         # note that the first vaccine date being equal to the specific brand date could include unvaccinated people (0=0) so need to sum the specific flag
         for x, y in [("oxford", "ox"), ("pfizer", "pfz"), ("moderna", "mod")]:
             vaccine_brands[x]["first_doses"] = round7(
-                df.copy()
-                .loc[df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"]][
-                    f"covid_vacc_flag_{y}"
-                ]
-                .sum()
+                masked_sum(
+                    df,
+                    f"covid_vacc_flag_{y}",
+                    df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"],
+                )
             )
             vaccine_brands[x]["percent"] = round(
                 100 * vaccine_brands[x]["first_doses"] / vaccinated_total, 1
@@ -763,9 +1753,11 @@ def create_summary_stats(
         # second doses according to brand of first dose
         for x in ["oxford", "pfizer", "moderna"]:
             vaccine_brands[x]["second_doses"] = round7(
-                df.loc[df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"]][
-                    "covid_vacc_2nd"
-                ].sum()
+                masked_sum(
+                    df,
+                    "covid_vacc_2nd",
+                    df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"],
+                )
             )
             denom = vaccine_brands[x]["first_doses"]
             if denom > 0:  # in case of zeros in dummy data
@@ -832,7 +1824,7 @@ def create_summary_stats(
             ("moderna", "Moderna"),
         ]:
             vaccine_brands_3rd_dose[x]["third_doses"] = round7(
-                df.copy().loc[df["brand_of_third_dose"] == y]["covid_vacc_3rd"].sum()
+                masked_sum(df, "covid_vacc_3rd", df["brand_of_third_dose"] == y)
             )
             vaccine_brands_3rd_dose[x]["percent"] = round(
                 100 * vaccine_brands_3rd_dose[x]["third_doses"] / vaccinated_total, 1
@@ -879,6 +1871,7 @@ def create_summary_stats_children(
     vaccine_type="first_dose",
     groups=[],
     suffix="",
+    partition=None,
 ):
     """
     This takes in the large summarised_data_dict for the _CHILD_ data that is created by
@@ -898,6 +1891,8 @@ def create_summary_stats_children(
                             Also appended to filename of output.
         groups (list): groups of interest.
         suffix (str): provider name to append to output
+        partition (dict): the rows of each group, as returned by group_partition(df["group_name"])
+                          (worked out here if not given)
 
     Returns:
         dict (summary_stats): dictionary of the results
@@ -919,7 +1914,7 @@ def create_summary_stats_children(
     else:
         reference_column_name = f"covid_vacc_{vaccine_type}_date"
     vaccinated_total = round7(
-        df.loc[df[reference_column_name] != 0]["patient_id"].nunique()
+        count_patients(df, df[reference_column_name].to_numpy() != NO_DATE)
     )
 
     # add the results fo the summary_stats dict
@@ -942,6 +1937,15 @@ def create_summary_stats_children(
 
     # if summarising first doses, perform some additional calculations
     if vaccine_type == "first_dose":
+        # the rows of each group are found once, and sliced out for each group and brand below
+        if partition is None:
+            partition = group_partition(df["group_name"])
+        # patients whose first dose was of each brand
+        first_dose_of = {
+            x: (df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"]).to_numpy()
+            for x in ["pfizerA", "pfizerC", "other"]
+        }
+
         # calculate the proportion of first doses which were of each brand available
         vaccine_brands = {}
         (
@@ -957,11 +1961,7 @@ def create_summary_stats_children(
             ("other", "other"),
         ]:
             vaccine_brands[x]["first_doses"] = round7(
-                df.copy()
-                .loc[df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"]][
-                    f"covid_vacc_flag_{y}"
-                ]
-                .sum()
+                masked_sum(df, f"covid_vacc_flag_{y}", first_dose_of[x])
             )
             vaccine_brands[x]["percent"] = round(
                 100 * vaccine_brands[x]["first_doses"] / vaccinated_total, 1
@@ -983,12 +1983,12 @@ def create_summary_stats_children(
                 ("other", "Other"),
             ]:
                 group_first_vaccine_brand_dict[group][y]["first_doses"] = round7(
-                    df.copy()
-                    .loc[
-                        (df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"])
-                        & (df["group_name"] == group)
-                    ][f"covid_vacc_flag_{x}"]
-                    .sum()
+                    masked_sum(
+                        df,
+                        f"covid_vacc_flag_{x}",
+                        first_dose_of[x],
+                        rows=partition_rows(partition, group),
+                    )
                 )
 
         group_first_vaccine_brand_df = pd.concat(
@@ -1018,9 +2018,7 @@ def create_summary_stats_children(
         # second doses according to brand of first dose
         for x in ["pfizerA", "pfizerC", "other"]:
             vaccine_brands[x]["second_doses"] = round7(
-                df.loc[df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"]][
-                    "covid_vacc_2nd"
-                ].sum()
+                masked_sum(df, "covid_vacc_2nd", first_dose_of[x])
             )
             denom = vaccine_brands[x]["first_doses"]
             if denom > 0:  # in case of zeros in dummy data
@@ -1029,51 +2027,54 @@ def create_summary_stats_children(
                 out = 0
             vaccine_brands[x]["second_doses_percent"] = out
 
-            group_second_vaccine_brand_dict = {}
-
-            for group in groups:
-                group_second_vaccine_brand_dict[group] = {}
-                (
-                    group_second_vaccine_brand_dict[group]["Pfizer (30 micrograms)"],
-                    group_second_vaccine_brand_dict[group]["Pfizer (10 micrograms)"],
-                    group_second_vaccine_brand_dict[group]["Other"],
-                ) = ({}, {}, {})
-                for x, y in [
-                    ("pfizerA", "Pfizer (30 micrograms)"),
-                    ("pfizerC", "Pfizer (10 micrograms)"),
-                    ("other", "Other"),
-                ]:
-                    group_second_vaccine_brand_dict[group][y]["second_doses"] = round7(
-                        df.loc[
-                            (df["covid_vacc_date"] == df[f"covid_vacc_{x}_date"])
-                            & (df["group_name"] == group)
-                        ]["covid_vacc_2nd"].sum()
+        # second doses according to brand of first dose, in each group
+        group_second_vaccine_brand_dict = {}
+
+        for group in groups:
+            group_second_vaccine_brand_dict[group] = {}
+            (
+                group_second_vaccine_brand_dict[group]["Pfizer (30 micrograms)"],
+                group_second_vaccine_brand_dict[group]["Pfizer (10 micrograms)"],
+                group_second_vaccine_brand_dict[group]["Other"],
+            ) = ({}, {}, {})
+            for x, y in [
+                ("pfizerA", "Pfizer (30 micrograms)"),
+                ("pfizerC", "Pfizer (10 micrograms)"),
+                ("other", "Other"),
+            ]:
+                group_second_vaccine_brand_dict[group][y]["second_doses"] = round7(
+                    masked_sum(
+                        df,
+                        "covid_vacc_2nd",
+                        first_dose_of[x],
+                        rows=partition_rows(partition, group),
                     )
+                )
 
-            group_second_vaccine_brand_df = pd.concat(
-                {
-                    k: pd.DataFrame(v).T
-                    for k, v in group_second_vaccine_brand_dict.items()
-                },
-                axis=0,
-            ).reset_index()
+        group_second_vaccine_brand_df = pd.concat(
+            {
+                k: pd.DataFrame(v).T
+                for k, v in group_second_vaccine_brand_dict.items()
+            },
+            axis=0,
+        ).reset_index()
 
-            group_totals = group_second_vaccine_brand_df.groupby(["level_0"])[
-                "second_doses"
-            ].agg("sum")
-            group_totals = group_totals.reset_index().rename(
-                columns={"second_doses": "second_doses_total"}
-            )
+        group_totals = group_second_vaccine_brand_df.groupby(["level_0"])[
+            "second_doses"
+        ].agg("sum")
+        group_totals = group_totals.reset_index().rename(
+            columns={"second_doses": "second_doses_total"}
+        )
 
-            group_second_vaccine_brand_df = group_second_vaccine_brand_df.merge(
-                group_totals
-            )
-            group_second_vaccine_brand_df["second_doses_perc"] = round(
-                100
-                * group_second_vaccine_brand_df["second_doses"]
-                / group_second_vaccine_brand_df["second_doses_total"],
-                2,
-            )
+        group_second_vaccine_brand_df = group_second_vaccine_brand_df.merge(
+            group_totals
+        )
+        group_second_vaccine_brand_df["second_doses_perc"] = round(
+            100
+            * group_second_vaccine_brand_df["second_doses"]
+            / group_second_vaccine_brand_df["second_doses_total"],
+            2,
+        )
 
         group_vaccine_brand_df = group_first_vaccine_brand_df.merge(
             group_second_vaccine_brand_df, on=["level_0", "level_1"]
@@ -1082,6 +2083,11 @@ def create_summary_stats_children(
         ### Calculating counts for mixed doses
         ### These are calculated per group, and summed at the end
         group_mixed_second_vaccine_brand_dict = {}
+        # patients with each mix of brands (flagged 1/0)
+        mixed = {
+            (y, z): df[f"covid_vacc_{y}_{z}"].to_numpy().astype(bool)
+            for y, z in [("pfizerA", "pfizerC"), ("other", "pfizer")]
+        }
 
         for group in groups:
             group_mixed_second_vaccine_brand_dict[group] = {}
@@ -1097,9 +2103,12 @@ def create_summary_stats_children(
                 group_mixed_second_vaccine_brand_dict[group][x][
                     "second_doses"
                 ] = round7(
-                    df.loc[(df[f"covid_vacc_{y}_{z}"]) & (df["group_name"] == group)][
-                        "covid_vacc_2nd"
-                    ].sum()
+                    masked_sum(
+                        df,
+                        "covid_vacc_2nd",
+                        mixed[(y, z)],
+                        rows=partition_rows(partition, group),
+                    )
                 )
 
             group_mixed_second_vaccine_brand_df = pd.concat(
@@ -1196,6 +2205,7 @@ def create_detailed_summary_uptake(
     savepath,
     vaccine_type="first_dose",
     groups=["80+", "70-79", "care home", "shielding (aged 16-69)"],
+    horizon_weeks=HORIZON_WEEKS,
 ):
     """
     This takes in the large summarised_data_dict that is created by summarise_data_by_group()
@@ -1210,31 +2220,34 @@ def create_detailed_summary_uptake(
         savepath (str): save path.
         vaccine_type (str): string to insert into filename on export.
         groups (list): eligible groups of interest.
+        horizon_weeks (float): as passed to summarise_data_by_group(), for the footnote on projections
 
     """
     pd.set_option("display.max_rows", 200)
+    horizon = "6mo" if horizon_weeks == HORIZON_WEEKS else f"{horizon_weeks} weeks"
     # loops through the groups and displays markdown
     for group in groups:
+        out = summarised_data_dict[group]
+        # a column of projected dates for each target coverage (e.g. 'Date projected to reach 90%')
+        projected = [c for c in out.columns if c.startswith("Date projected to reach ")]
+        footnote = "".join(
+            f"- '{c}' being 'unknown' indicates projection of >{horizon} (likely insufficient information)\n"
+            for c in projected
+        )
         display(
             Markdown(f"## "),
             Markdown(
                 f"## COVID vaccination rollout ({vaccine_type.replace('_', ' ')}) among **{group}** population up to {formatted_latest_date}"
             ),
-            Markdown(
-                f"- 'Date projected to reach 90%' being 'unknown' indicates projection of >6mo (likely insufficient information)\n"
-                f"- Patient counts rounded to the nearest 7"
-            ),
+            Markdown(f"{footnote}- Patient counts rounded to the nearest 7"),
         )
-        out = summarised_data_dict[group]
         for c in ["vaccinated", "total"]:
             if c in out.columns:
                 out[c] = out[c].astype(int)
         display(out)
 
         # saves to file
-        out_csv = out.copy()
-        if "Date projected to reach 90%" in out.columns:
-            out_csv = out_csv.drop(columns="Date projected to reach 90%")
+        out_csv = out.drop(columns=projected)
 
         if vaccine_type == "first_dose":
             out_str = ""
@@ -1261,6 +2274,7 @@ def plot_dem_charts(
     include_overall=False,
     org_name="",
     suffix="",
+    grain="day",
 ):
 
     """
@@ -1279,11 +2293,16 @@ def plot_dem_charts(
         include_overall (bool): Option to include "overall" chart ie. chart with a single line, not broken down into any groups
         org_name (str): name of organisation for which data is to be presented (e.g. an STP or region)
         suffix (str): suffix to append to filenames on export
+        grain (str): "day", or "week"/"month" to show the figures at the end of each ISO week/month
+                     (and the latest date) only
     """
 
     # set up a default list of characteristics
     groups = ["sex", "ethnicity_6_groups", "imd_categories"]
 
+    # describe figures shown at a coarser grain than daily in filenames
+    grain_label = "" if grain == "day" else f"{GRAINS[grain]} "
+
     if len(org_name) > 1:
         org_string = f" for {org_name}"
     else:
@@ -1318,7 +2337,7 @@ def plot_dem_charts(
         out = cumulative_data_dict[k]
 
         for c in groups:
-            out = cumulative_data_dict[k][c]
+            out = roll_up(cumulative_data_dict[k][c], grain)
 
             # get index name (== "covid_vacc_date" for first doses)
             reference_column_name = out.index.name
@@ -1332,12 +2351,12 @@ def plot_dem_charts(
             # export csv to file - numerator and denominator rather than percentages
             if savepath_figure_csvs:
                 cols = [c for c in out.columns if "_percent" not in c]
-                out_csv = out.copy()[cols]
+                out_csv = with_date_index(out[cols])
 
                 out_csv.to_csv(
                     os.path.join(
                         savepath_figure_csvs,
-                        f"Cumulative {vaccine_type}vaccination percent among {k} population by {c.replace('_',' ')}{suffix}.csv",
+                        f"Cumulative {grain_label}{vaccine_type}vaccination percent among {k} population by {c.replace('_',' ')}{suffix}.csv",
                     ),
                     index=True,
                 )
@@ -1365,14 +2384,10 @@ def plot_dem_charts(
                         )
                     )
 
-            out = out.reset_index()
-            out[reference_column_name] = pd.to_datetime(
-                out[reference_column_name]
-            ).dt.strftime("%d %b")
-            out = out.set_index(reference_column_name)
+            out = with_date_index(out, "%d %b")
 
             # plot trend chart and set chart options
-            out.plot(legend=True, ds="steps-post")
+            out.plot(legend=True, ds="steps-post" if grain == "day" else "default")
             plt.axhline(overall_rate, color="k", linestyle="--", alpha=0.5)
             plt.text(0, overall_rate * 1.02, "latest overall cohort rate")
             plt.ylim(top=1.1 * max(overall_rate, out.max().max()))
@@ -1387,7 +2402,7 @@ def plot_dem_charts(
                 figure_savepath = savepath["figures"]
             filename = os.path.join(
                 figure_savepath,
-                f"{vaccine_type}COVID vaccinations among {k} population by {c.replace('_', ' ')}",
+                f"{grain_label}{vaccine_type}COVID vaccinations among {k} population by {c.replace('_', ' ')}",
             )
             plt.savefig(f"{filename}.svg", dpi=300, bbox_inches="tight")
             plt.savefig(f"{filename}.png", dpi=300, bbox_inches="tight")
@@ -1395,8 +2410,63 @@ def plot_dem_charts(
             plt.show()
 
 
+def bin_values(values, bins=None, cap=None):
+    """
+    Puts values (e.g. the number of days between first and second doses) into bins, so that
+    patients can be counted at each bin rather than at every distinct value.
+
+    Args:
+        values (Series): e.g. df["time_to_second_dose"] (NaN where there is no value)
+        bins (list): edges of the bins in increasing order e.g. [0, 28, 56, 84]. Each value is
+                     counted at the lower edge of its bin (the last bin has no upper limit, and
+                     values below the first edge are left out), or None to count every value
+        cap (int or float): values above this are counted at cap, so that a long tail of high
+                            values is counted together (or None to leave the values uncapped)
+
+    Returns:
+        binned (Series): the value at which each patient is counted (NaN where there is none)
+    """
+    if cap is not None:
+        values = values.clip(upper=cap)
+    if bins is None:
+        return values
+
+    edges = np.asarray(bins, dtype=float)
+    numbers = values.to_numpy(dtype=float)
+    position = np.searchsorted(edges, numbers, side="right") - 1
+    binned = np.where(
+        np.isnan(numbers) | (position < 0), np.nan, edges[np.maximum(position, 0)]
+    )
+    return pd.Series(binned, index=values.index, name=values.name)
+
+
+def binned_columns(df, columns, reference_column_name, bins=None, cap=None):
+    """
+    Picks out the columns needed to count patients by value, with the values binned
+    (see bin_values()), without copying the rest of the data.
+
+    Args:
+        df (Dataframe): input data
+        columns (list): demographic/clinical features e.g. ["sex", "ageband"]
+        reference_column_name (str): the column of values e.g. "time_to_second_dose"
+        bins (list): edges of the bins (see bin_values())
+        cap (int or float): highest value (see bin_values())
+
+    Returns:
+        df (Dataframe): the binned values, sex (needed to leave patients of unknown sex out of
+                        the figures by sex and the features after it) and the features
+    """
+    needed = [c for c in dict.fromkeys(["sex"] + list(columns)) if c in df.columns]
+    binned = {c: df[c] for c in needed}
+    binned[reference_column_name] = bin_values(
+        df[reference_column_name], bins=bins, cap=cap
+    )
+
+    return pd.DataFrame(binned, index=df.index)
+
+
 def filtered_cumulative_sum_byValue(
-    df, columns, reference_column_name="time_to_second_dose"
+    df, columns, reference_column_name="time_to_second_dose", bins=None, cap=None
 ):
     """
     This calculates cumulative sums for a dataframe, and when given a set of
@@ -1411,6 +2481,8 @@ def filtered_cumulative_sum_byValue(
         columns (list): list of subgroups e.g. ageband, sex
         latest_date (datetime object): the date of the latest date of counting vaccines
         reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+        bins (list): edges of bins into which to put the values (see bin_values()), or None to count every value
+        cap (int or float): values above this are counted at cap (see bin_values())
 
     Returns:
         Dict (of dataframes): Each dataframe produced has a date as a row, with the value of the number
@@ -1421,30 +2493,49 @@ def filtered_cumulative_sum_byValue(
             rounded to 0. For subgroups, the numerator (i.e the number of people who had a vaccine)
             is rounded to the nearest 7.
     """
+    # count the patients with each value, overall and in each subgroup
+    counts = filtered_partial_sums(
+        binned_columns(df, columns, reference_column_name, bins=bins, cap=cap),
+        columns,
+        reference_column_name=reference_column_name,
+    )
+
+    return format_cumulative_sums_byValue(
+        counts, reference_column_name=reference_column_name
+    )
+
+
+def format_cumulative_sums_byValue(counts, reference_column_name="time_to_second_dose"):
+    """
+    Turns counts of patients with each value, as returned by filtered_partial_sums(), into
+    cumulative sums (see filtered_cumulative_sum_byValue()). Low numbers are suppressed and
+    other values rounded.
+
+    Args:
+        counts (dict): as returned by filtered_partial_sums()
+        reference_column_name (str): the name of the column containing the value over which cumulative sums are calculated
+
+    Returns:
+        Dict (of dataframes): as returned by filtered_cumulative_sum_byValue()
+    """
     # This creates an empty dictionary that is used as a temporary collection place for the processed figures
     df_dict_temp = {}
 
     # overall figures
-    total = df[["patient_id"]].nunique()[0]
+    total = int(counts["overall"]["total"]["overall"])
 
-    # Copies the dataframe
-    filtered = df.copy()
-
-    # group by date of covid vaccines to calculate cumulative sum of vaccines at each date of the campaign
-    out2 = pd.DataFrame(
-        filtered.groupby([reference_column_name])[["patient_id"]]
-        .nunique()
-        .unstack()
-        .fillna(0)
+    # cumulative sum of patients at each value
+    out2 = (
+        counts["overall"]["vaccinated"]
         .cumsum()
-    ).reset_index()
-    out2 = out2.rename(columns={0: "overall"}).drop(columns=["level_0"])
-
-    # suppress low numbers
-    out2["overall"] = round7(
-        out2["overall"].replace([1, 2, 3, 4, 5, 6], 0).fillna(0).astype(int)
+        .rename("overall")
+        .rename_axis(reference_column_name)
+        .reset_index()
     )
 
+    # suppress low numbers and round other values to nearest 7
+    out2["overall"] = suppress_and_round(out2["overall"])
+
     # Rounds the overall_total values (and makes into integers)
     out2["overall_total"] = round7(total)
 
@@ -1454,39 +2545,27 @@ def filtered_cumulative_sum_byValue(
     df_dict_temp["overall"] = out2.set_index(reference_column_name)
 
     # figures by demographic/clinical features
-    for feature in columns:
-        if feature == "sex":
-            df = df.loc[df[feature].isin(["M", "F"])]
-            filtered = filtered.loc[filtered[feature].isin(["M", "F"])]
+    for feature, feature_counts in counts.items():
+        if feature == "overall":
+            continue
 
         # find total number of patients in each subgroup (e.g. no of males and no of females)
-        totals = (
-            df.groupby([feature])[["patient_id"]]
-            .nunique()
-            .rename(columns={"patient_id": "total"})
-            .transpose()
-        )
-        # suppress low numbers
-        totals = totals.replace([1, 2, 3, 4, 5, 6], 0).fillna(0)
-        totals = round7(totals)
+        totals = feature_counts["total"].rename("total").to_frame().transpose()
+        totals.columns = label_flags(totals.columns)
+        # suppress low numbers and round other values to nearest 7
+        totals = suppress_and_round(totals)
 
         # find total number of patients vaccinated in each subgroup (e.g. no of males and no of females),
-        # cumulative at each date of the campaign
-        out2 = (
-            filtered.copy()
-            .groupby([feature, reference_column_name])["patient_id"]
-            .nunique()
-            .unstack(0)
-        )
-        out2 = out2.fillna(0).cumsum()
+        # cumulative at each value
+        out2 = feature_counts["vaccinated"]
+        out2 = out2.set_axis(label_flags(out2.columns), axis=1)
+        out2 = out2.cumsum()
 
-        # suppress low numbers
-        out2 = out2.replace([1, 2, 3, 4, 5, 6], 0).fillna(0)
-        # round other values to nearest 7
-        out2 = round7(out2)
+        # suppress low numbers and round other values to nearest 7
+        out2 = suppress_and_round(out2)
 
         for c2 in out2.columns:
-            out2[f"{c2}_total"] = totals[c2][0].astype(int)
+            out2[f"{c2}_total"] = totals[c2].iloc[0].astype(int)
             # calculate percentage
             out2[f"{c2}_percent"] = 100 * (out2[c2] / out2[f"{c2}_total"])
 
@@ -1502,6 +2581,10 @@ def cumulative_sums_byValue(
     latest_date,
     reference_column_name="time_to_second_dose",
     all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    n_workers=1,
+    bins=None,
+    cap=None,
+    groups=None,
 ):
     """
     Calculate cumulative sums across groups, for count data (NOT DATES).
@@ -1509,56 +2592,59 @@ def cumulative_sums_byValue(
     are required to be calculated for value that is NOT a date (e.g., number of days between first
     and second doses).
 
+    Patients in all the groups are counted together, as a histogram of the (binned) values for
+    each group and level of each feature, in a single pass over the data for each feature
+    (see count_coverage_by_dose()).
+
     Args:
         df (dataframe): input data
         groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
         features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
-        latest_date (str): "YYYY-MM-DD"
+        latest_date (int or str): campaign day, or "YYYY-MM-DD"
         reference_column_name (str): the name of the column containing the value over which cumulative sums are to be calculated
+        n_workers (int): number of worker processes among which to share the features (1 to count them all in this process)
+        bins (list): edges of bins into which to put the values e.g. [0, 28, 56, 84] (see bin_values()),
+                     or None to count every value
+        cap (int or float): values above this are counted at cap, e.g. to count a long tail together (see bin_values())
+        groups (Dataframe): the groups, if already worked out by group_columns() for df and groups_of_interest
 
     Returns:
         df_dict_out (dict): This dict is a mapping from a group name (e.g '80+') to another dict, which is a mapping from a feature name (e.g. 'sex') to a dataframe containing cumulative sums of vaccination data per day.
     """
+    # the priority groups we are looking at (where any we have not specifically listed are regrouped as 0/"other"),
+    # without copying or changing the data
+    if groups is None:
+        groups = group_columns(df, groups_of_interest, all_keys=all_keys)
+
+    # the features of interest for any of the groups are counted for all the groups at once.
+    # For example, in care home, we are interested in sex, ageband and broad ethnicity groups.
+    # In the analysis of age bands we are interested in much more detail such as comorbidities
+    # and ethnicity in 16 groups.
+    group_labels = pd.Index(list(dict.fromkeys(groups_of_interest.values())))
+    features = []
+    for group_title, group_label in groups_of_interest.items():
+        features += group_features(features_dict, group_title, group_label)
+    features = list(dict.fromkeys(features))
+
+    coverage = count_coverage_by_dose(
+        binned_columns(df, features, reference_column_name, bins=bins, cap=cap),
+        group_labels.get_indexer(groups["group"]),
+        len(group_labels),
+        features,
+        reference_column_names=[reference_column_name],
+        n_workers=n_workers,
+    )[reference_column_name]
 
-    # Creates an empty dict to collect results as passes through function
     df_dict_out = {}
-
-    # for each group within the desired groups, it filters to that particular group. it
-    # also selects columns of interest. For example, in care home, we are interested in
-    # sex, ageband and broad ethnicity groups. In the analysis of age bands we are interested
-    # in much more detail such as comorbidities and ethnicity in 16 groups.
-
-    # make a new field for the priority groups we are looking at (where any we have not specifically listed are regrouped as 0/"other")
-    items_to_group = filtering(groups_of_interest, all_keys=all_keys)
-
-    # Old method - generates SettingWithCopyWarning
-    # df["group"] = np.where(df["priority_group"].isin(items_to_group), 0, df["priority_group"])
-
-    # New method - the problem was arising because df was a view
-    df = copy.deepcopy(df)
-    df.loc[:, "group"] = df["priority_group"]
-    df.loc[df["priority_group"].isin(items_to_group), "group"] = 0
-
-    # translate number into name
-    for name, number in groups_of_interest.items():
-        df.loc[df["group"] == number, "group_name"] = name
-
     for group_title, group_label in groups_of_interest.items():
-        out = df.copy().loc[(df["group"] == group_label)]
-
-        # define columns to include, ie. a list of features of interest (e.g. ageband, ethnicity) per population group
-        if group_title in features_dict:
-            cols = features_dict[group_title]
-        elif group_label in features_dict:  ## "other" group
-            cols = features_dict[group_label]
-        else:  # for age bands use all available features
-            cols = features_dict["DEFAULT"]
-
-        df_dict_temp = filtered_cumulative_sum_byValue(
-            df=out, columns=cols, reference_column_name=reference_column_name
+        counts = group_coverage(
+            coverage,
+            group_labels.get_loc(group_label),
+            group_features(features_dict, group_title, group_label),
+        )
+        df_dict_out[group_title] = format_cumulative_sums_byValue(
+            counts, reference_column_name=reference_column_name
         )
-
-        df_dict_out[group_title] = df_dict_temp
 
     return df_dict_out
 
@@ -0,0 +1,353 @@
+""" This module works out the column types of the cohort extracts from the study definitions and uses them to read the extracts in"""
+
+# Import statements
+import ast
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+# Errors
+from errors import DataCleaningError
+from dates import to_campaign_days
+
+
+# The kind of data returned by each `returning' option of the cohortextractor
+# `patients' functions. "code" is used for categories which are stored as integer codes
+# (e.g. ethnicity, IMD), "category" for categories stored as text (e.g. sex, STP).
+RETURNING_KINDS = {
+    "date": "date",
+    "binary_flag": "flag",
+    "number_of_matches_in_period": "int",
+    "pseudo_id": "int",
+    "index_of_multiple_deprivation": "int",
+    "group_6": "code",
+    "group_16": "code",
+    "stp_code": "category",
+    "nuts1_region_name": "category",
+}
+
+# The kind of data returned by `patients' functions which do not take a `returning' argument
+# (or when it is not given)
+FUNCTION_KINDS = {
+    "with_these_clinical_events": "flag",
+    "with_these_medications": "flag",
+    "with_tpp_vaccination_record": "flag",
+    "satisfying": "flag",
+    "registered_as_of": "flag",
+    "registered_with_one_practice_between": "flag",
+    "died_from_any_cause": "flag",
+    "date_of": "date",
+    "age_as_of": "int",
+    "sex": "category",
+    "most_recent_bmi": "float",
+    "fixed_value": "category",
+}
+
+# Columns which are added by cohortextractor and are not defined in the study definition
+EXTRA_COLUMNS = {"patient_id": "id"}
+
+# dtypes used while reading each kind of column (missing values are filled afterwards)
+READ_DTYPES = {
+    "date": "object",
+    "flag": "Int8",
+    "code": "Int16",
+    "int": "Int32",
+    "id": "int64",
+    "float": "float32",
+    "category": "category",
+}
+
+# dtypes for numeric kinds of column once missing values have been filled with 0
+FILLED_DTYPES = {
+    "flag": "int8",
+    "code": "int16",
+    "int": "int32",
+    "float": "float32",
+}
+
+
+def _variable_kind(function_name, keywords, args):
+    """
+    Works out what kind of data a single `patients.<function_name>(...)' call returns.
+
+    Args:
+        function_name (str): name of the `patients' function e.g. "with_these_clinical_events"
+        keywords (dict): keyword arguments of the call, as ast nodes
+        args (list): positional arguments of the call, as ast nodes
+
+    Returns:
+        kind (str): one of "date", "flag", "code", "category", "int", "float" or None if unknown
+    """
+    returning = keywords.get("returning")
+    if isinstance(returning, ast.Constant):
+        if returning.value == "category":
+            # categories are either codes (e.g. "1", "2") or text (e.g. "M", "F")
+            category_keys = _expected_categories(keywords.get("return_expectations"))
+            return "code" if _all_codes(category_keys) else "category"
+        if returning.value in RETURNING_KINDS:
+            return RETURNING_KINDS[returning.value]
+
+    if "date_format" in keywords:
+        return "date"
+
+    if function_name == "categorised_as":
+        category_keys = []
+        if args and isinstance(args[0], ast.Dict):
+            category_keys = [k.value for k in args[0].keys if isinstance(k, ast.Constant)]
+        return "code" if _all_codes(category_keys) else "category"
+
+    return FUNCTION_KINDS.get(function_name)
+
+
+def _expected_categories(return_expectations):
+    """
+    Pulls the category names out of a `return_expectations' dict, e.g.
+    {"category": {"ratios": {"1": 0.5, "2": 0.5}}} gives ["1", "2"].
+    """
+    if not isinstance(return_expectations, ast.Dict):
+        return []
+    for key, value in zip(return_expectations.keys, return_expectations.values):
+        if isinstance(key, ast.Constant) and key.value == "category":
+            if not isinstance(value, ast.Dict):
+                return []
+            for key2, value2 in zip(value.keys, value.values):
+                if (
+                    isinstance(key2, ast.Constant)
+                    and key2.value == "ratios"
+                    and isinstance(value2, ast.Dict)
+                ):
+                    return [k.value for k in value2.keys if isinstance(k, ast.Constant)]
+    return []
+
+
+def _all_codes(category_keys):
+    """True if every category is an integer code (e.g. "0", "1", "2")"""
+    return len(category_keys) > 0 and all(str(k).isdigit() for k in category_keys)
+
+
+def _collect_variables(keywords, schema):
+    """
+    Adds the variables defined by a list of ast keywords (as passed to StudyDefinition()
+    or patients.satisfying() etc.) to the schema, including any variables nested within them.
+    """
+    for keyword in keywords:
+        value = keyword.value
+        if (
+            keyword.arg is None
+            or not isinstance(value, ast.Call)
+            or not isinstance(value.func, ast.Attribute)
+            or not isinstance(value.func.value, ast.Name)
+            or value.func.value.id != "patients"
+        ):
+            continue
+
+        call_keywords = {k.arg: k.value for k in value.keywords if k.arg}
+        schema[keyword.arg] = _variable_kind(value.func.attr, call_keywords, value.args)
+
+        ### variables can be defined inside patients.satisfying(), patients.categorised_as() etc.
+        _collect_variables(value.keywords, schema)
+
+
+def _find_common_variables(module, name, analysis_path):
+    """
+    Finds the keywords of a dict which has been imported into the study definition and
+    unpacked into StudyDefinition(), e.g. `**common_variables'.
+    """
+    for node in module.body:
+        if isinstance(node, ast.ImportFrom) and any(a.name == name for a in node.names):
+            with open(os.path.join(analysis_path, f"{node.module}.py")) as f:
+                imported_module = ast.parse(f.read())
+            for node2 in imported_module.body:
+                if (
+                    isinstance(node2, ast.Assign)
+                    and any(isinstance(t, ast.Name) and t.id == name for t in node2.targets)
+                    and isinstance(node2.value, ast.Call)
+                ):
+                    return node2.value.keywords
+    raise DataCleaningError(
+        f"Could not find where `{name}' is defined for the study definition"
+    )
+
+
+@lru_cache(maxsize=None)
+def read_study_definition_schema(
+    study_definition="study_definition_delivery",
+    analysis_path=os.path.join("..", "analysis"),
+):
+    """
+    This reads a study definition (without running it, as cohortextractor is not
+    available when the notebooks run) and works out what kind of data each of the
+    variables in the extracted csv contains.
+
+    Args:
+        study_definition (str): name of the study definition module in `analysis_path'
+        analysis_path (str): folder in which to find the study definitions
+
+    Returns:
+        schema (dict): a dict, where keys are column names and values are the kind of data
+                       in that column ("date", "flag", "code", "category", "int", "float",
+                       "id" or None if this could not be worked out)
+    Raises:
+        DataCleaningError: If the study definition does not contain a StudyDefinition()
+    """
+    with open(os.path.join(analysis_path, f"{study_definition}.py")) as f:
+        module = ast.parse(f.read())
+
+    study = None
+    for node in ast.walk(module):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == "StudyDefinition"
+        ):
+            study = node
+            break
+    if study is None:
+        raise DataCleaningError(f"No StudyDefinition() found in {study_definition}.py")
+
+    schema = dict(EXTRA_COLUMNS)
+    for keyword in study.keywords:
+        if keyword.arg is None and isinstance(keyword.value, ast.Name):
+            ### e.g. `**common_variables'
+            _collect_variables(
+                _find_common_variables(module, keyword.value.id, analysis_path), schema
+            )
+        else:
+            _collect_variables([keyword], schema)
+
+    return schema
+
+
+def select_columns(schema, core_columns, features=None, feature_sources=None):
+    """
+    Works out which columns of an extract need to be read in.
+
+    Args:
+        schema (dict): as returned by read_study_definition_schema()
+        core_columns (list): columns which are always needed (e.g. vaccination dates)
+        features (list): demographic/clinical features (as named in the cleaned data) required by
+                         the reports. If None, every column in the schema is read.
+        feature_sources (dict): a dict, where keys are features and values are the extract columns
+                         needed to derive them, for features whose names differ from those in the extract
+                         (None if every feature is named as in the extract)
+
+    Returns:
+        columns (list): names of the columns to read
+    """
+    if features is None:
+        return list(schema.keys())
+
+    if feature_sources is None:
+        feature_sources = {}
+
+    columns = list(core_columns)
+    for feature in features:
+        for column in feature_sources.get(feature, [feature]):
+            if column in schema and column not in columns:
+                columns.append(column)
+    return columns
+
+
+def read_extract(
+    path,
+    study_definition="study_definition_delivery",
+    columns=None,
+    analysis_path=os.path.join("..", "analysis"),
+):
+    """
+    This reads a csv extract using the column types in the study definition, so that
+    flags are held as int8, integer-coded categories (e.g. ethnicity) as int16,
+    text categories (e.g. ageband, sex) as pandas categoricals and dates as
+    campaign days (see dates.py).
+
+    Missing values are filled with 0, as the cleaning functions expect, except for text
+    categories where they are recorded as "Unknown" and dates, where they are NO_DATE.
+
+    Args:
+        path (str): path to the csv (may be compressed)
+        study_definition (str): name of the study definition which generated the csv
+        columns (list): names of columns to read. If None, all columns are read.
+        analysis_path (str): folder in which to find the study definitions
+
+    Returns:
+        Dataframe (df): the extract
+    """
+    schema = read_study_definition_schema(study_definition, analysis_path)
+    columns, dtypes = _read_options(path, schema, columns)
+
+    df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+
+    return _fill_missing_values(df, schema)
+
+
+def iter_extract(
+    path,
+    study_definition="study_definition_delivery",
+    columns=None,
+    chunksize=500000,
+    analysis_path=os.path.join("..", "analysis"),
+):
+    """
+    As read_extract(), but reads the csv in chunks of `chunksize' rows, so that the
+    whole extract never needs to be held in memory.
+
+    Args:
+        path (str): path to the csv (may be compressed)
+        study_definition (str): name of the study definition which generated the csv
+        columns (list): names of columns to read. If None, all columns are read.
+        chunksize (int): number of rows in each chunk
+        analysis_path (str): folder in which to find the study definitions
+
+    Yields:
+        Dataframe (df): the next chunk of the extract
+    """
+    schema = read_study_definition_schema(study_definition, analysis_path)
+    columns, dtypes = _read_options(path, schema, columns)
+
+    with pd.read_csv(
+        path, usecols=columns, dtype=dtypes, chunksize=chunksize
+    ) as reader:
+        for df in reader:
+            yield _fill_missing_values(df, schema)
+
+
+def _read_options(path, schema, columns):
+    """
+    Works out which columns to ask pd.read_csv() for (only those which are actually
+    in this extract) and the dtypes to read them as.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    if columns is not None:
+        columns = [c for c in header if c in columns]
+    else:
+        columns = list(header)
+
+    dtypes = {c: READ_DTYPES[schema[c]] for c in columns if schema.get(c)}
+
+    return columns, dtypes
+
+
+def _fill_missing_values(df, schema):
+    """Fills missing values in an extract which has just been read in (see read_extract())"""
+    for c in df.columns:
+        kind = schema.get(c)
+        if kind in FILLED_DTYPES:
+            df[c] = df[c].fillna(0).astype(FILLED_DTYPES[kind])
+        elif kind == "category":
+            # missing text categories are labelled "Unknown" rather than 0 (which cannot be
+            # stored alongside text in a categorical or parquet column). The cleaning functions
+            # gave a missing region or STP this label anyway; a missing sex was previously 0,
+            # but patients whose sex is neither M nor F are left out of the figures by sex either way
+            if df[c].isna().any():
+                df[c] = df[c].cat.add_categories("Unknown").fillna("Unknown")
+            # categories are sorted (and ordered) so that groupby() orders them as it would text
+            df[c] = df[c].cat.reorder_categories(
+                sorted(df[c].cat.categories), ordered=True
+            )
+        elif kind == "date":
+            df[c] = to_campaign_days(df[c])
+        elif kind != "id":
+            df[c] = df[c].fillna(0)
+
+    return df
@@ -69,6 +69,7 @@ from second_third_doses import abbreviate_time_period
 
 
 from report_results import find_and_save_latest_date, create_output_dirs, report_results, round7
+from dates import NO_DATE, campaign_date, campaign_day
 
 
 # In[ ]:
@@ -87,7 +88,9 @@ savepath, savepath_figure_csvs, savepath_table_csvs = create_output_dirs()
 
 
 
-df = load_adult_data( save_path = savepath )
+# the extract is read and cleaned a million patients at a time, so that the memory needed
+# while cleaning does not grow with the size of the extract
+df = load_adult_data( save_path = savepath, chunksize = 1000000 )
 
 
 # In[ ]:
@@ -185,7 +188,33 @@ features_dict = {0:    u40, ## patients not assigned to a priority group
 
 
 
-df_dict_cum = cumulative_sums(df, groups_of_interest=population_subgroups, features_dict=features_dict, latest_date=latest_date)
+from coverage_cube import read_coverage_cube, refresh_coverage_cube, write_coverage_cube, cube_cumulative_sums, cube_vaccination_counts, release_coverage_cube
+from parallel import pick_n_workers
+from report_results import group_columns
+
+# the population/eligible subgroup of each patient, worked out once for the counts and charts below
+patient_groups = group_columns(df, groups_of_interest=population_subgroups)
+
+# count the patients in each group, by each feature, vaccinated with each dose on each date (once, for all doses)
+# and save these counts, so that the figures below can be reproduced without the patient-level data.
+# Counts for earlier dates are reused from the last run, unless they no longer agree with this extract
+# (the features are shared among N_WORKERS worker processes, if set in project.yaml)
+n_workers = pick_n_workers()
+cube_path = os.path.join(savepath["objects"], f"coverage_cube{suffix}.parquet")
+cube, drift = refresh_coverage_cube(read_coverage_cube(cube_path), df, groups_of_interest=population_subgroups, features_dict=features_dict,
+                                    doses=["covid_vacc_date", "covid_vacc_second_dose_date", "covid_vacc_third_dose_date"],
+                                    extra_features=["priority_status", "brand_of_first_dose"], n_workers=n_workers, groups=patient_groups)
+if len(drift) > 0:
+    print(f"{len(drift)} historical totals differ from the last run, so all dates have been recounted")
+write_coverage_cube(cube, cube_path)
+
+# low numbers are suppressed and other numbers rounded before the cube is released,
+# with a record of how many cells were suppressed
+released_cube, disclosure_audit = release_coverage_cube(cube)
+write_coverage_cube(released_cube, os.path.join(savepath["objects"], f"coverage_cube_released{suffix}.parquet"))
+disclosure_audit.to_csv(os.path.join(savepath["text"], f"disclosure_audit{suffix}.csv"), index=False)
+
+df_dict_cum = cube_cumulative_sums(cube, groups_of_interest=population_subgroups, features_dict=features_dict, latest_date=latest_date)
 
 
 # In[ ]:
@@ -198,10 +227,10 @@ second_dose_features = {}
 for g in groups:
     second_dose_features[g] = []
 
-df_dict_cum_second_dose = cumulative_sums(df, groups_of_interest=population_subgroups, features_dict=second_dose_features, 
+df_dict_cum_second_dose = cube_cumulative_sums(cube, groups_of_interest=population_subgroups, features_dict=second_dose_features, 
                                           latest_date=latest_date, reference_column_name="covid_vacc_second_dose_date")
 
-df_dict_cum_third_dose = cumulative_sums(df, groups_of_interest=population_subgroups, features_dict=second_dose_features, 
+df_dict_cum_third_dose = cube_cumulative_sums(cube, groups_of_interest=population_subgroups, features_dict=second_dose_features, 
                                           latest_date=latest_date, reference_column_name="covid_vacc_third_dose_date")
 
 
@@ -213,7 +242,10 @@ df_dict_cum_third_dose = cumulative_sums(df, groups_of_interest=population_subgr
 
 
 
-from report_results import make_vaccine_graphs
+from report_results import assign_groups, make_vaccine_graphs
+
+# label each patient with their population/eligible subgroup, for the charts and summaries below
+assign_groups(df, groups_of_interest=population_subgroups, groups=patient_groups)
 
 
 # In[ ]:
@@ -221,7 +253,9 @@ from report_results import make_vaccine_graphs
 
 
 
-make_vaccine_graphs(df, latest_date=latest_date, grouping="priority_status", savepath_figure_csvs=savepath_figure_csvs, savepath=savepath, suffix=suffix)
+# the charts of numbers vaccinated are drawn from the cube rather than counting the patient-level data again
+make_vaccine_graphs(df, latest_date=latest_date, grouping="priority_status", savepath_figure_csvs=savepath_figure_csvs, savepath=savepath, suffix=suffix,
+                    counts=cube_vaccination_counts(cube, feature="priority_status"))
 
 
 # In[ ]:
@@ -229,7 +263,13 @@ make_vaccine_graphs(df, latest_date=latest_date, grouping="priority_status", sav
 
 
 
-make_vaccine_graphs(df, latest_date=latest_date, include_total=False, savepath=savepath, savepath_figure_csvs=savepath_figure_csvs, suffix=suffix)
+group_counts = cube_vaccination_counts(cube)
+make_vaccine_graphs(df, latest_date=latest_date, include_total=False, savepath=savepath, savepath_figure_csvs=savepath_figure_csvs, suffix=suffix,
+                    counts=group_counts)
+
+# the same figures at the end of each week, for the long-range view
+make_vaccine_graphs(df, latest_date=latest_date, include_total=False, savepath=savepath, savepath_figure_csvs=savepath_figure_csvs, suffix=suffix,
+                    grain="week", counts=group_counts)
 
 
 # ### Reports 
@@ -379,21 +419,20 @@ ethnicity_completeness(df=df, groups_of_interest=population_subgroups)
 
 def subtract_from_date(s, unit, number, description):
     '''
-    s (series): a series of date-like strings
+    s (series): a series of dates (campaign days)
     unit (str) : days/weeks
     number (int): number of days/weeks to subtract
     description (str): description of new date calculated to use as filename
     '''
     if unit == "weeks":
-        new_date = pd.to_datetime(s).max() - timedelta(weeks=number)
+        new_date = int(s.max()) - 7 * number
     elif unit == "days":
-        new_date = pd.to_datetime(s).max() - timedelta(days=number)
+        new_date = int(s.max()) - number
     else:
         display("invalid unit")
         return
-    new_date = str(new_date)[:10]
 
-    formatted_date = datetime.strptime(new_date, "%Y-%m-%d").strftime("%d %b %Y")
+    formatted_date = campaign_date(new_date, "%d %b %Y")
     with open(os.path.join(savepath["text"], f"{description}.txt"), "w") as text_file:
             text_file.write(formatted_date)
     with open(os.path.join(savepath["text"], f"{description}_specified_delay.txt"), "w") as text_file:
@@ -413,15 +452,14 @@ date_14w, formatted_date_14w = subtract_from_date(s=df["covid_vacc_date"], unit=
 
 
 
-# filter data
-df_s = df.copy()
-# replace any second doses not yet "due" with "0"
-df_s.loc[(pd.to_datetime(df_s["covid_vacc_date"]) >= date_14w), "covid_vacc_second_dose_date"] = 0
+# only second doses which are "due" are counted (those of patients whose first dose was before date_14w),
+# without copying the data (see given_dose_cumulative_sums() below)
 
 # also ensure that first dose was dated after the start of the campaign, otherwise date is likely incorrect 
 # and due date for second dose cannot be calculated accurately
 # this also excludes any second doses where first dose date = 0 (this should affect dummy data only!)
-df_s.loc[(pd.to_datetime(df_s["covid_vacc_date"]) <= "2020-12-07"), "covid_vacc_second_dose_date"] = 0
+from report_results import given_dose_cumulative_sums, due_doses_by_delay
+from coverage_cube import cube_cumulative_sums_as_of
 
 
 # In[ ]:
@@ -445,8 +483,12 @@ for k in features_dict_2:
 
 
 # data processing / summarising
-df_dict_cum_second_dose = cumulative_sums(df_s, groups_of_interest=population_subgroups, features_dict=features_dict_2, 
-                                          latest_date=latest_date, reference_column_name="covid_vacc_second_dose_date")
+# (first doses up to 14 weeks ago, i.e. the patients due second doses, are read from the cube)
+df_dict_cum_14w = cube_cumulative_sums_as_of(cube, groups_of_interest=population_subgroups, features_dict=features_dict_2,
+                                             dates=[date_14w], counted_after="2020-12-07")[date_14w]
+df_dict_cum_second_dose = given_dose_cumulative_sums(df, groups_of_interest=population_subgroups, features_dict=features_dict_2, 
+                                          latest_date=latest_date, dose="covid_vacc_second_dose_date", previous_dose="covid_vacc_date",
+                                          due_date=date_14w, counted_after="2020-12-07", groups=patient_groups)
 
 second_dose_summarised_data_dict = summarise_data_by_group(df_dict_cum_second_dose, latest_date=latest_date, groups=groups)
 
@@ -463,26 +505,17 @@ create_detailed_summary_uptake(second_dose_summarised_data_dict, formatted_lates
 
 
 
-# latest date of 14 weeks ago is entered as the latest_date when calculating cumulative sums below.
+# first doses up to 14 weeks ago were read from the cube with the second doses due, above.
 
 # Seperately, we also ensure that first dose was dated after the start of the campaign, 
 # to be consistent with the second doses due calculated above
-df_14w = df.copy()
-df_14w.loc[(pd.to_datetime(df_14w["covid_vacc_date"]) <= "2020-12-07"), "covid_vacc_date"] = 0
-
-
-df_dict_cum_14w = cumulative_sums(
-                                  df_14w, groups_of_interest=population_subgroups, features_dict=features_dict_2, 
-                                  latest_date=date_14w
-                                  )
-
 summarised_data_dict_14w = summarise_data_by_group(
                                                    df_dict_cum_14w, 
                                                    latest_date=date_14w, 
                                                    groups=groups
                                                    )
 
-create_detailed_summary_uptake(summarised_data_dict_14w, formatted_latest_date=date_14w, 
+create_detailed_summary_uptake(summarised_data_dict_14w, formatted_latest_date=campaign_date(date_14w), 
                                groups=groups,
                                savepath=savepath, vaccine_type="first_dose_14w_ago")
 
@@ -513,14 +546,12 @@ date_3rdDUE, formatted_date_3rdDUE = subtract_from_date(s=df["covid_vacc_date"],
 
 # filtering for third doses that are "due"
 
-df_t = df.copy()
-# replace any third doses not yet "due" with "0"
-df_t.loc[(pd.to_datetime(df_t["covid_vacc_second_dose_date"]) >= date_3rdDUE), "covid_vacc_third_dose_date"] = 0
+# only third doses of patients whose second dose was before date_3rdDUE are counted (see below)
 
 # also ensure that second dose was dated (2weeks) after the start of the campaign, otherwise date is likely incorrect 
 # and due date for third dose cannot be calculated accurately
 # this also excludes any third doses where second dose date = 0 (this should affect dummy data only!)
-df_t.loc[(pd.to_datetime(df_t["covid_vacc_second_dose_date"]) <= "2020-12-21"), "covid_vacc_third_dose_date"] = 0
+third_dose_counted_after = "2020-12-21"
 
 
 # In[ ]:
@@ -533,8 +564,13 @@ df_t.loc[(pd.to_datetime(df_t["covid_vacc_second_dose_date"]) <= "2020-12-21"),
 # Include 18+ age groups plus priority groups (50+/CEV/Care home etc) only
 population_subgroups_third = {key: value for key, value in population_subgroups.items() if 0 < value < 13}
 
-df_dict_cum_third_dose = cumulative_sums(df_t, groups_of_interest=population_subgroups_third, features_dict=features_dict,
-                                         latest_date=latest_date, reference_column_name="covid_vacc_third_dose_date")
+# (second doses up to the date third doses became due are read from the cube)
+df_dict_cum_3rdDUE = cube_cumulative_sums_as_of(cube, groups_of_interest=population_subgroups_third, features_dict=features_dict,
+                                                dates=[date_3rdDUE], reference_column_name="covid_vacc_second_dose_date",
+                                                counted_after=third_dose_counted_after)[date_3rdDUE]
+df_dict_cum_third_dose = given_dose_cumulative_sums(df, groups_of_interest=population_subgroups_third, features_dict=features_dict,
+                                         latest_date=latest_date, dose="covid_vacc_third_dose_date", previous_dose="covid_vacc_second_dose_date",
+                                         due_date=date_3rdDUE, counted_after=third_dose_counted_after)
 
 third_dose_summarised_data_dict = summarise_data_by_group(
     df_dict_cum_third_dose, latest_date=latest_date, groups=population_subgroups_third.keys())
@@ -543,6 +579,15 @@ create_detailed_summary_uptake(third_dose_summarised_data_dict, formatted_latest
                                groups=population_subgroups_third.keys(),
                                savepath=savepath, vaccine_type="third_dose")
 
+# for comparison, third doses due, given and overdue had they become due after other delays
+# (all the delays are counted together)
+booster_delays = list(dict.fromkeys(["8 weeks", "12 weeks", f"{booster_delay_number} {booster_delay_unit}", "26 weeks"]))
+third_doses_by_delay = due_doses_by_delay(df, groups_of_interest=population_subgroups_third, latest_date=latest_date,
+                                          dose="covid_vacc_third_dose_date", previous_dose="covid_vacc_second_dose_date",
+                                          delays=booster_delays, counted_after=third_dose_counted_after)
+third_doses_by_delay.to_csv(os.path.join(savepath["tables"], f"third_doses_due_by_delay{suffix}.csv"))
+display(third_doses_by_delay)
+
 
 # In[ ]:
 
@@ -557,25 +602,16 @@ display(Markdown(f"## For comparison look at second dose coverage UP TO {booster
 
 
 
-# latest date of 200 days ago is entered as the latest_date when calculating cumulative sums below.
+# second doses up to the date third doses became due were read from the cube with the third doses due, above.
 
 # Seperately, we also ensure that second dose was dated 2 weeks after the start of the campaign, 
 # to be consistent with the third doses due calculated above
-df_3rdDUE = df.copy()
-df_3rdDUE.loc[(pd.to_datetime(df_3rdDUE["covid_vacc_second_dose_date"]) <= "2020-12-21"), "covid_vacc_second_dose_date"] = 0
-
-df_dict_cum_3rdDUE = cumulative_sums(
-    df_3rdDUE, groups_of_interest=population_subgroups_third, features_dict=features_dict,
-    latest_date=date_3rdDUE,
-                                  reference_column_name="covid_vacc_second_dose_date"
-                                  )
-
 summarised_data_dict_3rdDUE = summarise_data_by_group(
                                                    df_dict_cum_3rdDUE, latest_date=date_3rdDUE,
                                                    groups=population_subgroups_third.keys()
                                                    )
 
-create_detailed_summary_uptake(summarised_data_dict_3rdDUE, formatted_latest_date=date_3rdDUE,
+create_detailed_summary_uptake(summarised_data_dict_3rdDUE, formatted_latest_date=campaign_date(date_3rdDUE),
                                groups=population_subgroups_third.keys(),
                                savepath=savepath, vaccine_type=f"second_dose_{booster_delay_number}{booster_delay_unit_short}_ago")
 
@@ -70,6 +70,7 @@ from report_results import (
     report_results,
     round7,
 )
+from dates import NO_DATE, campaign_date, campaign_dates, campaign_day
 
 
 # In[ ]:
@@ -87,8 +88,10 @@ savepath, savepath_figure_csvs, savepath_table_csvs = create_output_dirs(
 # In[ ]:
 
 
+# the extract is read and cleaned a million patients at a time, so that the memory needed
+# while cleaning does not grow with the size of the extract
 df = load_child_data(
-    input_file=f"input_delivery_{group_string}.csv.gz", save_path=savepath
+    input_file=f"input_delivery_{group_string}.csv.gz", save_path=savepath, chunksize=1000000
 )
 
 
@@ -151,12 +154,58 @@ features_dict = {
 # In[ ]:
 
 
-df_dict_cum = cumulative_sums(
+from coverage_cube import (
+    read_coverage_cube,
+    refresh_coverage_cube,
+    write_coverage_cube,
+    cube_cumulative_sums,
+    cube_vaccination_counts,
+    release_coverage_cube,
+)
+from parallel import pick_n_workers
+from report_results import group_columns
+
+# the population/eligible subgroup of each patient, worked out once for the counts and charts below
+patient_groups = group_columns(df, groups_of_interest=population_subgroups, all_keys=[0, 1, 2])
+
+# count the patients in each group, by each feature, vaccinated with each dose on each date (once, for all doses)
+# and save these counts, so that the figures below can be reproduced without the patient-level data.
+# Counts for earlier dates are reused from the last run, unless they no longer agree with this extract
+# (the features are shared among N_WORKERS worker processes, if set in project.yaml)
+n_workers = pick_n_workers()
+cube_path = os.path.join(savepath["objects"], "coverage_cube.parquet")
+cube, drift = refresh_coverage_cube(
+    read_coverage_cube(cube_path),
     df,
     groups_of_interest=population_subgroups,
     features_dict=features_dict,
-    latest_date=latest_date,
+    doses=["covid_vacc_date", "covid_vacc_second_dose_date"],
     all_keys=[0, 1, 2],
+    extra_features=["brand_of_first_dose"],
+    n_workers=n_workers,
+    groups=patient_groups,
+)
+if len(drift) > 0:
+    print(
+        f"{len(drift)} historical totals differ from the last run, so all dates have been recounted"
+    )
+write_coverage_cube(cube, cube_path)
+
+# low numbers are suppressed and other numbers rounded before the cube is released,
+# with a record of how many cells were suppressed
+released_cube, disclosure_audit = release_coverage_cube(cube)
+write_coverage_cube(
+    released_cube, os.path.join(savepath["objects"], "coverage_cube_released.parquet")
+)
+disclosure_audit.to_csv(
+    os.path.join(savepath["text"], "disclosure_audit.csv"), index=False
+)
+
+df_dict_cum = cube_cumulative_sums(
+    cube,
+    groups_of_interest=population_subgroups,
+    features_dict=features_dict,
+    latest_date=latest_date,
 )
 
 
@@ -168,8 +217,8 @@ second_dose_features = {}
 for g in groups:
     second_dose_features[g] = []
 
-df_dict_cum_second_dose = cumulative_sums(
-    df,
+df_dict_cum_second_dose = cube_cumulative_sums(
+    cube,
     groups_of_interest=population_subgroups,
     features_dict=second_dose_features,
     latest_date=latest_date,
@@ -185,12 +234,18 @@ df_dict_cum_second_dose = cumulative_sums(
 # In[ ]:
 
 
-from report_results import make_vaccine_graphs
+from report_results import assign_groups, make_vaccine_graphs
+
+# label each patient with their population/eligible subgroup, for the charts and summaries below
+assign_groups(
+    df, groups_of_interest=population_subgroups, all_keys=[0, 1, 2], groups=patient_groups
+)
 
 
 # In[ ]:
 
 
+# the charts of numbers vaccinated are drawn from the cube rather than counting the patient-level data again
 make_vaccine_graphs(
     df,
     latest_date=latest_date,
@@ -198,6 +253,7 @@ make_vaccine_graphs(
     savepath_figure_csvs=savepath_figure_csvs,
     savepath=savepath,
     suffix=suffix,
+    counts=cube_vaccination_counts(cube, feature="risk_status"),
 )
 
 
@@ -206,10 +262,7 @@ make_vaccine_graphs(
 
 ### Adding age groups
 
-population_subgroups_num2group = {v: k for k, v in population_subgroups.items()}
-df.loc[:, "age_group"] = df["priority_group"]
-df.replace({"age_group": population_subgroups_num2group}, inplace=True)
-
+# (the age groups are the population subgroups of the cube)
 make_vaccine_graphs(
     df,
     latest_date=latest_date,
@@ -218,6 +271,7 @@ make_vaccine_graphs(
     savepath=savepath,
     savepath_figure_csvs=savepath_figure_csvs,
     suffix=suffix,
+    counts=cube_vaccination_counts(cube),
 )
 
 
@@ -377,21 +431,20 @@ ethnicity_completeness(
 
 def subtract_from_date(s, unit, number, description):
     """
-    s (series): a series of date-like strings
+    s (series): a series of dates (campaign days)
     unit (str) : days/weeks
     number (int): number of days/weeks to subtract
     description (str): description of new date calculated to use as filename
     """
     if unit == "weeks":
-        new_date = pd.to_datetime(s).max() - timedelta(weeks=number)
+        new_date = int(s.max()) - 7 * number
     elif unit == "days":
-        new_date = pd.to_datetime(s).max() - timedelta(days=number)
+        new_date = int(s.max()) - number
     else:
         display("invalid unit")
         return
-    new_date = str(new_date)[:10]
 
-    formatted_date = datetime.strptime(new_date, "%Y-%m-%d").strftime("%d %b %Y")
+    formatted_date = campaign_date(new_date, "%d %b %Y")
     with open(os.path.join(savepath["text"], f"{description}.txt"), "w") as text_file:
         text_file.write(formatted_date)
     with open(
@@ -420,18 +473,23 @@ date_secondDue, formatted_date_secondDue = subtract_from_date(
 
 
 # filter data
+from report_results import given_dose_cumulative_sums, due_dose_dates
+from coverage_cube import cube_cumulative_sums_as_of
 
-df_s = df.copy()
-# replace any second doses not yet "due" with "0"
-df_s.loc[(pd.to_datetime(df_s["covid_vacc_date"]) >= date_secondDue),"covid_vacc_second_dose_date"] = 0
+# only second doses which are "due" are counted (those of patients whose first dose was before date_secondDue),
+# without copying the data
 
 # also ensure that first dose was dated after the start of the campaign, otherwise date is likely incorrect
 # and due date for second dose cannot be calculated accurately
 # this also excludes any second doses where first dose date = 0 (this should affect dummy data only!)
-df_s.loc[
-    (pd.to_datetime(df_s["covid_vacc_date"]) <= "2021-08-04"),
-    "covid_vacc_second_dose_date"
-] = 0
+second_dose_counted_after = "2021-08-04"
+second_dose_dates = due_dose_dates(
+    df,
+    "covid_vacc_second_dose_date",
+    "covid_vacc_date",
+    due_date=date_secondDue,
+    counted_after=second_dose_counted_after,
+)
 
 
 # In[ ]:
@@ -450,12 +508,24 @@ for k in features_dict_2:
 
 
 # data processing / summarising
-df_dict_cum_second_dose = cumulative_sums(
-    df_s,
+# (first doses up to 14 weeks ago, i.e. the patients due second doses, are read from the cube)
+df_dict_cum_secondDue = cube_cumulative_sums_as_of(
+    cube,
+    groups_of_interest=population_subgroups,
+    features_dict=features_dict_2,
+    dates=[date_secondDue],
+    counted_after=second_dose_counted_after,
+)[date_secondDue]
+df_dict_cum_second_dose = given_dose_cumulative_sums(
+    df,
     groups_of_interest=population_subgroups,
     features_dict=features_dict_2,
     latest_date=latest_date,
-    reference_column_name="covid_vacc_second_dose_date",
+    dose="covid_vacc_second_dose_date",
+    previous_dose="covid_vacc_date",
+    due_date=date_secondDue,
+    counted_after=second_dose_counted_after,
+    groups=patient_groups,
 )
 
 second_dose_summarised_data_dict = summarise_data_by_group(
@@ -492,30 +562,17 @@ create_detailed_summary_uptake(
 # In[ ]:
 
 
-# latest date of 14 weeks ago is entered as the latest_date when calculating cumulative sums below.
+# first doses up to 14 weeks ago were read from the cube with the second doses due, above.
 
 # Seperately, we also ensure that first dose was dated after the start of the campaign,
 # to be consistent with the second doses due calculated above
-df_secondDue = df.copy()
-df_secondDue.loc[
-    (pd.to_datetime(df_secondDue["covid_vacc_date"]) <= "2021-08-04"), "covid_vacc_date"
-] = 0
-
-
-df_dict_cum_secondDue = cumulative_sums(
-    df_secondDue,
-    groups_of_interest=population_subgroups,
-    features_dict=features_dict_2,
-    latest_date=date_secondDue,
-)
-
 summarised_data_dict_secondDue = summarise_data_by_group(
     df_dict_cum_secondDue, latest_date=date_secondDue, groups=groups
 )
 
 create_detailed_summary_uptake(
     summarised_data_dict_secondDue,
-    formatted_latest_date=date_secondDue,
+    formatted_latest_date=campaign_date(date_secondDue),
     groups=groups,
     savepath=savepath,
     vaccine_type=f"first_dose_{second_scheduling_string_short}_ago",
@@ -548,28 +605,22 @@ for k in features_dict_all:
 # In[ ]:
 
 
-df_secondDue = df_s.copy().loc[(df["covid_vacc_date"] != 0)]
-
-
 # The checking for who is due is carried out in the cumulative_sums()
 # function, so we need to do that here instead.
-df_secondDue = df_secondDue.loc[ df_secondDue["covid_vacc_date"] < date_secondDue ]
-
-df_secondDue_time2second = (
-    df_secondDue.assign(
-        time_to_second_dose=lambda x: (
-            pd.to_datetime(x.covid_vacc_second_dose_date)
-            - pd.to_datetime(x.covid_vacc_date)
-        ).dt.days
-    )
-    .assign(same_brand=lambda x: x.brand_of_first_dose == x.brand_of_second_dose)
-    .assign(all="ALL")
+# (only the second doses which were due are kept, as counted above, and only the values
+# needed are worked out, from the dates, rather than copying the data)
+first_dose_dates = df["covid_vacc_date"].to_numpy()
+due = (first_dose_dates != NO_DATE) & (first_dose_dates < date_secondDue)
+
+# dates are campaign days, so the difference is in days
+time_to_second_dose = np.where(
+    second_dose_dates != NO_DATE, second_dose_dates - first_dose_dates, np.nan
+)[due]
+
+df_secondDue_time2second = pd.DataFrame(
+    {"time_to_second_dose": time_to_second_dose, "all": "ALL"}, index=df.index[due]
 )
 
-df_secondDue_time2second.loc[
-    df_secondDue_time2second["covid_vacc_second_dose_date"] == 0, "time_to_second_dose"
-] = np.nan
-
 
 # In[ ]:
 
@@ -580,9 +631,14 @@ pickle_location = savepath["objects"]
 
 with open(os.path.join(pickle_location, f"time2seconddose-variables2.pkl"), "wb") as f:
     pd.to_pickle(
-        df_secondDue_time2second[
-            ["covid_vacc_date", "covid_vacc_second_dose_date", "time_to_second_dose"]
-        ],
+        pd.DataFrame(
+            {
+                "covid_vacc_date": campaign_dates(first_dose_dates[due]),
+                "covid_vacc_second_dose_date": campaign_dates(second_dose_dates[due]),
+                "time_to_second_dose": time_to_second_dose,
+            },
+            index=df.index[due],
+        ),
         f,
     )
 
@@ -596,8 +652,9 @@ from report_results import cumulative_sums_byValue, plot_cumulative_charts
 # for their first and second doses (this is redundant for kids as the vast majority of the
 # kids received the Pfizer vaccine). This is retained in the comments as an example of how
 # results would be obtained from a particular subset of the population.
-# df_secondDue_time2second_matched = df_secondDue_time2second.query( 'same_brand' )
-# df_time2second_matched_cum = cumulative_sums_byValue(df_secondDue_time2second_matched, groups_of_interest=population_subgroups, features_dict=features_dict_brand, latest_date=latest_date, all_keys=[0,1,2])
+# same_brand = (df["brand_of_first_dose"] == df["brand_of_second_dose"]).to_numpy()[due]
+# df_secondDue_time2second_matched = df_secondDue_time2second.assign(brand_of_first_dose=df["brand_of_first_dose"].to_numpy()[due], brand_of_second_dose=df["brand_of_second_dose"].to_numpy()[due]).loc[same_brand]
+# df_time2second_matched_cum = cumulative_sums_byValue(df_secondDue_time2second_matched, groups_of_interest=population_subgroups, features_dict=features_dict_brand, latest_date=latest_date, all_keys=[0,1,2], groups=patient_groups.loc[due].loc[same_brand])
 
 # Looking at time to second dose for ALL children (irrespective of brand)
 df_time2second_cum = cumulative_sums_byValue(
@@ -605,7 +662,8 @@ df_time2second_cum = cumulative_sums_byValue(
     groups_of_interest=population_subgroups,
     features_dict=features_dict_all,
     latest_date=latest_date,
-    all_keys=[0, 1, 2]
+    all_keys=[0, 1, 2],
+    groups=patient_groups.loc[due],
 )
 
 
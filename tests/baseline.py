@@ -0,0 +1,480 @@
+"""
+Reference copies of functions as they were before the counting, due-dose and brand
+code was rewritten, for checking that the rewritten functions give the same results.
+Dates are "YYYY-MM-DD" strings (0 where missing) and flags are 0/1, as they were then.
+
+The only changes are that Series are indexed by position with iloc (rather than [0],
+which later versions of pandas read as a label) and that dates are read by to_datetime()
+below, so the tests run on any version.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def filtering(d, all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]):
+    """
+    Find items from the full set of single digit numbers (0-9) which are not present as values in a given dict
+
+    Inputs:
+    d (dict): a dict mapping strings to numeric `values`
+    all_keys (list): a full set of numbers that the `values` in d can be
+
+    Outputs:
+    l (list): a list containing zero and all the single digit numbers (specified by `all_keys`) which do not appear in d
+
+    """
+    keys = list(d.values())
+
+    # check which of `all_keys` are absent in `keys` and return them as a list (but always include 0)
+    l = [k for k in all_keys if ((k not in keys) | (k == 0))]
+    return l
+
+
+def cumulative_sums(
+    df,
+    groups_of_interest,
+    features_dict,
+    latest_date,
+    reference_column_name="covid_vacc_date",
+    all_keys=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+):
+    """
+    Calculate cumulative sums across groups.
+    This function is intended for DATE data (i.e., cumulative sums are calculated across time).
+
+    Args:
+        df (dataframe): input data
+        groups_of_interest (dict): dict mapping names of population/eligible subgroups to integers (1-9, and 0 for "other")
+        features_dict (dict): dictionary mapping population subgroups to a list of demographic/clinical factors to include for that group
+        latest_date (str): "YYYY-MM-DD"
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+
+    Returns:
+        df_dict_out (dict): This dict is a mapping from a group name (e.g '80+') to another dict, which is a mapping from a feature name (e.g. 'sex') to a dataframe containing cumulative sums of vaccination data per day.
+    """
+
+    # Creates an empty dict to collect results as passes through function
+    df_dict_out = {}
+
+    # for each group within the desired groups, it filters to that particular group. it
+    # also selects columns of interest. For example, in care home, we are interested in
+    # sex, ageband and broad ethnicity groups. In the analysis of age bands we are interested
+    # in much more detail such as comorbidities and ethnicity in 16 groups.
+
+    # make a new field for the priority groups we are looking at (where any we have not specifically listed are regrouped as 0/"other")
+    items_to_group = filtering(groups_of_interest, all_keys=all_keys)
+    df["group"] = np.where(
+        df["priority_group"].isin(items_to_group), 0, df["priority_group"]
+    )
+    # translate number into name
+    for name, number in groups_of_interest.items():
+        df.loc[df["group"] == number, "group_name"] = name
+
+    for group_title, group_label in groups_of_interest.items():
+        out = df.copy().loc[(df["group"] == group_label)]
+
+        # define columns to include, ie. a list of features of interest (e.g. ageband, ethnicity) per population group
+        if group_title in features_dict:
+            cols = features_dict[group_title]
+        elif group_label in features_dict:  ## "other" group
+            cols = features_dict[group_label]
+        else:  # for age bands use all available features
+            cols = features_dict["DEFAULT"]
+
+        df_dict_temp = filtered_cumulative_sum(
+            df=out,
+            columns=cols,
+            latest_date=latest_date,
+            reference_column_name=reference_column_name,
+        )
+
+        df_dict_out[group_title] = df_dict_temp
+
+    return df_dict_out
+
+
+def filtered_cumulative_sum(
+    df, columns, latest_date, reference_column_name="covid_vacc_date"
+):
+    """
+    This calculates cumulative sums for a dataframe, and when given a set of
+    characteristics as columns, produces a dictionary of dataframes.
+    This function is intended for DATE data (i.e., cumulative sums are calculated over time).
+
+    Args:
+        df (Dataframe): pandas dataframe. At the very least this needs a column with a date in
+            YYYY-MM-DD format, a column called 'covid_vacc_date' and a 'covid_vacc_flag'.
+        columns (list): list of subgroups e.g. ageband, sex
+        latest_date (datetime object): the date of the latest date of counting vaccines
+        reference_column_name (str): e.g. "covid_vacc_date" for first dose, "covid_vacc_second_dose_date" for second dose
+
+    Returns:
+        Dict (of dataframes): Each dataframe produced has a date as a row, with the value of the number
+            of vaccinations, the total that could be vaccinated (i.e. the denominator) and
+            the cumulative percentage vaccinated.
+
+            For overall population, i.e no subgroups, if the initial value is less that 7, it is
+            rounded to 0. For subgroups, the numerator (i.e the number of people who had a vaccine)
+            is rounded to the nearest 7.
+    """
+    # This creates an empty dictionary that is used as a temporary collection place for the processed figures
+    df_dict_temp = {}
+
+    # overall figures
+    total = df[["patient_id"]].nunique().iloc[0]
+
+    # Copies the dataframe but filters only to those who have had a vaccine recorded
+    filtered = df.copy().loc[(df[reference_column_name] != 0)]
+
+    # group by date of covid vaccines to calculate cumulative sum of vaccines at each date of the campaign
+    out2 = pd.DataFrame(
+        filtered.groupby([reference_column_name])[["patient_id"]]
+        .nunique()
+        .unstack()
+        .fillna(0)
+        .cumsum()
+    ).reset_index()
+    out2 = out2.rename(columns={0: "overall"}).drop(columns=["level_0"])
+
+    # filter to latest date and earlier (usually no effect unless a date earlier than the latest available data is passed)
+    out2 = out2.loc[out2[reference_column_name] <= latest_date]
+
+    # in case no vaccinations on latest date for some orgs/groups, insert the latest data as a new row with the required date:
+    if latest_date not in list(out2[reference_column_name]):
+        out2.loc[max(out2.index) + 1] = [
+            latest_date,
+            out2.loc[out2[reference_column_name] < latest_date]["overall"].max(),
+        ]
+
+    # suppress low numbers
+    out2["overall"] = round7(
+        out2["overall"].replace([1, 2, 3, 4, 5, 6], 0).fillna(0).astype(int)
+    )
+
+    # Rounds the overall_total values (and makes into integers)
+    out2["overall_total"] = round7(total)
+
+    # create a percentage by dividing results by total
+    out2[f"overall_percent"] = 100 * (out2["overall"] / out2["overall_total"])
+
+    df_dict_temp["overall"] = out2.set_index(reference_column_name)
+
+    # figures by demographic/clinical features
+    for feature in columns:
+        if feature == "sex":
+            df = df.loc[df[feature].isin(["M", "F"])]
+            filtered = filtered.loc[filtered[feature].isin(["M", "F"])]
+
+        # find total number of patients in each subgroup (e.g. no of males and no of females)
+        totals = (
+            df.groupby([feature])[["patient_id"]]
+            .nunique()
+            .rename(columns={"patient_id": "total"})
+            .transpose()
+        )
+        # suppress low numbers
+        totals = totals.replace([1, 2, 3, 4, 5, 6], 0).fillna(0)
+        totals = round7(totals)
+
+        # find total number of patients vaccinated in each subgroup (e.g. no of males and no of females),
+        # cumulative at each date of the campaign
+        out2 = (
+            filtered.copy()
+            .groupby([feature, reference_column_name])["patient_id"]
+            .nunique()
+            .unstack(0)
+        )
+        out2 = out2.fillna(0).cumsum()
+
+        # filter to latest date and earlier (usually no effect unless a date earlier than the latest available data is passed)
+        out2 = out2.loc[out2.index <= latest_date]
+
+        # suppress low numbers
+        out2 = out2.replace([1, 2, 3, 4, 5, 6], 0).fillna(0)
+        # round other values to nearest 7
+        out2 = round7(out2)
+
+        for c2 in out2.columns:
+            out2[f"{c2}_total"] = totals[c2].iloc[0].astype(int)
+            # calculate percentage
+            out2[f"{c2}_percent"] = 100 * (out2[c2] / out2[f"{c2}_total"])
+
+        # in case no vaccinations on latest date for some orgs/groups, insert the latest data as a new row with the required date
+        if out2.index.max() < latest_date:
+            out2.loc[latest_date] = out2.max()
+
+        df_dict_temp[feature] = out2
+
+    return df_dict_temp
+
+
+def round7(input_):
+    """
+    Round input_ to nearest 7
+
+    Args:
+        input_ (int/float/df/series): number or dataframe to be rounded
+
+    Returns:
+        int/df/series: rounded to the nearest 7
+
+    """
+    if (isinstance(input_, pd.DataFrame)) | (isinstance(input_, pd.Series)):
+        return 7 * round((input_ / 7), 0)
+    else:
+        return int(7 * round((input_ / 7), 0))
+
+
+def make_conditions(
+    df,
+    dose_list={"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"},
+    vaccine_dates={
+        "covid_vacc_pfizerC_date": "2022-12-22",
+        "covid_vacc_pfizerA_date": "2020-12-07",
+        "covid_vacc_oxford_date": "2020-01-03",
+        "covid_vacc_moderna_date": "2021-04-06",
+    },
+    field_to_check_for_unknown=None,
+):
+    """
+    This generates a set of conditions for using in np.select(). The
+    function will loop through a list of doses (as defined in the
+    parameter `dose_list') and then ensure that vaccines are not being
+    recorded for different brands on the same day.
+
+    If dates are not relevant, the values in the `vaccine_dates' dictionary
+    can be set to None. If we only want to check that the provided date
+    is present, and not compare it to a reference date, the values for
+    the `dose_list' dictionary can be set to None.
+
+    Args:
+        df (data frame): input data, as generated by load_*_data() functions
+        dose_list (dict): a dict, where keys are dose strings and values are
+                          the field names for the dates of those doses (if the
+                          date is set to None, the date will not be considered
+                          in the condition statement)
+        vaccine_dates (dict): a dict, where keys give field names for the date of
+                          different brands of the vaccine and values are dates
+                          before which those brands cannot be administered (if
+                          the date is set to None, the date will not be
+                          considered in the condition statement)
+    Returns:
+        all_conditions (list): a list of conditions, one for each dose
+
+    """
+
+    ### A dictionary recording the condition list for each dose.
+    all_conditions = {}
+
+    for dose, field_name in dose_list.items():
+
+        ### This list records the condition flag - there should be
+        ### a condition for each vaccine plus one more for "Unknown"
+        num_conditions = len(vaccine_dates.items()) + 1
+        dose_conditions = [None] * num_conditions
+        v_i = 0
+
+        ### Building a condition flag for each vaccine -
+        ### v_focus = field containing the dates for a particular brand of vaccine (e.g., "covid_vacc_pfizerC_date")
+        ### v_date = date before which this vaccine could not have been administered (e.g. "2020-12-07")
+        for v_focus, v_date in vaccine_dates.items():
+
+            ### The first element in generating the condition flag
+            ### is to test that the contents of the v_focus column:
+            ### If field_name is not None (e.g., "covid_vacc_date"), then
+            ### we check that our v_focus date is the field_name date - if they are
+            ### the same then we know that the covid_vaccination was of this particular brand.
+            ### However, if field_name IS None, we check to see if this column
+            ### does not equal zero (i.e., it has something in it).
+            this_flag = df[v_focus] != 0
+            if field_name != None:
+                this_flag = df[v_focus] == df[field_name]
+
+            ### If a date is provided that defines when a particular brand of
+            ### of vaccine came online, then we can use that information to check
+            ### that the vaccine brand is possible. If dates have not been provided,
+            ### then we don't have to update the condition flag (the date constraint
+            ### may have been implemented in the study definition instead).
+            if v_date != None:
+                this_flag = this_flag & (df[v_focus].astype(str) >= v_date)
+
+            ### This creates a list of all brands of vaccine that are NOT v_focus
+            ### so that we can loop through them and compare to v_focus in the next
+            ### step.
+            v_others = [x for x in vaccine_dates.keys() if v_focus not in x]
+
+            ### Occassionally, we have vaccines recorded on the same day for the
+            ### same patient but different brands. We only want to record data
+            ### for vaccines that were not recorded on the same day as another brand.
+            for v_other in v_others:
+                this_flag = this_flag & (df[v_focus] != df[v_other])
+
+            ### Recording this flag for this brand in the dose conditions list.
+            dose_conditions[v_i] = this_flag
+            v_i += 1
+
+        ### The field_to_check_for_unknown is the name of the field that needs to be
+        ### checked for contents in the case of the brand being unknown. The user
+        ### can provide this as a parameter, if it is not provided, then we assume
+        ### that the field to check is `field_name'.
+        if field_to_check_for_unknown == None:
+            field_to_check_for_unknown = field_name
+        dose_conditions[v_i] = df[field_to_check_for_unknown] != 0
+
+        all_conditions[dose] = dose_conditions
+
+    return all_conditions
+
+
+def adult_brands(df):
+    """
+    The brand of each dose, worked out as load_adult_data() did.
+
+    Args:
+        df (data frame): input data, with the dates of each dose and brand
+
+    Returns:
+        df (data frame): input data, with the brand of each dose added
+    """
+    # This excludes any uncertain cases where date of brand was too early or multiple brands were recorded
+    choices = ["Oxford-AZ", "Pfizer", "Moderna", "Unknown"]
+    doses = {"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"}
+    for dose, field_name in doses.items():
+        conditions = [
+            (  # pt has had an oxford vaccine, on or after the date this brand was first administered
+                # in UK (minus 1 day; if date is unfeasible, vaccine type may be incorrect):
+                df["covid_vacc_oxford_date"].astype(str)
+                >= "2020-01-03"
+            )
+            & (
+                # oxford vaccine was on date of selected dose:
+                df["covid_vacc_oxford_date"]
+                == df[field_name]
+            )
+            & (
+                # oxford vaccine was not on same date as another brand:
+                df["covid_vacc_oxford_date"]
+                != df["covid_vacc_pfizer_date"]
+            )
+            & (df["covid_vacc_oxford_date"] != df["covid_vacc_moderna_date"]),
+            ## repeat for pfizer and moderna:
+            (df["covid_vacc_pfizer_date"].astype(str) >= "2020-12-07")
+            & (df["covid_vacc_pfizer_date"] == df[field_name])
+            & (df["covid_vacc_pfizer_date"] != df["covid_vacc_oxford_date"])
+            & (df["covid_vacc_pfizer_date"] != df["covid_vacc_moderna_date"]),
+            # moderna - only include if dose date is after the date first administered in UK
+            (df["covid_vacc_moderna_date"].astype(str) >= "2021-04-06")
+            & (df["covid_vacc_moderna_date"] == df[field_name])
+            & (df["covid_vacc_moderna_date"] != df["covid_vacc_oxford_date"])
+            & (df["covid_vacc_moderna_date"] != df["covid_vacc_pfizer_date"]),
+            ## unknown type - pt has had the dose but the above conditions do not apply
+            # these may be unspecified brands or where two diff brands were recorded same day
+            df[field_name] != 0,
+        ]
+
+        df[f"brand_of_{dose}_dose"] = np.select(conditions, choices, default="none")
+
+    # Third doses - brands
+    # No dates required as date filtering occurs in study definition
+    conditions = [
+        (
+            (df["covid_vacc_third_dose_oxford_date"] != 0)
+            & (
+                df["covid_vacc_third_dose_oxford_date"]
+                != df["covid_vacc_third_dose_pfizer_date"]
+            )
+            & (
+                df["covid_vacc_third_dose_oxford_date"]
+                != df["covid_vacc_third_dose_moderna_date"]
+            )
+        ),
+        (
+            (df["covid_vacc_third_dose_pfizer_date"] != 0)
+            & (
+                df["covid_vacc_third_dose_pfizer_date"]
+                != df["covid_vacc_third_dose_oxford_date"]
+            )
+            & (
+                df["covid_vacc_third_dose_pfizer_date"]
+                != df["covid_vacc_third_dose_moderna_date"]
+            )
+        ),
+        (
+            (df["covid_vacc_third_dose_moderna_date"] != 0)
+            & (
+                df["covid_vacc_third_dose_moderna_date"]
+                != df["covid_vacc_third_dose_oxford_date"]
+            )
+            & (
+                df["covid_vacc_third_dose_moderna_date"]
+                != df["covid_vacc_third_dose_pfizer_date"]
+            )
+        ),
+        ## unknown type - pt has had the dose but the above conditions do not apply
+        # these may be unspecified brands or where two diff brands were recorded same day
+        df["covid_vacc_third_dose_oxford_date"] != 0,
+    ]
+
+    df[f"brand_of_third_dose"] = np.select(conditions, choices, default="none")
+
+    return df
+
+
+def to_datetime(dates):
+    """
+    Reads dates as pd.to_datetime() did in pandas 1.x, where a missing date (0) was read as
+    1970-01-01 (later versions refuse to mix 0 with date strings). Missing dates are NaT at
+    first, then 1970-01-01, so they still count as before any date.
+
+    Args:
+        dates (Series): "YYYY-MM-DD", or 0 if missing
+
+    Returns:
+        Series: the dates, as datetimes
+    """
+    return pd.to_datetime(dates.where(dates != 0)).fillna(pd.Timestamp(0))
+
+
+def given_when_due(df, dose, previous_dose, due_date, counted_after):
+    """
+    The data with doses not yet due zeroed, as the notebooks did before counting the doses
+    given to those for whom they were due (e.g. second doses given after first doses 14 weeks ago).
+
+    Args:
+        df (data frame): input data
+        dose (str): e.g. "covid_vacc_second_dose_date"
+        previous_dose (str): e.g. "covid_vacc_date"
+        due_date (str): "YYYY-MM-DD"
+        counted_after (str): "YYYY-MM-DD"
+
+    Returns:
+        df_s (data frame): a copy of the data
+    """
+    df_s = df.copy()
+    # replace any second doses not yet "due" with "0"
+    df_s.loc[(to_datetime(df_s[previous_dose]) >= due_date), dose] = 0
+
+    # also ensure that first dose was dated after the start of the campaign, otherwise date is likely incorrect
+    # and due date for second dose cannot be calculated accurately
+    # this also excludes any second doses where first dose date = 0 (this should affect dummy data only!)
+    df_s.loc[(to_datetime(df_s[previous_dose]) <= counted_after), dose] = 0
+    return df_s
+
+
+def previous_when_due(df, previous_dose, counted_after):
+    """
+    The data with early previous doses zeroed, as the notebooks did before counting the
+    previous doses up to the due date (e.g. first doses up to 14 weeks ago).
+
+    Args:
+        df (data frame): input data
+        previous_dose (str): e.g. "covid_vacc_date"
+        counted_after (str): "YYYY-MM-DD"
+
+    Returns:
+        df_14w (data frame): a copy of the data
+    """
+    df_14w = df.copy()
+    df_14w.loc[(to_datetime(df_14w[previous_dose]) <= counted_after), previous_dose] = 0
+    return df_14w
@@ -0,0 +1,155 @@
+"""
+A small synthetic cohort, in the form the data now take (dates as campaign days, flags as
+booleans) and in the form they took before (see baseline.py), for comparing results.
+"""
+
+import numpy as np
+import pandas as pd
+
+from dates import NO_DATE, campaign_dates, campaign_day
+
+
+POPULATION_SUBGROUPS = {"80+": 1, "70-79": 2, "care home": 3, "16-69": 5, "other": 0}
+
+FEATURES_DICT = {
+    "80+": ["ageband", "sex", "dementia"],
+    "care home": ["sex", "ageband"],
+    0: ["dementia"],
+    "DEFAULT": ["ageband", "dementia", "sex", "ethnicity"],
+}
+
+FLAGS = ["dementia"]
+
+DOSES = ["covid_vacc_date", "covid_vacc_second_dose_date", "covid_vacc_third_dose_date"]
+
+
+def make_cohort(n=4000, seed=0):
+    """
+    Makes up a cohort of patients, with a few features and the dates of three doses. Some
+    doses are dated before the start of the campaign, and some patients have no first
+    (or second) dose but a later one, as in the real data.
+
+    Args:
+        n (int): number of patients
+        seed (int): seed for the random numbers
+
+    Returns:
+        df (Dataframe): one row per patient, with dates as campaign days (NO_DATE if missing)
+    """
+    rng = np.random.default_rng(seed)
+
+    def dates(previous, low, high, missing):
+        days = previous + rng.integers(low, high, n)
+        return np.where(
+            (previous == NO_DATE) | (rng.random(n) < missing), NO_DATE, days
+        ).astype(np.int32)
+
+    # a few first doses are dated before the campaign started, and a few patients have
+    # a second dose with no first dose
+    first = rng.integers(-20, 160, n)
+    first = np.where(rng.random(n) < 0.25, NO_DATE, first).astype(np.int32)
+    second = dates(np.where(first == NO_DATE, 30, first), 21, 90, 0.2)
+    third = dates(second, 60, 200, 0.3)
+
+    return pd.DataFrame(
+        {
+            "patient_id": np.arange(n),
+            # groups 4 and 6 are not of interest, so are counted as "other"
+            "priority_group": rng.choice([1, 2, 3, 4, 5, 6], n),
+            "ageband": pd.Categorical(
+                rng.choice(["16-29", "30-49", "50-69", "70+"], n)
+            ),
+            # a few patients of unknown sex, and a few in a small ethnic group
+            "sex": pd.Categorical(rng.choice(["F", "M", "U"], n, p=[0.49, 0.49, 0.02])),
+            "ethnicity": pd.Categorical(
+                rng.choice(["White", "Asian", "Black", "Other"], n, p=[0.7, 0.2, 0.095, 0.005])
+            ),
+            "dementia": rng.random(n) < 0.1,
+            "covid_vacc_date": first,
+            "covid_vacc_second_dose_date": second,
+            "covid_vacc_third_dose_date": third,
+        }
+    )
+
+
+def as_baseline(df, date_columns=DOSES, flags=FLAGS):
+    """
+    The cohort in the form the data took before: dates as "YYYY-MM-DD" (0 if missing),
+    flags as 0/1 and features as strings.
+
+    Args:
+        df (Dataframe): as returned by make_cohort()
+        date_columns (list): columns of dates (campaign days)
+        flags (list): columns of booleans
+
+    Returns:
+        df (Dataframe): a copy, in the old form
+    """
+    out = df.copy()
+    for column in out.columns:
+        if column in date_columns:
+            out[column] = campaign_dates(out[column].to_numpy(), missing=0)
+        elif column in flags:
+            out[column] = out[column].astype(int)
+        elif isinstance(out[column].dtype, pd.CategoricalDtype):
+            out[column] = out[column].astype(str)
+    return out
+
+
+def with_new_labels(df_dict, flags=FLAGS):
+    """
+    Tables of cumulative sums from the old functions, labelled as they are now: indexed by
+    campaign day, with flags labelled "yes"/"no".
+
+    Args:
+        df_dict (dict): {group: {feature: Dataframe}}, as returned by cumulative_sums()
+        flags (list): features which are flags
+
+    Returns:
+        df_dict (dict): the same tables, relabelled
+    """
+    out = {}
+    for group, tables in df_dict.items():
+        out[group] = {}
+        for feature, table in tables.items():
+            table = table.copy()
+            table.index = pd.Index(
+                [campaign_day(date) for date in table.index],
+                dtype="int64",
+                name=table.index.name,
+            )
+            if feature in flags:
+                # e.g. 1 -> "yes", "0_total" -> "no_total"
+                labels = {"0": "no", "1": "yes"}
+                table.columns = pd.Index(
+                    [
+                        "_".join([labels[level]] + rest)
+                        for level, *rest in (str(c).split("_") for c in table.columns)
+                    ],
+                    name=table.columns.name,
+                )
+            out[group][feature] = table
+    return out
+
+
+def assert_same_cumulative_sums(new, old):
+    """
+    Checks that two sets of cumulative sums, as returned by cumulative_sums(), are the same.
+
+    Args:
+        new (dict): from the functions under test
+        old (dict): from the functions in baseline.py, relabelled by with_new_labels()
+    """
+    assert list(new) == list(old)
+    for group in old:
+        assert list(new[group]) == list(old[group]), group
+        for feature in old[group]:
+            # (the old functions gave some totals as floats, where they filled in missing counts,
+            # and campaign days are int32, which later versions of pandas keep in the index)
+            pd.testing.assert_frame_equal(
+                new[group][feature],
+                old[group][feature],
+                check_dtype=False,
+                check_index_type=False,
+                obj=f"{group}, {feature}",
+            )
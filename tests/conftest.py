@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules under test are imported as the notebooks import them, from lib/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "lib"))
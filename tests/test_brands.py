@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from cohort import as_baseline
+from data_processing import make_conditions, resolve_brands, same_day_counts
+from dates import NO_DATE
+
+ADULT_BRANDS = ["oxford", "pfizer", "moderna"]
+CHILD_BRANDS = ["pfizerC", "pfizerA", "oxford", "moderna"]
+
+
+def make_brand_dates(brands, n=5000, seed=0):
+    """
+    Makes up the dates of three doses, and of each brand, for a cohort of patients. Each
+    brand is recorded on the date of the first or second dose, on some other date, or not
+    at all, so that some brands are recorded on the same day, or before they were available.
+
+    Args:
+        brands (list): e.g. ["oxford", "pfizer", "moderna"]
+        n (int): number of patients
+        seed (int): seed for the random numbers
+
+    Returns:
+        df (Dataframe): one row per patient, with dates as campaign days (NO_DATE if missing)
+    """
+    rng = np.random.default_rng(seed)
+
+    def some_of(*choices, p):
+        return np.choose(rng.choice(len(choices), n, p=p), choices).astype(np.int32)
+
+    anything = rng.integers(-400, 500, n)
+    first = some_of(rng.integers(-30, 500, n), NO_DATE, p=[0.8, 0.2])
+    second = np.where(first == NO_DATE, NO_DATE, first + rng.integers(21, 100, n))
+    second = some_of(second, NO_DATE, p=[0.7, 0.3])
+    third = some_of(rng.integers(200, 500, n), NO_DATE, p=[0.6, 0.4])
+
+    df = pd.DataFrame(
+        {
+            "covid_vacc_date": first,
+            "covid_vacc_second_dose_date": second,
+            "covid_vacc_third_dose_date": third,
+        }
+    )
+    for brand in brands:
+        df[f"covid_vacc_{brand}_date"] = some_of(
+            first, second, anything, NO_DATE, p=[0.35, 0.15, 0.1, 0.4]
+        )
+        df[f"covid_vacc_third_dose_{brand}_date"] = some_of(
+            third, anything, NO_DATE, p=[0.4, 0.1, 0.5]
+        )
+    return df
+
+
+def in_baseline_form(df):
+    return as_baseline(df, date_columns=list(df.columns), flags=[])
+
+
+def test_adult_brands():
+    df = make_brand_dates(ADULT_BRANDS)
+    old = baseline.adult_brands(in_baseline_form(df))
+
+    # as in clean_adult_extract()
+    choices = ["Oxford-AZ", "Pfizer", "Moderna", "Unknown"]
+    brands = resolve_brands(
+        df,
+        dose_list={"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"},
+        vaccine_dates={
+            "covid_vacc_oxford_date": "2020-01-03",
+            "covid_vacc_pfizer_date": "2020-12-07",
+            "covid_vacc_moderna_date": "2021-04-06",
+        },
+        choices=choices,
+    )
+    brands.update(
+        resolve_brands(
+            df,
+            dose_list={"third": None},
+            vaccine_dates={
+                "covid_vacc_third_dose_oxford_date": None,
+                "covid_vacc_third_dose_pfizer_date": None,
+                "covid_vacc_third_dose_moderna_date": None,
+            },
+            choices=choices,
+            field_to_check_for_unknown="covid_vacc_third_dose_oxford_date",
+        )
+    )
+
+    for dose in ["first", "second", "third"]:
+        np.testing.assert_array_equal(brands[dose], old[f"brand_of_{dose}_dose"])
+        # every brand (and no brand) is found for some patients
+        assert set(brands[dose]) == set(choices + ["none"])
+
+
+CHILD_DOSES = [
+    (
+        {"first": "covid_vacc_date", "second": "covid_vacc_second_dose_date"},
+        {
+            "covid_vacc_pfizerC_date": "2021-12-22",
+            "covid_vacc_pfizerA_date": "2021-08-04",
+            "covid_vacc_oxford_date": "2021-08-04",
+            "covid_vacc_moderna_date": "2021-08-04",
+        },
+        None,
+    ),
+    (
+        {"third": None},
+        {
+            "covid_vacc_third_dose_pfizerC_date": None,
+            "covid_vacc_third_dose_pfizerA_date": None,
+            "covid_vacc_third_dose_oxford_date": None,
+            "covid_vacc_third_dose_moderna_date": None,
+        },
+        "covid_vacc_third_dose_pfizerC_date",
+    ),
+]
+
+
+@pytest.mark.parametrize("dose_list, vaccine_dates, unknown_field", CHILD_DOSES)
+def test_child_brands(dose_list, vaccine_dates, unknown_field):
+    df = make_brand_dates(CHILD_BRANDS)
+    old_conditions = baseline.make_conditions(
+        in_baseline_form(df),
+        dose_list=dose_list,
+        vaccine_dates=vaccine_dates,
+        field_to_check_for_unknown=unknown_field,
+    )
+
+    # as in clean_child_extract() (where make_conditions() used to check the date of the
+    # first dose for a second dose of unknown brand)
+    choices = [
+        "Pfizer (10 micrograms)",
+        "Pfizer (30 micrograms)",
+        "Oxford-AZ",
+        "Moderna",
+        "Unknown",
+    ]
+    brands = resolve_brands(
+        df,
+        dose_list=dose_list,
+        vaccine_dates=vaccine_dates,
+        choices=choices,
+        field_to_check_for_unknown=unknown_field or "covid_vacc_date",
+    )
+    conditions = make_conditions(
+        df,
+        dose_list=dose_list,
+        vaccine_dates=vaccine_dates,
+        field_to_check_for_unknown=unknown_field,
+    )
+
+    for dose in dose_list:
+        old = np.select(old_conditions[dose], choices, default="none")
+        np.testing.assert_array_equal(brands[dose], old)
+        np.testing.assert_array_equal(
+            np.select(conditions[dose], choices, default="none"), old
+        )
+        assert set(brands[dose]) == set(choices + ["none"])
+
+
+@pytest.mark.parametrize("n_brands", [1, 2, 4, 7])
+def test_same_day_counts(n_brands):
+    rng = np.random.default_rng(n_brands)
+    # few distinct days, so that many brands are recorded on the same day
+    days = rng.choice([NO_DATE, 10, 11, 12], size=(2000, n_brands)).astype(np.int32)
+
+    # comparing every pair of brands, as the conditions used to
+    expected = (days[:, :, None] == days[:, None, :]).sum(axis=2)
+
+    np.testing.assert_array_equal(same_day_counts(days), expected)
@@ -0,0 +1,86 @@
+import pytest
+
+import baseline
+from cohort import (
+    DOSES,
+    FEATURES_DICT,
+    POPULATION_SUBGROUPS,
+    as_baseline,
+    assert_same_cumulative_sums,
+    make_cohort,
+    with_new_labels,
+)
+from coverage_cube import build_coverage_cube, cube_cumulative_sums
+from dates import campaign_date
+from report_results import cumulative_sums, cumulative_sums_by_dose, group_columns
+
+
+@pytest.fixture(scope="module")
+def df():
+    return make_cohort()
+
+
+def baseline_cumulative_sums(df, latest_date, reference_column_name):
+    return with_new_labels(
+        baseline.cumulative_sums(
+            as_baseline(df),
+            POPULATION_SUBGROUPS,
+            FEATURES_DICT,
+            latest_date=campaign_date(latest_date),
+            reference_column_name=reference_column_name,
+        )
+    )
+
+
+@pytest.mark.parametrize("reference_column_name", DOSES)
+@pytest.mark.parametrize("latest_date", [150, 300])
+def test_cumulative_sums(df, latest_date, reference_column_name):
+    new = cumulative_sums(
+        df,
+        POPULATION_SUBGROUPS,
+        FEATURES_DICT,
+        latest_date,
+        reference_column_name=reference_column_name,
+    )
+    old = baseline_cumulative_sums(df, latest_date, reference_column_name)
+
+    assert_same_cumulative_sums(new, old)
+
+
+def test_cumulative_sums_by_dose(df):
+    groups = group_columns(df, POPULATION_SUBGROUPS)
+    new = cumulative_sums_by_dose(
+        df,
+        POPULATION_SUBGROUPS,
+        FEATURES_DICT,
+        300,
+        reference_column_names=DOSES,
+        groups=groups,
+    )
+
+    for dose in DOSES:
+        assert_same_cumulative_sums(new[dose], baseline_cumulative_sums(df, 300, dose))
+
+
+def test_cumulative_sums_in_workers(df):
+    new = cumulative_sums(df, POPULATION_SUBGROUPS, FEATURES_DICT, 300, n_workers=2)
+
+    assert_same_cumulative_sums(
+        new, baseline_cumulative_sums(df, 300, "covid_vacc_date")
+    )
+
+
+@pytest.mark.parametrize("reference_column_name", DOSES)
+def test_cube_cumulative_sums(df, reference_column_name):
+    cube = build_coverage_cube(df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES)
+    new = cube_cumulative_sums(
+        cube,
+        POPULATION_SUBGROUPS,
+        FEATURES_DICT,
+        300,
+        reference_column_name=reference_column_name,
+    )
+
+    assert_same_cumulative_sums(
+        new, baseline_cumulative_sums(df, 300, reference_column_name)
+    )
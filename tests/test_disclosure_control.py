@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from cohort import FEATURES_DICT, POPULATION_SUBGROUPS, make_cohort
+from coverage_cube import build_coverage_cube, release_coverage_cube
+from disclosure_control import low_counts, round_to_base, suppress_and_round
+
+# counts, including half-way values (e.g. 10.5 is half-way between 7 and 14)
+COUNTS = np.concatenate([np.arange(0, 100), np.arange(3.5, 100, 7)])
+
+
+def test_low_counts_are_suppressed():
+    assert list(suppress_and_round(np.arange(0, 9))) == [0, 0, 0, 0, 0, 0, 0, 7, 7]
+    assert list(low_counts(np.arange(0, 9))) == [False] + [True] * 6 + [False] * 2
+    assert list(suppress_and_round(np.arange(0, 9), threshold=3)) == [0, 0, 0, 0] + [7] * 5
+
+
+def test_same_as_round7():
+    # as the low numbers used to be suppressed and then rounded
+    old = baseline.round7(pd.Series(COUNTS).replace([1, 2, 3, 4, 5, 6], 0))
+
+    np.testing.assert_array_equal(suppress_and_round(COUNTS), old)
+    np.testing.assert_array_equal(
+        round_to_base(COUNTS), baseline.round7(pd.Series(COUNTS))
+    )
+    for count in COUNTS:
+        assert round_to_base(count) == baseline.round7(count)
+
+
+def test_missing_counts_are_zero():
+    counts = np.array([np.nan, 3, 8, np.nan])
+
+    np.testing.assert_array_equal(suppress_and_round(counts), [0, 0, 7, 0])
+    assert suppress_and_round(np.nan) == 0
+
+
+@pytest.mark.parametrize(
+    "counts",
+    [
+        7.0,
+        8,
+        np.array([3, 8, 12]),
+        np.array([[3, 8], [12, np.nan]]),
+        pd.Series([3, 8, 12], index=["a", "b", "c"], name="counts"),
+        pd.DataFrame(
+            {"F": [3, 8], "M": [12, np.nan]}, index=pd.Index([10, 11], name="date")
+        ),
+    ],
+)
+def test_shape_is_kept(counts):
+    out = suppress_and_round(counts)
+
+    if np.ndim(counts) == 0:
+        assert isinstance(out, int)
+    else:
+        assert type(out) is type(counts)
+        assert np.shape(out) == np.shape(counts)
+    if isinstance(counts, (pd.Series, pd.DataFrame)):
+        pd.testing.assert_index_equal(out.index, counts.index)
+        assert getattr(out, "name", None) == getattr(counts, "name", None)
+    if isinstance(counts, pd.DataFrame):
+        pd.testing.assert_index_equal(out.columns, counts.columns)
+
+
+def test_release_coverage_cube():
+    cube = pd.DataFrame(
+        {
+            "dose": "covid_vacc_date",
+            "group": ["80+"] * 4 + ["care home"] * 3,
+            "feature": ["overall", "overall", "sex", "sex", "overall", "sex", "sex"],
+            "patients": [1, 6, 7, 10, 0, 3, 200],
+        }
+    )
+
+    released, audit = release_coverage_cube(cube)
+
+    assert list(released["patients"]) == [0, 0, 7, 7, 0, 0, 203]
+    assert released["patients"].dtype == cube["patients"].dtype
+    pd.testing.assert_frame_equal(
+        released.drop(columns="patients"), cube.drop(columns="patients")
+    )
+    # cells with no patients are not counted as suppressed
+    pd.testing.assert_frame_equal(
+        audit,
+        pd.DataFrame(
+            {
+                "dose": "covid_vacc_date",
+                "group": ["80+", "80+", "care home", "care home"],
+                "feature": ["overall", "sex", "overall", "sex"],
+                "cells": [2, 2, 1, 2],
+                "suppressed": [2, 0, 0, 1],
+            }
+        ),
+        check_dtype=False,
+    )
+
+
+def test_release_built_cube():
+    cube = build_coverage_cube(make_cohort(), POPULATION_SUBGROUPS, FEATURES_DICT)
+
+    released, audit = release_coverage_cube(cube)
+
+    np.testing.assert_array_equal(
+        released["patients"], suppress_and_round(cube["patients"].to_numpy())
+    )
+    assert audit["cells"].sum() == len(cube)
+    assert audit["suppressed"].sum() == low_counts(cube["patients"]).sum()
+    assert len(audit) == len(cube[["dose", "group", "feature"]].drop_duplicates())
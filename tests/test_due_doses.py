@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+import baseline
+from cohort import (
+    DOSES,
+    FEATURES_DICT,
+    POPULATION_SUBGROUPS,
+    as_baseline,
+    assert_same_cumulative_sums,
+    make_cohort,
+    with_new_labels,
+)
+from coverage_cube import build_coverage_cube, cube_cumulative_sums_as_of
+from dates import NO_DATE, campaign_date, campaign_day, delay_in_days
+from disclosure_control import suppress_and_round
+from report_results import due_doses_by_delay, given_dose_cumulative_sums
+
+LATEST_DATE = 300
+
+# (dose, previous dose, previous doses dated on or before this are not counted)
+DUE_DOSES = [
+    ("covid_vacc_second_dose_date", "covid_vacc_date", "2020-12-07"),
+    ("covid_vacc_third_dose_date", "covid_vacc_second_dose_date", "2020-12-21"),
+]
+
+DELAYS = ["8 weeks", "14 weeks", "20 weeks", "26 weeks", "200 days"]
+
+
+@pytest.fixture(scope="module")
+def df():
+    return make_cohort()
+
+
+@pytest.fixture(scope="module")
+def cube(df):
+    return build_coverage_cube(df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES)
+
+
+def baseline_cumulative_sums(df, latest_date, reference_column_name):
+    return with_new_labels(
+        baseline.cumulative_sums(
+            df,
+            POPULATION_SUBGROUPS,
+            FEATURES_DICT,
+            latest_date=campaign_date(latest_date),
+            reference_column_name=reference_column_name,
+        )
+    )
+
+
+def baseline_given(df, dose, previous_dose, due_date, counted_after):
+    df_s = baseline.given_when_due(
+        as_baseline(df), dose, previous_dose, campaign_date(due_date), counted_after
+    )
+    return baseline_cumulative_sums(df_s, LATEST_DATE, dose)
+
+
+def baseline_due(df, previous_dose, due_date, counted_after):
+    df_due = baseline.previous_when_due(as_baseline(df), previous_dose, counted_after)
+    return baseline_cumulative_sums(df_due, due_date, previous_dose)
+
+
+@pytest.mark.parametrize("dose, previous_dose, counted_after", DUE_DOSES)
+def test_given_dose_cumulative_sums(df, dose, previous_dose, counted_after):
+    due_date = LATEST_DATE - delay_in_days("14 weeks")
+    new = given_dose_cumulative_sums(
+        df,
+        POPULATION_SUBGROUPS,
+        FEATURES_DICT,
+        LATEST_DATE,
+        dose=dose,
+        previous_dose=previous_dose,
+        due_date=due_date,
+        counted_after=counted_after,
+    )
+
+    assert_same_cumulative_sums(
+        new, baseline_given(df, dose, previous_dose, due_date, counted_after)
+    )
+
+
+@pytest.mark.parametrize("dose, previous_dose, counted_after", DUE_DOSES)
+def test_due_from_cube(df, cube, dose, previous_dose, counted_after):
+    due_dates = [LATEST_DATE - delay_in_days(delay) for delay in DELAYS]
+    new = cube_cumulative_sums_as_of(
+        cube,
+        POPULATION_SUBGROUPS,
+        FEATURES_DICT,
+        dates=due_dates,
+        reference_column_name=previous_dose,
+        counted_after=counted_after,
+    )
+
+    for due_date in due_dates:
+        assert_same_cumulative_sums(
+            new[due_date], baseline_due(df, previous_dose, due_date, counted_after)
+        )
+
+
+@pytest.mark.parametrize("dose, previous_dose, counted_after", DUE_DOSES)
+def test_due_doses_by_delay(df, dose, previous_dose, counted_after):
+    new = due_doses_by_delay(
+        df,
+        POPULATION_SUBGROUPS,
+        LATEST_DATE,
+        dose=dose,
+        previous_dose=previous_dose,
+        delays=DELAYS,
+        counted_after=counted_after,
+    )
+
+    other = baseline.filtering(POPULATION_SUBGROUPS)
+    group = np.where(df["priority_group"].isin(other), 0, df["priority_group"])
+    previous = df[previous_dose].to_numpy()
+    given = (df[dose] != NO_DATE) & (df[dose] <= LATEST_DATE)
+
+    # some patients' previous doses are on a due date, so are not yet due
+    due_dates = [LATEST_DATE - delay_in_days(delay) for delay in DELAYS]
+    assert np.isin(previous, due_dates).any()
+
+    for delay, due_date in zip(DELAYS, due_dates):
+        # the dose is due for patients whose previous dose was before the due date, as
+        # for the doses given (the previous doses used to be counted up to the due date)
+        old_due = baseline_due(df, previous_dose, due_date - 1, counted_after)
+        old_given = baseline_given(df, dose, previous_dose, due_date, counted_after)
+        for name, number in POPULATION_SUBGROUPS.items():
+            row = new.loc[(name, delay)]
+            assert row["due date"] == campaign_date(due_date)
+            assert row["due"] == old_due[name]["overall"]["overall"].iloc[-1]
+            assert row["given"] == old_given[name]["overall"]["overall"].iloc[-1]
+
+            # overdue, from the numbers counted (not the rounded numbers due and given)
+            due = (
+                (group == number)
+                & (previous > campaign_day(counted_after))
+                & (previous < due_date)
+            )
+            assert row["overdue"] == suppress_and_round(int((due & ~given).sum()))
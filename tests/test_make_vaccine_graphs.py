@@ -0,0 +1,39 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import os
+
+import pandas as pd
+import pytest
+
+from cohort import make_cohort
+from dates import campaign_date, campaign_day
+from report_results import make_vaccine_graphs
+
+# a Wednesday, some time after the last first dose in the cohort
+LATEST_DATE = "2021-06-16"
+
+
+@pytest.mark.parametrize("grain", ["day", "week", "month"])
+def test_figures_run_to_the_latest_date(tmp_path, grain):
+    df = make_cohort(n=500)
+    df["group_name"] = df["ageband"]
+
+    make_vaccine_graphs(
+        df,
+        latest_date=LATEST_DATE,
+        savepath={"figures": str(tmp_path)},
+        savepath_figure_csvs=str(tmp_path),
+        grain=grain,
+    )
+
+    (csv,) = [f for f in os.listdir(tmp_path) if f.endswith(".csv")]
+    figures = pd.read_csv(tmp_path / csv, index_col=0)
+    last_vaccinated = campaign_date(df["covid_vacc_date"].max(), "%Y %d %b")
+    if grain == "day":
+        # the daily figures end on the last date on which anyone was vaccinated
+        assert figures.index[-1] == last_vaccinated
+    else:
+        # the last week (or month) is still in progress on the latest date
+        assert figures.index[-1] == campaign_date(campaign_day(LATEST_DATE), "%Y %d %b")
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from projections import uptake_projections
+
+# percentages vaccinated, on the days on which anyone was vaccinated
+TABLES = {
+    "80+": pd.DataFrame({"overall": [10.0, 50.0, 60.0]}, index=[100, 113, 120]),
+    "70-79": pd.DataFrame({"overall": [20.0, 30.0]}, index=[105, 120]),
+}
+
+
+def test_uptake_projections():
+    out = uptake_projections(TABLES, 120)
+
+    assert list(out["previous"]) == [50.0, 20.0]
+    assert list(out["uptake"]) == [10.0, 10.0]
+    assert list(out["growth (%)"]) == [20.0, 50.0]
+    # 30 more at 10 a week is 3 weeks after day 120 (2021-04-07); 60 more is 6 weeks after
+    assert list(out["reach 90%"]) == ["28-Apr", "19-May"]
+
+
+def test_nothing_projected_before_the_first_figures():
+    # (the latest date is before every table's first day)
+    out = uptake_projections(TABLES, 50)
+
+    assert list(out["uptake"]) == [0.0, 0.0]
+    assert list(out["reach 90%"]) == ["unknown", "unknown"]
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohort import DOSES, FEATURES_DICT, POPULATION_SUBGROUPS, make_cohort
+from coverage_cube import (
+    _merge_levels,
+    build_coverage_cube,
+    cube_cumulative_sums,
+    refresh_coverage_cube,
+)
+from dates import NO_DATE
+from report_results import cumulative_sums
+
+# the day on which the earlier extract was taken
+EXTRACT_DAY = 120
+
+
+@pytest.fixture(scope="module")
+def df():
+    return make_cohort()
+
+
+def earlier_extract(df, day=EXTRACT_DAY):
+    """
+    The data as they would have been extracted on an earlier day: doses given since then
+    have not been recorded yet.
+    """
+    out = df.copy()
+    for dose in DOSES:
+        out[dose] = np.where(out[dose] > day, NO_DATE, out[dose]).astype(np.int32)
+    return out
+
+
+def cube_counts(cube):
+    """
+    The number of patients in each cell of a cube, whatever order the rows are in, and the
+    order of the levels of each feature.
+    """
+    labels = {c: cube[c].astype(str) for c in ["dose", "group", "feature", "level"]}
+    cube = cube.assign(**labels)
+    counts = cube.groupby(
+        ["dose", "group", "feature", "level", "known_sex", "date"]
+    )["patients"].sum()
+    orders = (
+        cube.drop_duplicates(["feature", "level"])
+        .set_index(["feature", "level"])["level_order"]
+        .sort_index()
+    )
+    return counts[counts > 0], orders
+
+
+def assert_same_cube(cube, other):
+    counts, orders = cube_counts(cube)
+    other_counts, other_orders = cube_counts(other)
+    pd.testing.assert_series_equal(counts, other_counts)
+    pd.testing.assert_series_equal(orders, other_orders, check_dtype=False)
+
+
+def test_refresh_gives_the_same_cube_as_a_full_build(df):
+    cube = build_coverage_cube(
+        earlier_extract(df), POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES
+    )
+
+    refreshed, drift = refresh_coverage_cube(
+        cube, df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES
+    )
+
+    assert len(drift) == 0
+    assert_same_cube(
+        refreshed,
+        build_coverage_cube(df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES),
+    )
+    for dose in DOSES:
+        new = cube_cumulative_sums(
+            refreshed,
+            POPULATION_SUBGROUPS,
+            FEATURES_DICT,
+            300,
+            reference_column_name=dose,
+        )
+        old = cumulative_sums(
+            df, POPULATION_SUBGROUPS, FEATURES_DICT, 300, reference_column_name=dose
+        )
+        for group in old:
+            for feature in old[group]:
+                pd.testing.assert_frame_equal(new[group][feature], old[group][feature])
+
+
+def test_new_levels_fit_into_the_order(df):
+    # patients of a new ethnic group join after the earlier extract, and are vaccinated
+    # after it (or not at all)
+    recorded = (df[DOSES] != NO_DATE) & (df[DOSES] <= EXTRACT_DAY)
+    joined = (df["patient_id"] % 10 == 0) & ~recorded.any(axis=1)
+    ethnicity = df["ethnicity"].astype(str).where(~joined, "Mixed")
+    df = df.assign(ethnicity=pd.Categorical(ethnicity))
+    earlier = earlier_extract(df.loc[~joined])
+    earlier["ethnicity"] = earlier["ethnicity"].cat.remove_unused_categories()
+
+    cube = build_coverage_cube(earlier, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES)
+    assert "Mixed" not in set(cube["level"].astype(str))
+
+    refreshed, drift = refresh_coverage_cube(
+        cube, df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES
+    )
+
+    assert len(drift) == 0
+    # "Mixed" comes between "Black" and "Other"
+    levels = (
+        refreshed.loc[refreshed["feature"] == "ethnicity"]
+        .drop_duplicates("level")
+        .sort_values("level_order")["level"]
+        .astype(str)
+        .tolist()
+    )
+    assert levels == ["Asian", "Black", "Mixed", "Other", "White"]
+    assert_same_cube(
+        refreshed,
+        build_coverage_cube(df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES),
+    )
+
+
+def test_changed_history_is_rebuilt(df):
+    cube = build_coverage_cube(
+        earlier_extract(df), POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES
+    )
+    # ethnicity is filled in, in the new extract, for some patients vaccinated long ago
+    early = df.index[(df["covid_vacc_date"] != NO_DATE) & (df["covid_vacc_date"] < 20)]
+    df = df.copy()
+    df.loc[early[:30], "ethnicity"] = "Asian"
+
+    refreshed, drift = refresh_coverage_cube(
+        cube, df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES
+    )
+
+    assert len(drift) > 0
+    assert set(drift["feature"]) == {"ethnicity"}
+    assert (drift["cube"] != drift["data"]).all()
+    assert_same_cube(
+        refreshed,
+        build_coverage_cube(df, POPULATION_SUBGROUPS, FEATURES_DICT, doses=DOSES),
+    )
+
+
+def test_merge_levels():
+    assert _merge_levels([], ["a", "b"]) == ["a", "b"]
+    assert _merge_levels(["a", "c"], ["a", "b", "c"]) == ["a", "b", "c"]
+    assert _merge_levels(["a", "b", "c"], ["b", "x", "c", "y"]) == [
+        "a",
+        "b",
+        "x",
+        "c",
+        "y",
+    ]
+    assert _merge_levels(["b", "c"], ["a", "b"]) == ["a", "b", "c"]